@@ -1,11 +1,25 @@
 import asyncio
+import heapq
+import json
 from aiohttp import web
 import discord
 from bot.logger import get_logger
-from bot.config import API_SERVER_KEY
+from bot.config import (
+    API_SERVER_KEY,
+    API_BATCH_MAX_USERS,
+    API_FETCH_CONCURRENCY,
+    API_STREAM_HEARTBEAT_SECONDS,
+    API_ROSTER_PAGE_SIZE
+)
+from bot.role_feed import role_feed
+from bot.role_index import role_index
+from bot.role_versions import ResponseCache, member_etag
 
 logger = get_logger('api')
 
+# Число строк NDJSON в одной записи в сокет
+ROSTER_CHUNK_SIZE = 500
+
 
 class APIServer:
     def __init__(self, bot: discord.Client, host: str = '0.0.0.0', port: int = 8080):
@@ -14,6 +28,9 @@ class APIServer:
         self.port = port
         self.app = web.Application()
         self.runner = None
+        self.roles_cache = ResponseCache()
+        self.role_feed = role_feed
+        self._streams = set()  # задачи открытых SSE соединений, отменяются в stop()
         self._setup_routes()
 
     def _check_api_key(self, request: web.Request) -> bool:
@@ -32,9 +49,78 @@ class APIServer:
 
         return api_key == API_SERVER_KEY
 
+    @staticmethod
+    def _etag_matches(request: web.Request, etag: str) -> bool:
+        """Проверка заголовка If-None-Match"""
+        header = request.headers.get('If-None-Match')
+        if not header:
+            return False
+        candidates = [value.strip() for value in header.split(',')]
+        return '*' in candidates or any(c.removeprefix('W/') == etag for c in candidates)
+
+    @staticmethod
+    def _serialize_roles(member: discord.Member) -> list:
+        """Роли участника (без @everyone), от высшей к низшей"""
+        roles = []
+        for role in member.roles:
+            # Пропускаем @everyone роль если нужно
+            if role.is_default():
+                continue
+
+            roles.append({
+                'id': str(role.id),
+                'name': role.name,
+                'color': str(role.color),
+                'position': role.position,
+                'permissions': str(role.permissions.value),
+                'mentionable': role.mentionable,
+                'hoist': role.hoist
+            })
+
+        # Сортируем роли по позиции (от высшей к низшей)
+        roles.sort(key=lambda x: x['position'], reverse=True)
+        return roles
+
+    @staticmethod
+    def _serialize_user(member: discord.Member) -> dict:
+        return {
+            'id': str(member.id),
+            'username': member.name,
+            'discriminator': member.discriminator,
+            'nick': member.nick,
+            'display_name': member.display_name,
+            'avatar_url': str(member.display_avatar.url) if member.display_avatar else None
+        }
+
+    @staticmethod
+    def _serialize_roster_entry(member: discord.Member) -> dict:
+        """Компактная запись ростера: только ID ролей, без их описаний"""
+        return {
+            'id': str(member.id),
+            'username': member.name,
+            'display_name': member.display_name,
+            'nick': member.nick,
+            'role_ids': [str(role.id) for role in member.roles if not role.is_default()]
+        }
+
+    def _roles_payload(self, guild: discord.Guild, member: discord.Member) -> dict:
+        return {
+            'success': True,
+            'roles': self._serialize_roles(member),
+            'user': self._serialize_user(member),
+            'guild': {
+                'id': str(guild.id),
+                'name': guild.name
+            }
+        }
+
     def _setup_routes(self):
         """Настройка маршрутов API"""
         self.app.router.add_post('/api/roles', self.get_roles)
+        self.app.router.add_post('/api/roles/batch', self.get_roles_batch)
+        self.app.router.add_get('/api/roles/stream', self.stream_role_changes)
+        self.app.router.add_get('/api/roster', self.export_roster)
+        self.app.router.add_get('/api/metrics/db', self.get_db_metrics)
 
     async def get_roles(self, request: web.Request):
         """
@@ -120,66 +206,418 @@ class APIServer:
 
             # Получаем member
             member = guild.get_member(user_id)
-            if not member:
-                # Пробуем fetch если не в кеше
+            if member:
+                # Участник из кеша: версия набора ролей известна, отвечаем по ETag / из кеша ответов
+                etag = member_etag(guild.id, member.id)
+                if self._etag_matches(request, etag):
+                    return web.Response(status=304, headers={'ETag': etag})
+
+                body = self.roles_cache.get(etag)
+                if body is None:
+                    body = json.dumps(self._roles_payload(guild, member)).encode('utf-8')
+                    self.roles_cache.put(etag, body)
+                return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+            # Пробуем fetch если не в кеше
+            try:
+                member = await guild.fetch_member(user_id)
+            except discord.NotFound:
+                return web.json_response({
+                    'success': False,
+                    'error': f'Member with id {user_id} not found in guild {guild_id}'
+                }, status=404)
+            except discord.HTTPException as e:
+                logger.error(f"Error fetching member: {e}")
+                return web.json_response({
+                    'success': False,
+                    'error': f'Failed to fetch member: {str(e)}'
+                }, status=500)
+
+            return web.json_response(self._roles_payload(guild, member))
+
+        except Exception as e:
+            logger.error(f"Unexpected error in get_roles: {e}", exc_info=True)
+            return web.json_response({
+                'success': False,
+                'error': f'Internal server error: {str(e)}'
+            }, status=500)
+
+    async def get_roles_batch(self, request: web.Request):
+        """
+        Получить роли сразу для многих пользователей
+
+        Method: POST
+        Headers:
+        - X-API-Key: API ключ (или Authorization: Bearer <key>)
+
+        Body (JSON):
+        {
+            "guild_id": "123456789",
+            "user_ids": ["987654321", "123123123", ...]
+        }
+
+        Ответ (ошибки по отдельным пользователям не ломают весь запрос):
+        {
+            "success": true,
+            "guild": {"id": "123456789", "name": "LSPD"},
+            "results": {
+                "987654321": {"roles": [...], "user": {...}},
+                ...
+            },
+            "errors": {
+                "123123123": "Member not found"
+            }
+        }
+        """
+        try:
+            if not self._check_api_key(request):
+                logger.warning(f"Unauthorized API request from {request.remote}")
+                return web.json_response({
+                    'success': False,
+                    'error': 'Invalid or missing API key'
+                }, status=401)
+
+            try:
+                data = await request.json()
+            except Exception:
+                return web.json_response({
+                    'success': False,
+                    'error': 'Invalid JSON body'
+                }, status=400)
+
+            guild_id = data.get('guild_id')
+            user_ids = data.get('user_ids')
+
+            if not guild_id:
+                return web.json_response({
+                    'success': False,
+                    'error': 'guild_id is required in request body'
+                }, status=400)
+
+            if not isinstance(user_ids, list) or not user_ids:
+                return web.json_response({
+                    'success': False,
+                    'error': 'user_ids must be a non-empty list'
+                }, status=400)
+
+            if len(user_ids) > API_BATCH_MAX_USERS:
+                return web.json_response({
+                    'success': False,
+                    'error': f'Too many user_ids (max {API_BATCH_MAX_USERS})'
+                }, status=400)
+
+            try:
+                guild_id = int(guild_id)
+            except (ValueError, TypeError):
+                return web.json_response({
+                    'success': False,
+                    'error': 'guild_id must be a valid integer or integer string'
+                }, status=400)
+
+            guild = self.bot.get_guild(guild_id)
+            if not guild:
+                return web.json_response({
+                    'success': False,
+                    'error': f'Guild with id {guild_id} not found'
+                }, status=404)
+
+            results = {}
+            errors = {}
+            misses = []
+
+            # Сначала отвечаем из кеша участников
+            for raw_id in user_ids:
+                key = str(raw_id)
                 try:
-                    member = await guild.fetch_member(user_id)
-                except discord.NotFound:
-                    return web.json_response({
-                        'success': False,
-                        'error': f'Member with id {user_id} not found in guild {guild_id}'
-                    }, status=404)
-                except discord.HTTPException as e:
-                    logger.error(f"Error fetching member: {e}")
-                    return web.json_response({
-                        'success': False,
-                        'error': f'Failed to fetch member: {str(e)}'
-                    }, status=500)
-
-            # Формируем список ролей
-            roles = []
-            for role in member.roles:
-                # Пропускаем @everyone роль если нужно
-                if role.is_default():
+                    user_id = int(raw_id)
+                except (ValueError, TypeError):
+                    errors[key] = 'Invalid user id'
                     continue
 
-                roles.append({
-                    'id': str(role.id),
-                    'name': role.name,
-                    'color': str(role.color),
-                    'position': role.position,
-                    'permissions': str(role.permissions.value),
-                    'mentionable': role.mentionable,
-                    'hoist': role.hoist
-                })
+                member = guild.get_member(user_id)
+                if member:
+                    results[key] = {
+                        'roles': self._serialize_roles(member),
+                        'user': self._serialize_user(member)
+                    }
+                else:
+                    misses.append((key, user_id))
+
+            # Промахи кеша - ограниченное число параллельных запросов к Discord
+            semaphore = asyncio.Semaphore(API_FETCH_CONCURRENCY)
+
+            async def fetch_one(key, user_id):
+                async with semaphore:
+                    try:
+                        member = await guild.fetch_member(user_id)
+                    except discord.NotFound:
+                        errors[key] = 'Member not found'
+                        return
+                    except discord.HTTPException as e:
+                        logger.error(f"Error fetching member {user_id}: {e}")
+                        errors[key] = f'Failed to fetch member: {str(e)}'
+                        return
+                results[key] = {
+                    'roles': self._serialize_roles(member),
+                    'user': self._serialize_user(member)
+                }
 
-            # Сортируем роли по позиции (от высшей к низшей)
-            roles.sort(key=lambda x: x['position'], reverse=True)
+            if misses:
+                await asyncio.gather(*(fetch_one(key, user_id) for key, user_id in misses))
 
             return web.json_response({
                 'success': True,
-                'roles': roles,
-                'user': {
-                    'id': str(member.id),
-                    'username': member.name,
-                    'discriminator': member.discriminator,
-                    'nick': member.nick,
-                    'display_name': member.display_name,
-                    'avatar_url': str(member.display_avatar.url) if member.display_avatar else None
-                },
                 'guild': {
                     'id': str(guild.id),
                     'name': guild.name
-                }
+                },
+                'results': results,
+                'errors': errors
             })
 
         except Exception as e:
-            logger.error(f"Unexpected error in get_roles: {e}", exc_info=True)
+            logger.error(f"Unexpected error in get_roles_batch: {e}", exc_info=True)
             return web.json_response({
                 'success': False,
                 'error': f'Internal server error: {str(e)}'
             }, status=500)
 
+    async def stream_role_changes(self, request: web.Request):
+        """
+        Поток изменений ролей участников (Server-Sent Events)
+
+        Method: GET
+        Headers:
+        - X-API-Key: API ключ (или Authorization: Bearer <key>)
+        - Last-Event-ID: id последнего полученного события (необязательно)
+
+        Query:
+        - guild_id: только события этого сервера (необязательно)
+        - since: то же, что Last-Event-ID, для клиентов без поддержки заголовка
+
+        События:
+        id: <stream>:<seq>
+        event: role_change
+        data: {"seq": 1, "guild_id": "...", "user_id": "...", "added": [...], "removed": [...], "roles": [...]}
+
+        event: reset - часть событий пропущена (буфер переполнен или бот перезапущен),
+        актуальные роли нужно перечитать через /api/roles/batch
+        """
+        if not self._check_api_key(request):
+            logger.warning(f"Unauthorized API request from {request.remote}")
+            return web.json_response({
+                'success': False,
+                'error': 'Invalid or missing API key'
+            }, status=401)
+
+        guild_filter = request.query.get('guild_id')
+        cursor = request.headers.get('Last-Event-ID') or request.query.get('since')
+        feed = self.role_feed
+        seq, reset = feed.parse_cursor(cursor)
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        await response.prepare(request)
+
+        async def send(event: str, data: dict, event_id: str = None):
+            message = f"id: {event_id}\n" if event_id else ""
+            message += f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            await response.write(message.encode('utf-8'))
+
+        task = asyncio.current_task()
+        self._streams.add(task)
+        try:
+            # Интервал повторного подключения для EventSource
+            await response.write(f"retry: {int(API_STREAM_HEARTBEAT_SECONDS * 1000)}\n\n".encode('utf-8'))
+            if reset:
+                await send('reset', {'seq': feed.seq}, feed.event_id(seq))
+
+            while True:
+                events, gap = feed.read_after(seq)
+                if gap:
+                    await send('reset', {'seq': feed.seq}, feed.event_id(seq))
+                for event in events:
+                    seq = event['seq']
+                    if guild_filter and event['guild_id'] != guild_filter:
+                        continue
+                    await send('role_change', event, feed.event_id(seq))
+
+                if not await feed.wait(seq, API_STREAM_HEARTBEAT_SECONDS):
+                    await response.write(b": keep-alive\n\n")
+        except ConnectionResetError:
+            # Клиент отключился
+            pass
+        finally:
+            self._streams.discard(task)
+        return response
+
+    async def export_roster(self, request: web.Request):
+        """
+        Выгрузка ростера сервера (участники и ID их ролей)
+
+        Method: GET
+        Headers:
+        - X-API-Key: API ключ (или Authorization: Bearer <key>)
+
+        Query:
+        - guild_id: ID сервера (обязательно)
+        - role_id: только участники с этой ролью (необязательно)
+        - format: ndjson (по умолчанию) или json
+
+        format=ndjson - весь ростер потоком, по одному JSON объекту на строку:
+        {"id": "...", "username": "...", "display_name": "...", "nick": null, "role_ids": ["..."]}
+
+        format=json - постранично, участники упорядочены по ID:
+        - cursor: next_cursor из предыдущей страницы
+        - limit: размер страницы (по умолчанию и максимум API_ROSTER_PAGE_SIZE)
+        Ответ: {"success": true, "members": [...], "next_cursor": "..." | null}
+        """
+        try:
+            if not self._check_api_key(request):
+                logger.warning(f"Unauthorized API request from {request.remote}")
+                return web.json_response({
+                    'success': False,
+                    'error': 'Invalid or missing API key'
+                }, status=401)
+
+            output_format = request.query.get('format', 'ndjson')
+            if output_format not in ('ndjson', 'json'):
+                return web.json_response({
+                    'success': False,
+                    'error': 'format must be ndjson or json'
+                }, status=400)
+
+            try:
+                guild_id = int(request.query['guild_id'])
+                role_id = int(request.query['role_id']) if request.query.get('role_id') else None
+                cursor = int(request.query['cursor']) if request.query.get('cursor') else 0
+                limit = min(int(request.query.get('limit', API_ROSTER_PAGE_SIZE)), API_ROSTER_PAGE_SIZE)
+            except KeyError:
+                return web.json_response({
+                    'success': False,
+                    'error': 'guild_id is required'
+                }, status=400)
+            except ValueError:
+                return web.json_response({
+                    'success': False,
+                    'error': 'guild_id, role_id, cursor and limit must be valid integers'
+                }, status=400)
+
+            if limit < 1:
+                return web.json_response({
+                    'success': False,
+                    'error': 'limit must be positive'
+                }, status=400)
+
+            guild = self.bot.get_guild(guild_id)
+            if not guild:
+                return web.json_response({
+                    'success': False,
+                    'error': f'Guild with id {guild_id} not found'
+                }, status=404)
+
+            if role_id is not None and guild.get_role(role_id) is None:
+                return web.json_response({
+                    'success': False,
+                    'error': f'Role with id {role_id} not found in guild {guild_id}'
+                }, status=404)
+
+            if role_id is None:
+                members = iter(guild.members)
+            elif role_index.is_ready(guild.id):
+                # Участники с ролью берутся из обратного индекса, без перебора всего сервера
+                members = (
+                    member for member in map(guild.get_member, role_index.member_ids(guild.id, role_id))
+                    if member is not None
+                )
+            else:
+                members = (member for member in guild.members if member.get_role(role_id) is not None)
+
+            if output_format == 'json':
+                # Без полной сортировки: выбираем limit + 1 наименьших ID после курсора
+                page = heapq.nsmallest(
+                    limit + 1,
+                    (member for member in members if member.id > cursor),
+                    key=lambda member: member.id
+                )
+                has_more = len(page) > limit
+                page = page[:limit]
+                return web.json_response({
+                    'success': True,
+                    'members': [self._serialize_roster_entry(member) for member in page],
+                    'next_cursor': str(page[-1].id) if has_more else None
+                })
+
+        except Exception as e:
+            logger.error(f"Unexpected error in export_roster: {e}", exc_info=True)
+            return web.json_response({
+                'success': False,
+                'error': f'Internal server error: {str(e)}'
+            }, status=500)
+
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+
+        # Записываем порциями, чтобы не держать весь ростер в памяти и не делать write на каждую строку
+        chunk = []
+        try:
+            for member in members:
+                chunk.append(json.dumps(self._serialize_roster_entry(member)))
+                if len(chunk) >= ROSTER_CHUNK_SIZE:
+                    await response.write(("\n".join(chunk) + "\n").encode('utf-8'))
+                    chunk = []
+            if chunk:
+                await response.write(("\n".join(chunk) + "\n").encode('utf-8'))
+            await response.write_eof()
+        except ConnectionResetError:
+            # Клиент отключился
+            pass
+        finally:
+            self._streams.discard(task)
+        return response
+
+    async def get_db_metrics(self, request: web.Request):
+        """
+        Метрики пула соединений с БД
+
+        Method: GET
+        Headers:
+        - X-API-Key: API ключ (или Authorization: Bearer <key>)
+
+        Ответ:
+        {
+            "success": true,
+            "metrics": {
+                "in_use": 1,
+                "peak_in_use": 4,
+                "acquire_wait": {"count": 120, "avg_ms": 0.2, "max_ms": 3.1, "buckets": {...}},
+                "statements": [{"query": "SELECT ...", "count": 40, "avg_ms": 1.5, ...}, ...],
+                "pool": {"size": 4, "idle": 3, "min_size": 2, "max_size": 10}
+            }
+        }
+        """
+        if not self._check_api_key(request):
+            logger.warning(f"Unauthorized API request from {request.remote}")
+            return web.json_response({
+                'success': False,
+                'error': 'Invalid or missing API key'
+            }, status=401)
+
+        metrics = getattr(self.bot.db_pool, 'metrics', None)
+        if metrics is None:
+            return web.json_response({
+                'success': False,
+                'error': 'Database metrics are not available'
+            }, status=503)
+
+        return web.json_response({
+            'success': True,
+            'metrics': metrics.snapshot(self.bot.db_pool)
+        })
+
     async def start(self):
         """Запуск API сервера"""
         try:
@@ -194,6 +632,9 @@ class APIServer:
 
     async def stop(self):
         """Остановка API сервера"""
+        # Бесконечные SSE обработчики иначе задерживают cleanup до таймаута
+        for task in list(self._streams):
+            task.cancel()
         if self.runner:
             await self.runner.cleanup()
             logger.info("API сервер остановлен")
@@ -22,6 +22,7 @@ from bot.database import setup_db
 from bot.logger import get_logger
 from bot.api import APIServer
 from events.on_error import setup_on_error
+from events.on_guild_update import setup_on_guild_update
 from events.on_member_update import setup_on_member_update
 from events.on_ready import setup_on_ready
 
@@ -69,6 +70,7 @@ async def main():
     await setup_on_ready(bot, ADM_ROLES_CH, CL_REQUEST_CH)
     await setup_on_error(bot)
     await setup_on_member_update(bot)
+    await setup_on_guild_update(bot)
 
     logger.info("Загружаем коги...")
     await load_extensions()
@@ -19,6 +19,12 @@ PRESET_ADMIN_ROLE_ID = os.getenv("PRESET_ADMIN_ROLE_ID")
 
 # ============ DATABASE ============
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+DB_MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))
+DB_QUERY_METRICS = os.getenv("DB_QUERY_METRICS", "true").lower() == "true"
 
 # ============ DISCORD ROLES ============
 BASE_LSPD_ROLE_ID = int(os.getenv("BASE_LSPD_ROLE_ID", "1350364976682106982"))
@@ -27,18 +33,25 @@ INTERN_ROLE_NAME = os.getenv("INTERN_ROLE_NAME", "Police Officer I")
 
 # ============ GOOGLE SHEETS ============
 GOOGLE_SHEET_NAME = os.getenv("GOOGLE_SHEET_NAME")
+GOOGLE_SHEET_KEY = os.getenv("GOOGLE_SHEET_KEY", "")
 GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "credentials.json")
 GSHEET_WORKSHEET_NAME = os.getenv("GSHEET_WORKSHEET_NAME", "Таблица состава")
 GSHEET_USERNAME_COLUMN = int(os.getenv("GSHEET_USERNAME_COLUMN", "20"))
 GSHEET_UPDATE_COLUMN = int(os.getenv("GSHEET_UPDATE_COLUMN", "13"))
 GSHEET_UPDATE_TIMES = [int(x) for x in os.getenv("GSHEET_UPDATE_TIMES", "6,12,18,23").split(",")]
+GSHEET_INDEX_TTL_MINUTES = int(os.getenv("GSHEET_INDEX_TTL_MINUTES", "30"))
+GSHEET_DEBOUNCE_SECONDS = float(os.getenv("GSHEET_DEBOUNCE_SECONDS", "5"))
+GSHEET_MAX_WAIT_SECONDS = float(os.getenv("GSHEET_MAX_WAIT_SECONDS", "30"))
 
 # ============ TIMERS ============
 FTO_QUEUE_CLEANUP_HOURS = int(os.getenv("FTO_QUEUE_CLEANUP_HOURS", "3"))
-FTO_QUEUE_CHECK_MINUTES = int(os.getenv("FTO_QUEUE_CHECK_MINUTES", "1"))
+FTO_BOARD_EDIT_INTERVAL = float(os.getenv("FTO_BOARD_EDIT_INTERVAL", "2"))
+FTO_MATCH_WINDOW_SECONDS = float(os.getenv("FTO_MATCH_WINDOW_SECONDS", "0"))
+
+# ============ STARTUP ============
+RESTORE_VIEWS_CONCURRENCY = int(os.getenv("RESTORE_VIEWS_CONCURRENCY", "10"))
 
 # ============ REMINDERS ============
-REMINDER_CHECK_MINUTES = int(os.getenv("REMINDER_CHECK_MINUTES", "5"))
 REMINDER_FIRST_HOURS = int(os.getenv("REMINDER_FIRST_HOURS", "2"))
 REMINDER_SECOND_HOURS = int(os.getenv("REMINDER_SECOND_HOURS", "6"))
 
@@ -62,6 +75,12 @@ ENABLE_API_SERVER = os.getenv("ENABLE_API_SERVER", "true").lower() == "true"
 API_SERVER_HOST = os.getenv("API_SERVER_HOST", "0.0.0.0")
 API_SERVER_PORT = int(os.getenv("API_SERVER_PORT", "8080"))
 API_SERVER_KEY = os.getenv("API_SERVER_KEY", "")
+API_BATCH_MAX_USERS = int(os.getenv("API_BATCH_MAX_USERS", "1000"))
+API_FETCH_CONCURRENCY = int(os.getenv("API_FETCH_CONCURRENCY", "5"))
+API_ROLES_CACHE_SIZE = int(os.getenv("API_ROLES_CACHE_SIZE", "5000"))
+API_STREAM_HEARTBEAT_SECONDS = float(os.getenv("API_STREAM_HEARTBEAT_SECONDS", "15"))
+API_ROSTER_PAGE_SIZE = int(os.getenv("API_ROSTER_PAGE_SIZE", "1000"))
+ROLE_FEED_BUFFER_SIZE = int(os.getenv("ROLE_FEED_BUFFER_SIZE", "1000"))
 
 
 # ============ VALIDATION ============
@@ -1,12 +1,439 @@
 import asyncpg
-from bot.config import DATABASE_URL
+from bot.config import (
+    DATABASE_URL,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_COMMAND_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+    DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+    DB_QUERY_METRICS
+)
 from bot.logger import get_logger
+from bot.metrics import MeteredPool, PoolMetrics
 
 logger = get_logger('database')
 
 
+# Версионированные миграции схемы: (версия, описание, SQL).
+# Каждая миграция выполняется ровно один раз в отдельной транзакции, номер
+# примененной версии сохраняется в schema_version. Новые миграции добавляются
+# только в конец списка, уже примененные не изменяются.
+MIGRATIONS = [
+    (
+        1,
+        "Базовые таблицы",
+        """
+        CREATE TABLE IF NOT EXISTS requests (
+            message_id BIGINT PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            embed JSONB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            finished_by BIGINT,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            finished_at TIMESTAMP WITHOUT TIME ZONE,
+            reject_reason TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS queue (
+            queue_id SERIAL PRIMARY KEY,
+            probationary_id BIGINT,
+            officer_id BIGINT,
+            display_name TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            finished_at TIMESTAMP WITHOUT TIME ZONE
+        );
+
+        -- Таблица категорий пресетов (с поддержкой вложенности)
+        CREATE TABLE IF NOT EXISTS preset_categories (
+            category_id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            parent_id INT REFERENCES preset_categories(category_id) ON DELETE CASCADE,
+            created_by BIGINT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            emoji TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS role_presets (
+            preset_id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            role_ids BIGINT[] NOT NULL,
+            created_by BIGINT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            description TEXT,
+            emoji TEXT,
+            category_id INT REFERENCES preset_categories(category_id) ON DELETE SET NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS preset_audit (
+            audit_id SERIAL PRIMARY KEY,
+            preset_id INT,
+            preset_name TEXT NOT NULL,
+            action TEXT NOT NULL,
+            performed_by BIGINT NOT NULL,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            old_value JSONB,
+            new_value JSONB,
+            details TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS reject_reasons (
+            reason_id SERIAL PRIMARY KEY,
+            reason_text TEXT NOT NULL,
+            dm_template TEXT,
+            created_by BIGINT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        );
+        """
+    ),
+    (
+        2,
+        "Дополнительные колонки пресетов, категорий, причин отказа и напоминаний",
+        """
+        ALTER TABLE role_presets ADD COLUMN IF NOT EXISTS emoji TEXT;
+        ALTER TABLE role_presets ADD COLUMN IF NOT EXISTS category_id INT REFERENCES preset_categories(category_id) ON DELETE SET NULL;
+        ALTER TABLE role_presets ADD COLUMN IF NOT EXISTS rank_group_role_id BIGINT;
+        ALTER TABLE role_presets ADD COLUMN IF NOT EXISTS sort_order INT;
+        ALTER TABLE preset_categories ADD COLUMN IF NOT EXISTS emoji TEXT;
+        ALTER TABLE preset_categories ADD COLUMN IF NOT EXISTS department_role_id BIGINT;
+        ALTER TABLE reject_reasons ADD COLUMN IF NOT EXISTS dm_template TEXT;
+        ALTER TABLE requests ADD COLUMN IF NOT EXISTS last_reminder_at TIMESTAMP WITHOUT TIME ZONE;
+        ALTER TABLE requests ADD COLUMN IF NOT EXISTS reminder_count INT DEFAULT 0;
+        """
+    ),
+    (
+        3,
+        "FK category_id: SET NULL -> CASCADE",
+        """
+        DO $$
+        DECLARE
+            fk_constraint_name TEXT;
+        BEGIN
+            -- Находим имя constraint для category_id
+            SELECT tc.constraint_name INTO fk_constraint_name
+            FROM information_schema.table_constraints tc
+            JOIN information_schema.key_column_usage kcu
+              ON tc.constraint_name = kcu.constraint_name
+              AND tc.table_schema = kcu.table_schema
+            WHERE tc.table_name = 'role_presets'
+              AND kcu.column_name = 'category_id'
+              AND tc.constraint_type = 'FOREIGN KEY'
+            LIMIT 1;
+
+            -- Если constraint найден, удаляем его и создаем новый с CASCADE
+            IF fk_constraint_name IS NOT NULL THEN
+                -- Проверяем, что это старый constraint с SET NULL
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.referential_constraints rc
+                    WHERE rc.constraint_name = fk_constraint_name
+                    AND rc.delete_rule = 'SET NULL'
+                ) THEN
+                    EXECUTE 'ALTER TABLE role_presets DROP CONSTRAINT ' || fk_constraint_name;
+                    ALTER TABLE role_presets
+                    ADD CONSTRAINT role_presets_category_id_fkey
+                    FOREIGN KEY (category_id)
+                    REFERENCES preset_categories(category_id)
+                    ON DELETE CASCADE;
+                END IF;
+            END IF;
+        END $$;
+        """
+    ),
+    (
+        4,
+        "UNIQUE role_presets: name -> (name, category_id)",
+        """
+        ALTER TABLE role_presets DROP CONSTRAINT IF EXISTS role_presets_name_key;
+
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM information_schema.table_constraints
+                WHERE table_name = 'role_presets'
+                AND constraint_name = 'role_presets_name_category_key'
+            ) THEN
+                ALTER TABLE role_presets ADD CONSTRAINT role_presets_name_category_key UNIQUE (name, category_id);
+            END IF;
+        END $$;
+        """
+    ),
+    (
+        5,
+        "Удаление стандартных описаний у рангов LSPD",
+        """
+        UPDATE role_presets
+        SET description = NULL
+        WHERE description LIKE 'Ранг LSPD:%';
+        """
+    ),
+    (
+        6,
+        "Индексы для частых запросов",
+        """
+        -- Pending запросы: восстановление views и напоминания
+        CREATE INDEX IF NOT EXISTS idx_requests_pending
+            ON requests (created_at) WHERE status = 'pending';
+        -- Последний запрос пользователя и поиск по пользователю
+        CREATE INDEX IF NOT EXISTS idx_requests_user_created
+            ON requests (user_id, created_at DESC);
+        -- Активные записи FTO очереди
+        CREATE INDEX IF NOT EXISTS idx_queue_active
+            ON queue (created_at) WHERE finished_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_queue_active_officer
+            ON queue (officer_id) WHERE finished_at IS NULL;
+        CREATE INDEX IF NOT EXISTS idx_queue_active_probationary
+            ON queue (probationary_id) WHERE finished_at IS NULL;
+        -- Навигация по дереву пресетов
+        CREATE INDEX IF NOT EXISTS idx_preset_categories_parent
+            ON preset_categories (parent_id);
+        CREATE INDEX IF NOT EXISTS idx_role_presets_category
+            ON role_presets (category_id, sort_order);
+        -- История изменений пресета
+        CREATE INDEX IF NOT EXISTS idx_preset_audit_name_time
+            ON preset_audit (preset_name, timestamp DESC);
+        """
+    ),
+    (
+        7,
+        "Журнал изменений ролей и состояние строк Google Sheets",
+        """
+        CREATE TABLE IF NOT EXISTS role_change_journal (
+            journal_id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            username TEXT NOT NULL,
+            roles TEXT[] NOT NULL,
+            changed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+            synced_at TIMESTAMP WITHOUT TIME ZONE
+        );
+        CREATE INDEX IF NOT EXISTS idx_role_change_journal_unsynced
+            ON role_change_journal (journal_id) WHERE synced_at IS NULL;
+
+        -- Хеш последнего записанного в таблицу значения по каждой строке (ключ - Discord username)
+        CREATE TABLE IF NOT EXISTS gsheet_row_state (
+            username TEXT PRIMARY KEY,
+            value_hash TEXT NOT NULL,
+            synced_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+        );
+        """
+    ),
+    (
+        8,
+        "Сообщения FTO Search",
+        """
+        CREATE TABLE IF NOT EXISTS fto_boards (
+            message_id BIGINT PRIMARY KEY,
+            channel_id BIGINT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+        );
+        """
+    ),
+    (
+        9,
+        "Функция входа в FTO очередь с поиском пары",
+        """
+        -- Вход в очередь одним вызовом: проверка, поиск самого старого партнера,
+        -- вставка и завершение обеих записей пары в одной транзакции.
+        -- status: already_queued | paired | queued
+        CREATE OR REPLACE FUNCTION fto_enqueue(
+            p_user_id BIGINT,
+            p_is_officer BOOLEAN,
+            p_display_name TEXT,
+            p_created_at TIMESTAMP WITHOUT TIME ZONE
+        ) RETURNS TABLE (
+            status TEXT,
+            queue_id INT,
+            partner_queue_id INT,
+            partner_user_id BIGINT,
+            partner_display_name TEXT
+        ) AS $$
+        DECLARE
+            partner RECORD;
+            new_id INT;
+        BEGIN
+            -- Одновременные входы FTO и стажера иначе не видят незакоммиченные записи друг друга
+            PERFORM pg_advisory_xact_lock(hashtext('fto_queue'));
+
+            IF EXISTS (
+                SELECT 1 FROM queue q
+                WHERE (q.probationary_id = p_user_id OR q.officer_id = p_user_id) AND q.finished_at IS NULL
+            ) THEN
+                RETURN QUERY SELECT 'already_queued'::TEXT, NULL::INT, NULL::INT, NULL::BIGINT, NULL::TEXT;
+                RETURN;
+            END IF;
+
+            IF p_is_officer THEN
+                SELECT q.queue_id, q.probationary_id AS user_id, q.display_name INTO partner
+                FROM queue q
+                WHERE q.probationary_id IS NOT NULL AND q.finished_at IS NULL
+                ORDER BY q.created_at LIMIT 1 FOR UPDATE SKIP LOCKED;
+            ELSE
+                SELECT q.queue_id, q.officer_id AS user_id, q.display_name INTO partner
+                FROM queue q
+                WHERE q.officer_id IS NOT NULL AND q.finished_at IS NULL
+                ORDER BY q.created_at LIMIT 1 FOR UPDATE SKIP LOCKED;
+            END IF;
+
+            INSERT INTO queue (officer_id, probationary_id, display_name, created_at, finished_at)
+            VALUES (
+                CASE WHEN p_is_officer THEN p_user_id END,
+                CASE WHEN p_is_officer THEN NULL ELSE p_user_id END,
+                p_display_name,
+                p_created_at,
+                CASE WHEN partner.queue_id IS NOT NULL THEN p_created_at END
+            )
+            RETURNING queue.queue_id INTO new_id;
+
+            IF partner.queue_id IS NULL THEN
+                RETURN QUERY SELECT 'queued'::TEXT, new_id, NULL::INT, NULL::BIGINT, NULL::TEXT;
+                RETURN;
+            END IF;
+
+            UPDATE queue SET finished_at = p_created_at WHERE queue.queue_id = partner.queue_id;
+            RETURN QUERY SELECT 'paired'::TEXT, new_id, partner.queue_id, partner.user_id, partner.display_name;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    ),
+    (
+        10,
+        "fto_enqueue: вход в очередь без немедленного поиска пары (пакетный подбор)",
+        """
+        DROP FUNCTION IF EXISTS fto_enqueue(BIGINT, BOOLEAN, TEXT, TIMESTAMP WITHOUT TIME ZONE);
+
+        -- p_match = FALSE: только вход в очередь, пары подбираются пакетно ботом
+        CREATE OR REPLACE FUNCTION fto_enqueue(
+            p_user_id BIGINT,
+            p_is_officer BOOLEAN,
+            p_display_name TEXT,
+            p_created_at TIMESTAMP WITHOUT TIME ZONE,
+            p_match BOOLEAN DEFAULT TRUE
+        ) RETURNS TABLE (
+            status TEXT,
+            queue_id INT,
+            partner_queue_id INT,
+            partner_user_id BIGINT,
+            partner_display_name TEXT
+        ) AS $$
+        DECLARE
+            partner RECORD;
+            new_id INT;
+        BEGIN
+            -- Одновременные входы FTO и стажера иначе не видят незакоммиченные записи друг друга
+            PERFORM pg_advisory_xact_lock(hashtext('fto_queue'));
+
+            IF EXISTS (
+                SELECT 1 FROM queue q
+                WHERE (q.probationary_id = p_user_id OR q.officer_id = p_user_id) AND q.finished_at IS NULL
+            ) THEN
+                RETURN QUERY SELECT 'already_queued'::TEXT, NULL::INT, NULL::INT, NULL::BIGINT, NULL::TEXT;
+                RETURN;
+            END IF;
+
+            IF NOT p_match THEN
+                SELECT NULL::INT AS queue_id INTO partner;
+            ELSIF p_is_officer THEN
+                SELECT q.queue_id, q.probationary_id AS user_id, q.display_name INTO partner
+                FROM queue q
+                WHERE q.probationary_id IS NOT NULL AND q.finished_at IS NULL
+                ORDER BY q.created_at LIMIT 1 FOR UPDATE SKIP LOCKED;
+            ELSE
+                SELECT q.queue_id, q.officer_id AS user_id, q.display_name INTO partner
+                FROM queue q
+                WHERE q.officer_id IS NOT NULL AND q.finished_at IS NULL
+                ORDER BY q.created_at LIMIT 1 FOR UPDATE SKIP LOCKED;
+            END IF;
+
+            INSERT INTO queue (officer_id, probationary_id, display_name, created_at, finished_at)
+            VALUES (
+                CASE WHEN p_is_officer THEN p_user_id END,
+                CASE WHEN p_is_officer THEN NULL ELSE p_user_id END,
+                p_display_name,
+                p_created_at,
+                CASE WHEN partner.queue_id IS NOT NULL THEN p_created_at END
+            )
+            RETURNING queue.queue_id INTO new_id;
+
+            IF partner.queue_id IS NULL THEN
+                RETURN QUERY SELECT 'queued'::TEXT, new_id, NULL::INT, NULL::BIGINT, NULL::TEXT;
+                RETURN;
+            END IF;
+
+            UPDATE queue SET finished_at = p_created_at WHERE queue.queue_id = partner.queue_id;
+            RETURN QUERY SELECT 'paired'::TEXT, new_id, partner.queue_id, partner.user_id, partner.display_name;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    ),
+    (
+        11,
+        "Индекс для выборки наступивших напоминаний",
+        """
+        CREATE INDEX IF NOT EXISTS idx_requests_pending_reminders
+            ON requests ((COALESCE(reminder_count, 0)), created_at) WHERE status = 'pending';
+        """
+    ),
+    (
+        12,
+        "Журнал изменений ролей: удаление неиспользуемого столбца roles",
+        """
+        -- Синхронизация берет роли из текущего состояния участника, снимок в журнале не читается
+        ALTER TABLE role_change_journal DROP COLUMN IF EXISTS roles;
+        """
+    ),
+]
+
+
 async def create_db_pool():
-    return await asyncpg.create_pool(DATABASE_URL)
+    metrics = PoolMetrics()
+
+    async def init_connection(conn):
+        """Настройка каждого нового соединения пула"""
+        await conn.execute("SET client_encoding = 'UTF8'")
+        if DB_QUERY_METRICS:
+            conn.add_query_logger(metrics.query_logged)
+
+    pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        command_timeout=DB_COMMAND_TIMEOUT or None,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        max_inactive_connection_lifetime=DB_MAX_INACTIVE_CONNECTION_LIFETIME,
+        init=init_connection
+    )
+    logger.info(
+        f"Пул БД создан: min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE}, "
+        f"command_timeout={DB_COMMAND_TIMEOUT}, statement_cache_size={DB_STATEMENT_CACHE_SIZE}"
+    )
+    return MeteredPool(pool, metrics)
+
+
+async def run_migrations(conn):
+    """Применение еще не выполненных миграций из MIGRATIONS"""
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW()
+        )
+    """
+    )
+    applied = {row['version'] for row in await conn.fetch("SELECT version FROM schema_version")}
+
+    pending = [m for m in MIGRATIONS if m[0] not in applied]
+    if not pending:
+        logger.info(f"Схема БД актуальна (версия {max(applied, default=0)})")
+        return
+
+    for version, description, sql in pending:
+        async with conn.transaction():
+            await conn.execute(sql)
+            await conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES ($1, $2)",
+                version,
+                description
+            )
+        logger.info(f"Применена миграция {version}: {description}")
 
 
 async def setup_db(bot):
@@ -21,282 +448,8 @@ async def setup_db(bot):
         bot.db_pool = None
         raise
     async with bot.db_pool.acquire() as conn:
-        await conn.execute("SET client_encoding = 'UTF8'")
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS requests (
-                message_id BIGINT PRIMARY KEY,
-                user_id BIGINT NOT NULL,
-                embed JSONB NOT NULL,
-                status TEXT NOT NULL DEFAULT 'pending',
-                finished_by BIGINT,
-                created_at TIMESTAMP WITHOUT TIME ZONE,
-                finished_at TIMESTAMP WITHOUT TIME ZONE,
-                reject_reason TEXT
-            )
-        """
-        )
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS queue (
-                queue_id SERIAL PRIMARY KEY,
-                probationary_id BIGINT,
-                officer_id BIGINT,
-                display_name TEXT,
-                created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
-                finished_at TIMESTAMP WITHOUT TIME ZONE
-            )
-        """
-        )
-        # Таблица категорий пресетов (с поддержкой вложенности)
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS preset_categories (
-                category_id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL,
-                parent_id INT REFERENCES preset_categories(category_id) ON DELETE CASCADE,
-                created_by BIGINT NOT NULL,
-                created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
-                emoji TEXT
-            )
-        """
-        )
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS role_presets (
-                preset_id SERIAL PRIMARY KEY,
-                name TEXT NOT NULL UNIQUE,
-                role_ids BIGINT[] NOT NULL,
-                created_by BIGINT NOT NULL,
-                created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
-                description TEXT,
-                emoji TEXT,
-                category_id INT REFERENCES preset_categories(category_id) ON DELETE SET NULL
-            )
-        """
-        )
-        # Миграция: добавляем колонку emoji если её нет
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'role_presets' AND column_name = 'emoji'
-                ) THEN
-                    ALTER TABLE role_presets ADD COLUMN emoji TEXT;
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: добавляем колонку category_id если её нет
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'role_presets' AND column_name = 'category_id'
-                ) THEN
-                    ALTER TABLE role_presets ADD COLUMN category_id INT REFERENCES preset_categories(category_id) ON DELETE SET NULL;
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: добавляем колонку rank_group_role_id в role_presets если её нет
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'role_presets' AND column_name = 'rank_group_role_id'
-                ) THEN
-                    ALTER TABLE role_presets ADD COLUMN rank_group_role_id BIGINT;
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: добавляем колонку sort_order в role_presets если её нет
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'role_presets' AND column_name = 'sort_order'
-                ) THEN
-                    ALTER TABLE role_presets ADD COLUMN sort_order INT;
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: добавляем колонку emoji в preset_categories если её нет
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'preset_categories' AND column_name = 'emoji'
-                ) THEN
-                    ALTER TABLE preset_categories ADD COLUMN emoji TEXT;
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: добавляем колонку department_role_id в preset_categories если её нет
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'preset_categories' AND column_name = 'department_role_id'
-                ) THEN
-                    ALTER TABLE preset_categories ADD COLUMN department_role_id BIGINT;
-                END IF;
-            END $$;
-            """
-        )
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS preset_audit (
-                audit_id SERIAL PRIMARY KEY,
-                preset_id INT,
-                preset_name TEXT NOT NULL,
-                action TEXT NOT NULL,
-                performed_by BIGINT NOT NULL,
-                timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
-                old_value JSONB,
-                new_value JSONB,
-                details TEXT
-            )
-        """
-        )
-        await conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS reject_reasons (
-                reason_id SERIAL PRIMARY KEY,
-                reason_text TEXT NOT NULL,
-                dm_template TEXT,
-                created_by BIGINT NOT NULL,
-                created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
-            )
-        """
-        )
-        # Миграция: добавляем колонку dm_template если её нет
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'reject_reasons' AND column_name = 'dm_template'
-                ) THEN
-                    ALTER TABLE reject_reasons ADD COLUMN dm_template TEXT;
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: изменяем constraint для category_id с SET NULL на CASCADE
-        await conn.execute(
-            """
-            DO $$
-            DECLARE
-                fk_constraint_name TEXT;
-            BEGIN
-                -- Находим имя constraint для category_id
-                SELECT tc.constraint_name INTO fk_constraint_name
-                FROM information_schema.table_constraints tc
-                JOIN information_schema.key_column_usage kcu
-                  ON tc.constraint_name = kcu.constraint_name
-                  AND tc.table_schema = kcu.table_schema
-                WHERE tc.table_name = 'role_presets'
-                  AND kcu.column_name = 'category_id'
-                  AND tc.constraint_type = 'FOREIGN KEY'
-                LIMIT 1;
-
-                -- Если constraint найден, удаляем его и создаем новый с CASCADE
-                IF fk_constraint_name IS NOT NULL THEN
-                    -- Проверяем, что это старый constraint с SET NULL
-                    IF EXISTS (
-                        SELECT 1 FROM information_schema.referential_constraints rc
-                        WHERE rc.constraint_name = fk_constraint_name
-                        AND rc.delete_rule = 'SET NULL'
-                    ) THEN
-                        EXECUTE 'ALTER TABLE role_presets DROP CONSTRAINT ' || fk_constraint_name;
-                        ALTER TABLE role_presets
-                        ADD CONSTRAINT role_presets_category_id_fkey
-                        FOREIGN KEY (category_id)
-                        REFERENCES preset_categories(category_id)
-                        ON DELETE CASCADE;
-                    END IF;
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: изменяем UNIQUE constraint с name на (name, category_id)
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                -- Удаляем старый UNIQUE constraint на name если он существует
-                IF EXISTS (
-                    SELECT 1 FROM information_schema.table_constraints
-                    WHERE table_name = 'role_presets'
-                    AND constraint_name = 'role_presets_name_key'
-                    AND constraint_type = 'UNIQUE'
-                ) THEN
-                    ALTER TABLE role_presets DROP CONSTRAINT role_presets_name_key;
-                END IF;
+        await run_migrations(conn)
 
-                -- Добавляем новый UNIQUE constraint на (name, category_id) если его нет
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.table_constraints
-                    WHERE table_name = 'role_presets'
-                    AND constraint_name = 'role_presets_name_category_key'
-                ) THEN
-                    ALTER TABLE role_presets ADD CONSTRAINT role_presets_name_category_key UNIQUE (name, category_id);
-                END IF;
-            END $$;
-            """
-        )
-        # Миграция: удаляем описания у рангов LSPD (которые были созданы со стандартным описанием)
-        await conn.execute(
-            """
-            UPDATE role_presets
-            SET description = NULL
-            WHERE description LIKE 'Ранг LSPD:%'
-            """
-        )
-        # Миграция: добавляем колонки для напоминаний в requests
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'requests' AND column_name = 'last_reminder_at'
-                ) THEN
-                    ALTER TABLE requests ADD COLUMN last_reminder_at TIMESTAMP WITHOUT TIME ZONE;
-                END IF;
-            END $$;
-            """
-        )
-        await conn.execute(
-            """
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.columns
-                    WHERE table_name = 'requests' AND column_name = 'reminder_count'
-                ) THEN
-                    ALTER TABLE requests ADD COLUMN reminder_count INT DEFAULT 0;
-                END IF;
-            END $$;
-            """
-        )
         # Добавляем стандартные причины если таблица пустая
         existing_reasons = await conn.fetchval("SELECT COUNT(*) FROM reject_reasons")
         if existing_reasons == 0:
@@ -0,0 +1,145 @@
+"""
+Метрики пула соединений с БД.
+
+Собираются в памяти процесса и отдаются через API (GET /api/metrics/db):
+время ожидания соединения, число занятых соединений и гистограмма
+длительности запросов по каждому SQL-выражению.
+"""
+import re
+import time
+
+# Верхние границы корзин гистограммы в миллисекундах (последняя - все остальное)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Ограничение числа различных выражений, чтобы динамический SQL не раздувал память
+MAX_TRACKED_STATEMENTS = 200
+
+_whitespace_re = re.compile(r'\s+')
+
+
+class LatencyHistogram:
+    """Гистограмма длительностей с фиксированными корзинами"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, seconds: float, error: bool = False):
+        ms = seconds * 1000
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        if error:
+            self.errors += 1
+
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def snapshot(self) -> dict:
+        labels = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'buckets': dict(zip(labels, self.buckets))
+        }
+
+
+class PoolMetrics:
+    """Счетчики использования пула asyncpg"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.acquire_wait = LatencyHistogram()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.statements = {}
+        self.untracked_queries = 0
+
+    def connection_acquired(self, wait_seconds: float):
+        self.acquire_wait.observe(wait_seconds)
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def connection_released(self):
+        self.in_use -= 1
+
+    def query_logged(self, record):
+        """Колбэк для Connection.add_query_logger"""
+        statement = _whitespace_re.sub(' ', record.query).strip()[:300]
+        histogram = self.statements.get(statement)
+        if histogram is None:
+            if len(self.statements) >= MAX_TRACKED_STATEMENTS:
+                self.untracked_queries += 1
+                return
+            histogram = self.statements[statement] = LatencyHistogram()
+        histogram.observe(record.elapsed, error=record.exception is not None)
+
+    def snapshot(self, pool=None) -> dict:
+        data = {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'acquire_wait': self.acquire_wait.snapshot(),
+            'untracked_queries': self.untracked_queries,
+            'statements': sorted(
+                ({'query': query, **histogram.snapshot()} for query, histogram in self.statements.items()),
+                key=lambda s: s['count'] * s['avg_ms'],
+                reverse=True
+            )
+        }
+        if pool is not None:
+            data['pool'] = {
+                'size': pool.get_size(),
+                'idle': pool.get_idle_size(),
+                'min_size': pool.get_min_size(),
+                'max_size': pool.get_max_size()
+            }
+        return data
+
+
+class _MeteredAcquire:
+    def __init__(self, pool, metrics: PoolMetrics, timeout=None):
+        self._pool = pool
+        self._metrics = metrics
+        self._timeout = timeout
+        self._conn = None
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        self._conn = await self._pool.acquire(timeout=self._timeout)
+        self._metrics.connection_acquired(time.perf_counter() - started)
+        return self._conn
+
+    async def __aexit__(self, *exc):
+        try:
+            await self._pool.release(self._conn)
+        finally:
+            self._metrics.connection_released()
+            self._conn = None
+
+
+class MeteredPool:
+    """
+    Обертка над asyncpg.Pool, замеряющая ожидание соединения.
+
+    Поддерживает `async with pool.acquire() as conn`; остальные атрибуты
+    (close, fetch, execute, get_size и т.д.) проксируются в исходный пул.
+    """
+
+    def __init__(self, pool, metrics: PoolMetrics):
+        self._pool = pool
+        self.metrics = metrics
+
+    def acquire(self, *, timeout=None):
+        return _MeteredAcquire(self._pool, self.metrics, timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
@@ -0,0 +1,125 @@
+"""
+Кеш дерева категорий и пресетов ролей.
+
+Всё дерево (preset_categories + role_presets) загружается одним снимком и
+хранится в памяти процесса. Любой код, изменяющий эти таблицы, обязан вызвать
+invalidate_preset_tree() — следующий запрос перечитает дерево из БД.
+"""
+import asyncio
+
+from bot.config import BASE_LSPD_ROLE_ID
+from bot.logger import get_logger
+
+logger = get_logger('preset_cache')
+
+
+class PresetTree:
+    """Неизменяемый снимок дерева категорий и пресетов"""
+
+    def __init__(self, version: int, categories: list, presets: list):
+        self.version = version
+
+        # Порядок сохраняется из SQL (ORDER BY), поэтому сортировка совпадает с прежними запросами
+        self.categories = {c['category_id']: c for c in categories}
+        self.presets = {p['preset_id']: p for p in presets}
+
+        self._children = {}
+        for category in categories:
+            self._children.setdefault(category['parent_id'], []).append(category)
+
+        self._presets_by_category = {}
+        for preset in presets:
+            self._presets_by_category.setdefault(preset['category_id'], []).append(preset)
+
+        # Итоговые списки ролей считаются один раз на снимок
+        self._effective_roles = {p['preset_id']: self._resolve_roles(p) for p in presets}
+
+    def child_categories(self, parent_id=None) -> list:
+        """Подкатегории указанной категории (None - корневые категории)"""
+        return self._children.get(parent_id, [])
+
+    def category_presets(self, category_id=None) -> list:
+        """Пресеты категории (None - пресеты без категории)"""
+        return self._presets_by_category.get(category_id, [])
+
+    def parent_id(self, category_id):
+        """ID родительской категории или None"""
+        category = self.categories.get(category_id)
+        return category['parent_id'] if category else None
+
+    def department_role_id(self, category_id):
+        """Роль отдела: у подкатегории берется из родителя, у корневой категории - своя"""
+        category = self.categories.get(category_id)
+        if not category:
+            return None
+        if category['parent_id'] is not None:
+            parent = self.categories.get(category['parent_id'])
+            return parent['department_role_id'] if parent else None
+        return category['department_role_id']
+
+    def effective_role_ids(self, preset_id) -> list:
+        """Итоговый список ролей пресета в порядке иерархии (без дубликатов)"""
+        return list(self._effective_roles.get(preset_id, []))
+
+    def _resolve_roles(self, preset) -> list:
+        # Роли из пресета -> групповая роль ранга -> роль отдела -> базовая роль LSPD (самая низкая)
+        role_ids = list(preset['role_ids'] or [])
+        if preset.get('rank_group_role_id'):
+            role_ids.append(preset['rank_group_role_id'])
+        if preset.get('category_id'):
+            department_role_id = self.department_role_id(preset['category_id'])
+            if department_role_id:
+                role_ids.append(department_role_id)
+        if BASE_LSPD_ROLE_ID:
+            role_ids.append(BASE_LSPD_ROLE_ID)
+
+        # Удаляем дубликаты, сохраняя порядок
+        return list(dict.fromkeys(role_ids))
+
+
+_tree = None
+_version = 0
+_lock = asyncio.Lock()
+
+
+def invalidate_preset_tree():
+    """Сбросить кеш после изменения preset_categories или role_presets"""
+    global _version
+    _version += 1
+    logger.debug(f"Кеш пресетов инвалидирован, версия {_version}")
+
+
+async def load_preset_tree(pool, version: int = 0) -> PresetTree:
+    """Загрузка всего дерева из БД (два запроса)"""
+    async with pool.acquire() as conn:
+        categories = await conn.fetch(
+            "SELECT category_id, name, emoji, parent_id, department_role_id "
+            "FROM preset_categories ORDER BY name"
+        )
+        presets = await conn.fetch(
+            "SELECT preset_id, name, role_ids, description, emoji, category_id, rank_group_role_id, sort_order "
+            "FROM role_presets ORDER BY sort_order NULLS LAST, name"
+        )
+    return PresetTree(version, [dict(c) for c in categories], [dict(p) for p in presets])
+
+
+async def get_preset_tree(pool) -> PresetTree:
+    """Актуальный снимок дерева; загружается из БД только после инвалидации"""
+    global _tree
+    tree = _tree
+    if tree is not None and tree.version == _version:
+        return tree
+
+    async with _lock:
+        # Пока ждали блокировку, дерево мог загрузить другой вызов
+        if _tree is not None and _tree.version == _version:
+            return _tree
+
+        # Фиксируем версию до чтения: инвалидация во время загрузки приведет к повторной загрузке
+        version = _version
+        _tree = await load_preset_tree(pool, version)
+        logger.info(
+            f"Дерево пресетов загружено (версия {version}): "
+            f"{len(_tree.categories)} категорий, {len(_tree.presets)} пресетов"
+        )
+        return _tree
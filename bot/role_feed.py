@@ -0,0 +1,100 @@
+"""
+Лента изменений ролей участников для потоковой выдачи через API (SSE).
+
+События публикуются из on_member_update и хранятся в кольцевом буфере
+ограниченного размера. Каждое событие имеет возрастающий номер; клиент
+передает номер последнего полученного события (Last-Event-ID) и при
+переподключении получает пропущенные события из буфера. Если нужные события
+уже вытеснены из буфера или бот перезапускался, клиенту отправляется reset -
+он должен заново запросить актуальные роли через /api/roles/batch, а поток
+продолжается с текущего события.
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+
+from bot.config import ROLE_FEED_BUFFER_SIZE
+
+
+class RoleFeed:
+    """Кольцевой буфер событий изменения ролей"""
+
+    def __init__(self, maxlen: int = ROLE_FEED_BUFFER_SIZE):
+        # Идентификатор потока меняется при каждом запуске процесса
+        self.stream_id = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self._events = deque(maxlen=maxlen)
+        self._changed = asyncio.Event()
+
+    def publish(self, guild_id: int, user_id: int, added: list, removed: list, roles: list) -> dict:
+        self.seq += 1
+        event = {
+            'seq': self.seq,
+            'guild_id': str(guild_id),
+            'user_id': str(user_id),
+            'added': added,
+            'removed': removed,
+            'roles': roles,
+            'timestamp': time.time()
+        }
+        self._events.append(event)
+
+        # Будим всех ожидающих и готовим новое событие для следующих
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+        return event
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.stream_id}:{seq}"
+
+    def parse_cursor(self, cursor: str | None) -> tuple[int, bool]:
+        """
+        Номер, с которого продолжать, по Last-Event-ID / since.
+
+        Returns:
+            tuple: (номер последнего полученного события, нужен ли reset)
+        """
+        if not cursor:
+            # Новый клиент получает только события после подключения
+            return self.seq, False
+
+        stream_id, _, seq = cursor.rpartition(':')
+        try:
+            seq = int(seq)
+        except ValueError:
+            return self.seq, True
+
+        if (stream_id and stream_id != self.stream_id) or seq > self.seq:
+            # Курсор от предыдущего запуска бота: после reset клиент перечитывает
+            # роли целиком, поэтому продолжаем с текущего события
+            return self.seq, True
+        return seq, False
+
+    def read_after(self, seq: int) -> tuple[list, bool]:
+        """
+        События с номером больше seq.
+
+        Returns:
+            tuple: (события, были ли часть событий потеряны из-за переполнения буфера)
+        """
+        if not self._events or seq >= self.seq:
+            return [], False
+
+        oldest = self._events[0]['seq']
+        gap = seq < oldest - 1
+        start = max(seq + 1 - oldest, 0)
+        return [self._events[i] for i in range(start, len(self._events))], gap
+
+    async def wait(self, seq: int, timeout: float) -> bool:
+        """Ожидание событий новее seq. False - истек таймаут"""
+        if self.seq > seq:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+role_feed = RoleFeed()
@@ -0,0 +1,101 @@
+"""
+Обратный индекс ролей сервера: role_id -> ID участников и название -> role_id.
+
+Строится один раз в on_ready полным проходом по участникам и дальше
+поддерживается событиями (on_member_update, вход/выход участников,
+создание/изменение/удаление ролей). Запросы вида "у кого есть роль X" и
+"какая роль называется Y" становятся поиском по множеству/словарю вместо
+перебора всех участников или всех ролей сервера.
+Роль @everyone не индексируется.
+"""
+import discord
+
+
+class RoleIndex:
+    def __init__(self):
+        self._members = {}  # guild_id -> {role_id: set(member_id)}
+        self._names = {}  # guild_id -> {role_name: role_id}
+
+    def is_ready(self, guild_id: int) -> bool:
+        return guild_id in self._members
+
+    def rebuild(self, guild: discord.Guild):
+        """Полное построение индекса сервера"""
+        members = {role.id: set() for role in guild.roles if not role.is_default()}
+        for member in guild.members:
+            for role in member.roles:
+                if not role.is_default():
+                    members.setdefault(role.id, set()).add(member.id)
+        self._members[guild.id] = members
+        self._rebuild_names(guild)
+
+    def _rebuild_names(self, guild: discord.Guild):
+        names = {}
+        for role in guild.roles:
+            # Как и discord.utils.find по guild.roles - при одинаковых названиях берется первая роль
+            names.setdefault(role.name, role.id)
+        self._names[guild.id] = names
+
+    # ---- Обновление по событиям ----
+
+    def member_updated(self, before: discord.Member, after: discord.Member):
+        index = self._members.get(after.guild.id)
+        if index is None:
+            return
+        before_ids = {role.id for role in before.roles if not role.is_default()}
+        after_ids = {role.id for role in after.roles if not role.is_default()}
+        for role_id in before_ids - after_ids:
+            index.get(role_id, set()).discard(after.id)
+        for role_id in after_ids - before_ids:
+            index.setdefault(role_id, set()).add(after.id)
+
+    def member_joined(self, member: discord.Member):
+        index = self._members.get(member.guild.id)
+        if index is None:
+            return
+        for role in member.roles:
+            if not role.is_default():
+                index.setdefault(role.id, set()).add(member.id)
+
+    def member_removed(self, member: discord.Member):
+        index = self._members.get(member.guild.id)
+        if index is None:
+            return
+        for role in member.roles:
+            index.get(role.id, set()).discard(member.id)
+
+    def role_created(self, role: discord.Role):
+        if role.guild.id in self._members:
+            self._members[role.guild.id].setdefault(role.id, set())
+            self._rebuild_names(role.guild)
+
+    def role_updated(self, role: discord.Role):
+        if role.guild.id in self._members:
+            self._rebuild_names(role.guild)
+
+    def role_deleted(self, role: discord.Role):
+        if role.guild.id in self._members:
+            self._members[role.guild.id].pop(role.id, None)
+            self._rebuild_names(role.guild)
+
+    # ---- Запросы ----
+
+    def member_ids(self, guild_id: int, role_id: int) -> frozenset:
+        """ID участников с ролью (пустое множество, если роли нет или индекс не построен)"""
+        return frozenset(self._members.get(guild_id, {}).get(role_id, ()))
+
+    def role_by_name(self, guild: discord.Guild, name: str) -> discord.Role | None:
+        if guild.id not in self._names:
+            return discord.utils.find(lambda r: r.name == name, guild.roles)
+        role_id = self._names[guild.id].get(name)
+        return guild.get_role(role_id) if role_id is not None else None
+
+    def has_role(self, member: discord.Member, role_id: int) -> bool:
+        index = self._members.get(member.guild.id)
+        if index is None:
+            # Индекс еще не построен (до on_ready)
+            return member.get_role(role_id) is not None
+        return member.id in index.get(role_id, ())
+
+
+role_index = RoleIndex()
@@ -0,0 +1,59 @@
+"""
+Версии наборов ролей участников и кеш сериализованных ответов /api/roles.
+
+Версия участника увеличивается в on_member_update, при входе/выходе и
+смене профиля, эпоха сервера - при изменении/создании/удалении ролей и
+самого сервера (меняются названия, цвета и позиции в ответе) и при каждом
+on_ready (после переподключения события за время разрыва потеряны). ETag строится из этих чисел и идентификатора
+запуска процесса, поэтому после перезапуска бота старые ETag не совпадут.
+"""
+import uuid
+from collections import OrderedDict
+
+from bot.config import API_ROLES_CACHE_SIZE
+
+_boot_id = uuid.uuid4().hex[:8]
+_member_versions = {}
+_guild_epochs = {}
+
+
+def bump_member(guild_id: int, member_id: int):
+    """Роли или профиль участника изменились"""
+    key = (guild_id, member_id)
+    _member_versions[key] = _member_versions.get(key, 0) + 1
+
+
+def bump_guild(guild_id: int):
+    """Изменились роли сервера - все ответы по серверу устарели"""
+    _guild_epochs[guild_id] = _guild_epochs.get(guild_id, 0) + 1
+
+
+def member_etag(guild_id: int, member_id: int) -> str:
+    version = _member_versions.get((guild_id, member_id), 0)
+    epoch = _guild_epochs.get(guild_id, 0)
+    return f'"{_boot_id}-{guild_id}-{member_id}-{epoch}-{version}"'
+
+
+class ResponseCache:
+    """LRU кеш готовых тел ответа, ключ - ETag"""
+
+    def __init__(self, maxsize: int = API_ROLES_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag: str):
+        body = self._items.get(etag)
+        if body is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(etag)
+        self.hits += 1
+        return body
+
+    def put(self, etag: str, body: bytes):
+        self._items[etag] = body
+        self._items.move_to_end(etag)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
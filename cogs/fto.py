@@ -4,6 +4,7 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
+from models.fto_queue import FTOQueueScheduler
 from models.fto_request import FTOView
 from models.roles_request import is_preset_admin
 
@@ -11,6 +12,17 @@ from models.roles_request import is_preset_admin
 class FTOCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Единый планировщик истечения записей очереди для всех сообщений FTO Search
+        bot.fto_queue = FTOQueueScheduler(bot)
+        # Один persistent view обслуживает кнопки всех сообщений FTO Search (в том числе после перезапуска)
+        self.view = FTOView(bot)
+
+    async def cog_load(self):
+        self.bot.add_view(self.view)
+        self.bot.fto_queue.start()
+
+    async def cog_unload(self):
+        await self.bot.fto_queue.stop()
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -28,27 +40,10 @@ class FTOCog(commands.Cog):
         await interaction.response.defer(thinking=True)
 
         try:
-            embed = discord.Embed(title="FTO Search")
-            embed.set_thumbnail(url="https://i.imgur.com/89q0Cdj.png")
-            embed.set_image(url="https://i.imgur.com/rZvJhyw.png")
-            embed.add_field(
-                name="",
-                value="Этот модуль предназначен для поиска наставника или стажера. Выбрав соответствующий "
-                "пункт в меню - вы встанете в очередь или сразу переключитесь на свободного "
-                "наставника. Учтите, что очередь очищается каждые три часа.",
-                inline=False,
-            )
-            embed.add_field(
-                name="Стажеры в очереди", value="Нет стажеров в очереди", inline=False
-            )
-            embed.add_field(name="Свободные FTO", value="Нет FTO", inline=False)
-            embed.set_footer(
-                text="Los Santos Police Department. Разработчик: Chlorine, специально для Moon."
-            )
+            embed = self.bot.fto_queue.render_embed()
 
-            await interaction.followup.send(
-                embed=embed, view=FTOView(interaction.client)
-            )
+            message = await interaction.followup.send(embed=embed, view=self.view)
+            await self.bot.fto_queue.register_board(message.channel.id, message.id)
         except Exception as e:
             error_message = "❌ Ошибка при обработке запроса."
             await interaction.followup.send(error_message, ephemeral=True)
@@ -63,7 +63,7 @@ class gSheets(commands.Cog):
 
         await interaction.response.defer(thinking=True, ephemeral=True)
         try:
-            await update_roles(bot=self.bot)
+            await update_roles(bot=self.bot, full=True)
             await interaction.followup.send(
                 "Таблица успешно обновлена!", ephemeral=True
             )
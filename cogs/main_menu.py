@@ -20,6 +20,7 @@ from bot.config import (
     TS3_SERVER_PORT
 )
 from bot.logger import get_logger
+from bot.role_index import role_index
 
 logger = get_logger('main_menu')
 
@@ -298,7 +299,7 @@ class MainMenu(commands.Cog):
         - Запросить роли (если нет базовой роли)
         """
         # Проверяем наличие базовой роли LSPD
-        has_lspd_role = any(role.id == BASE_LSPD_ROLE_ID for role in interaction.user.roles)
+        has_lspd_role = role_index.has_role(interaction.user, BASE_LSPD_ROLE_ID)
 
         if has_lspd_role:
             # Показываем полное меню с кнопками
@@ -9,6 +9,7 @@ from discord import app_commands
 from discord.ext import commands
 
 from bot.logger import get_logger
+from bot.preset_cache import invalidate_preset_tree
 from models.roles_request import normalize_emoji_for_storage, CategoryManagementView, RejectReasonsManagementView, is_preset_admin
 import json
 
@@ -139,6 +140,7 @@ class PresetsV2(commands.Cog):
                     "DELETE FROM role_presets WHERE name = $1",
                     name
                 )
+            invalidate_preset_tree()
 
             # Логирование удаления пресета
             await log_preset_audit(
@@ -520,6 +522,7 @@ class PresetCreateModal(discord.ui.Modal, title="Создать пресет р
                     self.description.value if self.description.value else None,
                     emoji_value
                 )
+            invalidate_preset_tree()
 
             # Логирование создания пресета
             await log_preset_audit(
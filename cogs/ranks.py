@@ -7,56 +7,12 @@ from discord.ext import commands
 from datetime import datetime
 
 from bot.logger import get_logger
+from bot.preset_cache import invalidate_preset_tree
+from models.rank_provisioning import LSPD_RANKS, delete_rank_presets, provision_rank_presets
 from models.roles_request import is_preset_admin
 
 logger = get_logger('ranks')
 
-# Список всех рангов LSPD в порядке иерархии
-LSPD_RANKS = [
-    "Chief of Police",
-    "Assistant Chief of Police",
-    "Deputy Chief of Police",
-    "Police Commander",
-    "Police Captain III",
-    "Police Captain II",
-    "Police Captain I",
-    "Police Lieutenant II",
-    "Police Lieutenant I",
-    "Police Sergeant II",
-    "Police Sergeant I",
-    "Police Detective III",
-    "Police Detective II",
-    "Police Detective I",
-    "Police Officer III+1",
-    "Police Officer III",
-    "Police Officer II",
-    "Police Officer I",
-    "Recruit Officer"
-]
-
-# Маппинг рангов на групповые роли
-RANK_TO_GROUP_ROLE = {
-    "Chief of Police": "Staff Officers",
-    "Assistant Chief of Police": "Staff Officers",
-    "Deputy Chief of Police": "Staff Officers",
-    "Police Commander": "Command Officers",
-    "Police Captain III": "Command Officers",
-    "Police Captain II": "Command Officers",
-    "Police Captain I": "Command Officers",
-    "Police Lieutenant II": "Police Supervisors",
-    "Police Lieutenant I": "Police Supervisors",
-    "Police Sergeant II": "Police Supervisors",
-    "Police Sergeant I": "Police Supervisors",
-    "Police Detective III": "Police Detectives",
-    "Police Detective II": "Police Detectives",
-    "Police Detective I": "Police Detectives",
-    "Police Officer III+1": "Police Officers",
-    "Police Officer III": "Police Officers",
-    "Police Officer II": "Police Officers",
-    "Police Officer I": "Police Officers",
-    "Recruit Officer": None  # Нет групповой роли
-}
-
 
 class RanksUtility(commands.Cog):
     """Утилиты для работы с рангами LSPD"""
@@ -163,68 +119,32 @@ class RanksUtility(commands.Cog):
             )
             return
 
-        created_ranks = []
-        failed_ranks = []
-
-        # Создаём пресеты для рангов
-        for i in range(start_index - 1, len(LSPD_RANKS)):
-            rank_name = LSPD_RANKS[i]
-
-            try:
-                # Ищем роль Discord по названию ранга
-                role = discord.utils.get(interaction.guild.roles, name=rank_name)
-
-                if not role:
-                    failed_ranks.append(f"{rank_name} (роль не найдена на сервере)")
-                    logger.warning(f"Роль '{rank_name}' не найдена на сервере")
-                    continue
-
-                # Определяем групповую роль для ранга
-                group_role_name = RANK_TO_GROUP_ROLE.get(rank_name)
-                group_role_id = None
-
-                if group_role_name:
-                    # Ищем групповую роль на сервере
-                    group_role = discord.utils.get(interaction.guild.roles, name=group_role_name)
-                    if group_role:
-                        group_role_id = group_role.id
-                        logger.info(f"Для ранга '{rank_name}' найдена групповая роль '{group_role_name}' (ID: {group_role_id})")
-                    else:
-                        logger.warning(f"Групповая роль '{group_role_name}' для ранга '{rank_name}' не найдена на сервере")
-
-                # Создаём пресет для ранга
-                async with self.bot.db_pool.acquire() as conn:
-                    # Проверяем, существует ли уже пресет с таким названием в этой категории
-                    existing = await conn.fetchval(
-                        "SELECT preset_id FROM role_presets WHERE name = $1 AND category_id = $2",
-                        rank_name,
-                        category_id
-                    )
-
-                    if existing:
-                        failed_ranks.append(f"{rank_name} (уже существует)")
-                        logger.info(f"Пресет для '{rank_name}' уже существует, пропускаем")
-                        continue
-
-                    # Создаём пресет с порядком сортировки (i = индекс в списке LSPD_RANKS)
-                    await conn.execute(
-                        "INSERT INTO role_presets (name, role_ids, created_by, created_at, category_id, rank_group_role_id, sort_order) "
-                        "VALUES ($1, $2, $3, $4, $5, $6, $7)",
-                        rank_name,
-                        [role.id],
-                        interaction.user.id,
-                        datetime.now(),
-                        category_id,
-                        group_role_id,
-                        i  # Порядок сортировки = индекс в списке
-                    )
-
-                created_ranks.append(rank_name)
-                logger.info(f"Создан пресет для ранга '{rank_name}' в категории {category['name']}")
-
-            except Exception as e:
-                failed_ranks.append(f"{rank_name} (ошибка: {str(e)})")
-                logger.error(f"Ошибка при создании пресета для '{rank_name}': {e}", exc_info=True)
+        # Создаём пресеты для рангов одним запросом
+        try:
+            async with self.bot.db_pool.acquire() as conn:
+                result = await provision_rank_presets(
+                    conn,
+                    interaction.guild,
+                    category_id,
+                    interaction.user.id,
+                    start_index - 1
+                )
+        except Exception as e:
+            logger.error(f"Ошибка при массовом создании рангов: {e}", exc_info=True)
+            await interaction.followup.send(
+                f"❌ Ошибка при создании пресетов рангов: {e}",
+                ephemeral=True
+            )
+            return
+        invalidate_preset_tree()
+
+        created_ranks = result['created']
+        failed_ranks = (
+            [f"{rank} (роль не найдена на сервере)" for rank in result['missing_roles']]
+            + [f"{rank} (уже существует)" for rank in result['existing']]
+        )
+        for rank_name in created_ranks:
+            logger.info(f"Создан пресет для ранга '{rank_name}' в категории {category['name']}")
 
         # Формируем ответ
         embed = discord.Embed(
@@ -253,7 +173,8 @@ class RanksUtility(commands.Cog):
         logger.info(f"Массовое создание рангов завершено: создано {len(created_ranks)}, пропущено {len(failed_ranks)}")
 
     @app_commands.command(name="delete_all_ranks", description="Удалить все пресеты рангов LSPD из БД")
-    async def delete_all_ranks(self, interaction: discord.Interaction):
+    @app_commands.describe(category_id="ID категории (по умолчанию - во всех категориях)")
+    async def delete_all_ranks(self, interaction: discord.Interaction, category_id: int = None):
         """Удаляет все пресеты рангов LSPD из базы данных"""
         if not await is_preset_admin(interaction.user):
             await interaction.response.send_message(
@@ -264,32 +185,21 @@ class RanksUtility(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
-        deleted_count = 0
-        not_found = []
+        try:
+            async with self.bot.db_pool.acquire() as conn:
+                per_category = await delete_rank_presets(conn, interaction.user.id, category_id)
+        except Exception as e:
+            logger.error(f"Ошибка при удалении пресетов рангов: {e}", exc_info=True)
+            await interaction.followup.send(
+                f"❌ Ошибка при удалении пресетов рангов: {e}",
+                ephemeral=True
+            )
+            return
+        invalidate_preset_tree()
 
-        async with self.bot.db_pool.acquire() as conn:
-            for rank_name in LSPD_RANKS:
-                try:
-                    # Проверяем существование пресета
-                    existing = await conn.fetchval(
-                        "SELECT preset_id FROM role_presets WHERE name = $1",
-                        rank_name
-                    )
-
-                    if existing:
-                        # Удаляем пресет
-                        await conn.execute(
-                            "DELETE FROM role_presets WHERE name = $1",
-                            rank_name
-                        )
-                        deleted_count += 1
-                        logger.info(f"Удален пресет для ранга '{rank_name}'")
-                    else:
-                        not_found.append(rank_name)
-
-                except Exception as e:
-                    logger.error(f"Ошибка при удалении пресета '{rank_name}': {e}", exc_info=True)
-                    not_found.append(f"{rank_name} (ошибка)")
+        deleted_count = sum(row['deleted'] for row in per_category)
+        deleted_names = {name for row in per_category for name in row['names']}
+        not_found = [rank_name for rank_name in LSPD_RANKS if rank_name not in deleted_names]
 
         # Формируем ответ
         embed = discord.Embed(
@@ -299,9 +209,13 @@ class RanksUtility(commands.Cog):
         )
 
         if deleted_count > 0:
+            lines = [
+                f"• {row['category_name'] or 'Без категории'}: {row['deleted']}"
+                for row in per_category
+            ]
             embed.add_field(
                 name=f"✅ Удалено ({deleted_count})",
-                value=f"Удалено {deleted_count} из {len(LSPD_RANKS)} рангов",
+                value="\n".join(lines[:25]),
                 inline=False
             )
 
@@ -312,8 +226,14 @@ class RanksUtility(commands.Cog):
                 inline=False
             )
 
+        if category_id is not None:
+            embed.set_footer(text=f"Категория ID: {category_id}")
+
         await interaction.followup.send(embed=embed, ephemeral=True)
-        logger.info(f"Удаление рангов завершено: удалено {deleted_count}, не найдено {len(not_found)}")
+        logger.info(
+            f"Удаление рангов завершено: удалено {deleted_count} в {len(per_category)} категориях, "
+            f"не найдено {len(not_found)}"
+        )
 
 
 async def setup(bot):
@@ -1,11 +1,11 @@
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 from bot.config import (
     ADM_ROLES_CH,
-    REMINDER_CHECK_MINUTES,
     REMINDER_FIRST_HOURS,
     REMINDER_SECOND_HOURS
 )
@@ -13,135 +13,201 @@ from bot.logger import get_logger
 
 logger = get_logger('reminders')
 
+# Минимальная пауза между проходами (в секундах): защищает от холостого цикла,
+# если наступившее напоминание не удалось отправить (нет канала, нет прав и т.п.)
+RETRY_SECONDS = 60
+# Через сколько повторять отправку напоминания, ответ на которое не удался (в секундах)
+FAILED_RETRY_SECONDS = 15 * 60
+
 
 class RemindersCog(commands.Cog):
+    """
+    Напоминания о неотработанных запросах.
+
+    Набор запросов, которым пора напомнить, вычисляется в SQL (частичный индекс
+    idx_requests_pending_reminders), после отправки все они обновляются одним
+    UPDATE. Между проходами задача спит до срока ближайшего напоминания, но не
+    меньше RETRY_SECONDS и не дольше REMINDER_FIRST_HOURS - раньше этого срока
+    напоминание для запроса, созданного во время сна, наступить не может.
+    Запросы, напоминание для которых отправить не удалось, повторяются не
+    раньше чем через FAILED_RETRY_SECONDS.
+    """
+
     def __init__(self, bot):
         self.bot = bot
-        self._task_started = False
+        self._task = None
+        self._failed = {}  # message_id -> время, раньше которого не повторять отправку
+
+    def _backed_off_ids(self, now: datetime) -> list:
+        self._failed = {message_id: until for message_id, until in self._failed.items() if until > now}
+        return list(self._failed)
 
-    def cog_unload(self):
-        if self._task_started:
-            self.reminder_task.cancel()
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
 
     @commands.Cog.listener()
     async def on_ready(self):
         """Запуск задачи напоминаний после готовности бота."""
-        if not self._task_started:
-            self.reminder_task.start()
-            self._task_started = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.reminder_loop())
             logger.info("Задача напоминаний запущена")
 
-    @tasks.loop(minutes=REMINDER_CHECK_MINUTES)
-    async def reminder_task(self):
-        """Проверка pending запросов и отправка напоминаний."""
-        try:
-            await self.check_pending_requests()
-        except Exception as e:
-            logger.error(f"Ошибка в задаче напоминаний: {e}", exc_info=True)
+    async def reminder_loop(self):
+        while True:
+            try:
+                await self.send_due_reminders(datetime.utcnow())
+                now = datetime.utcnow()
+                next_due = await self.fetch_next_due(self._backed_off_ids(now))
+            except Exception as e:
+                logger.error(f"Ошибка в задаче напоминаний: {e}", exc_info=True)
+                delay = RETRY_SECONDS
+            else:
+                delay = REMINDER_FIRST_HOURS * 3600
+                if next_due is not None:
+                    delay = min(delay, (next_due - now).total_seconds())
+                if self._failed:
+                    delay = min(delay, (min(self._failed.values()) - now).total_seconds())
+                # Срок уже прошел, но напоминание не отправлено - не крутимся вхолостую
+                delay = max(delay, RETRY_SECONDS)
+            await asyncio.sleep(delay)
+
+    async def fetch_due_requests(self, now: datetime, exclude_ids: list):
+        """
+        Запросы, для которых наступило первое или второе напоминание.
+
+        reminder_number - какое напоминание отправить: запрос старше
+        REMINDER_SECOND_HOURS без напоминаний (например, после простоя бота)
+        сразу получает второе, без отправки первого следом.
+        """
+        async with self.bot.db_pool.acquire() as conn:
+            return await conn.fetch(
+                """
+                SELECT message_id, CASE WHEN created_at <= $2 THEN 2 ELSE 1 END AS reminder_number
+                FROM requests
+                WHERE status = 'pending'
+                  AND (
+                    (COALESCE(reminder_count, 0) = 0 AND created_at <= $1)
+                    OR (COALESCE(reminder_count, 0) = 1 AND created_at <= $2)
+                  )
+                  AND NOT (message_id = ANY($3::bigint[]))
+                ORDER BY created_at
+                """,
+                now - timedelta(hours=REMINDER_FIRST_HOURS),
+                now - timedelta(hours=REMINDER_SECOND_HOURS),
+                exclude_ids
+            )
+
+    async def fetch_next_due(self, exclude_ids: list):
+        """Время ближайшего напоминания (None - напоминать некому)"""
+        async with self.bot.db_pool.acquire() as conn:
+            return await conn.fetchval(
+                """
+                SELECT MIN(created_at + CASE WHEN COALESCE(reminder_count, 0) = 0
+                                             THEN make_interval(hours => $1)
+                                             ELSE make_interval(hours => $2) END)
+                FROM requests
+                WHERE status = 'pending' AND COALESCE(reminder_count, 0) < 2
+                  AND NOT (message_id = ANY($3::bigint[]))
+                """,
+                REMINDER_FIRST_HOURS,
+                REMINDER_SECOND_HOURS,
+                exclude_ids
+            )
 
-    async def check_pending_requests(self):
-        """Проверяет все pending запросы и отправляет напоминания при необходимости."""
+    async def send_due_reminders(self, now: datetime) -> list:
+        """Отправка всех наступивших напоминаний; возвращает ID напомненных запросов"""
         # Проверка наличия пула БД
         if not hasattr(self.bot, 'db_pool') or self.bot.db_pool is None:
             logger.warning("База данных еще не инициализирована, пропускаем проверку")
-            return
+            return []
 
         channel = self.bot.get_channel(ADM_ROLES_CH)
         if not channel:
             logger.warning(f"Канал {ADM_ROLES_CH} не найден для напоминаний")
-            return
-
-        async with self.bot.db_pool.acquire() as conn:
-            # Получаем все pending запросы
-            rows = await conn.fetch(
-                """
-                SELECT message_id, created_at, reminder_count
-                FROM requests
-                WHERE status = 'pending'
-                """
-            )
+            return []
 
-        now = datetime.utcnow()
+        rows = await self.fetch_due_requests(now, self._backed_off_ids(now))
+        if not rows:
+            return []
 
+        reminded = []
+        reminder_numbers = []
+        deleted = []
         for row in rows:
+            message_id = row['message_id']
             try:
-                await self.process_request_reminder(channel, row, now)
+                result = await self.send_reminder(channel, message_id, row['reminder_number'])
             except Exception as e:
-                logger.error(f"Ошибка при обработке напоминания для {row['message_id']}: {e}", exc_info=True)
-
-    async def process_request_reminder(self, channel: discord.TextChannel, row, now: datetime):
-        """Обрабатывает одну запись и отправляет напоминание если нужно."""
-        message_id = row['message_id']
-        created_at = row['created_at']
-        reminder_count = row['reminder_count'] or 0
-
-        # Уже отправили максимум напоминаний
-        if reminder_count >= 2:
-            return
-
-        hours_since_creation = (now - created_at).total_seconds() / 3600
-        should_remind = False
-        is_first_reminder = False
-
-        if reminder_count == 0 and hours_since_creation >= REMINDER_FIRST_HOURS:
-            # Первое напоминание: прошло >= 2 часов от создания
-            should_remind = True
-            is_first_reminder = True
-        elif reminder_count == 1 and hours_since_creation >= REMINDER_SECOND_HOURS:
-            # Второе напоминание: прошло >= 6 часов от создания
-            should_remind = True
-            is_first_reminder = False
-
-        if not should_remind:
-            return
-
-        # Получаем сообщение
-        try:
-            message = await channel.fetch_message(message_id)
-        except discord.NotFound:
-            # Сообщение удалено - обновляем статус в БД
-            logger.warning(f"Сообщение {message_id} не найдено, помечаем как deleted")
+                logger.error(f"Ошибка при обработке напоминания для {message_id}: {e}", exc_info=True)
+                result = "failed"
+            if result == "sent":
+                reminded.append(message_id)
+                reminder_numbers.append(row['reminder_number'])
+            elif result == "deleted":
+                deleted.append(message_id)
+            else:
+                self._failed[message_id] = now + timedelta(seconds=FAILED_RETRY_SECONDS)
+
+        if reminded or deleted:
             async with self.bot.db_pool.acquire() as conn:
-                await conn.execute(
-                    "UPDATE requests SET status = 'deleted' WHERE message_id = $1",
-                    message_id
-                )
-            return
-        except discord.Forbidden:
-            logger.error(f"Нет доступа к сообщению {message_id}")
-            return
-
-        # Отправляем напоминание как ответ на сообщение
-        if is_first_reminder:
-            reminder_text = (
-                f"@here\n\n"
-                f"⏰ Неотработанный запрос на получение ролей. Прошло более {REMINDER_FIRST_HOURS} часов."
-            )
-        else:
-            reminder_text = (
-                f"@here\n\n"
-                f"⏰ Неотработанный запрос на получение ролей. Прошло более {REMINDER_SECOND_HOURS} часов."
-            )
+                async with conn.transaction():
+                    if reminded:
+                        updated = await conn.fetch(
+                            """
+                            UPDATE requests AS r
+                            SET last_reminder_at = $1, reminder_count = t.reminder_count
+                            FROM unnest($2::bigint[], $3::int[]) AS t(message_id, reminder_count)
+                            WHERE r.message_id = t.message_id
+                            RETURNING r.message_id, r.reminder_count
+                            """,
+                            now,
+                            reminded,
+                            reminder_numbers
+                        )
+                        logger.info(f"Отправлено напоминаний: {len(updated)}")
+                    if deleted:
+                        # Сообщения удалены - обновляем статус в БД
+                        await conn.execute(
+                            "UPDATE requests SET status = 'deleted' WHERE message_id = ANY($1::bigint[])",
+                            deleted
+                        )
+                        logger.warning(f"Сообщения запросов не найдены, помечены как deleted: {deleted}")
+        return reminded
+
+    async def send_reminder(self, channel: discord.TextChannel, message_id: int, reminder_number: int) -> str:
+        """
+        Ответ на сообщение запроса без предварительного fetch_message.
+
+        Returns:
+            str: sent | deleted | failed
+        """
+        hours = REMINDER_FIRST_HOURS if reminder_number == 1 else REMINDER_SECOND_HOURS
+        reminder_text = (
+            f"@here\n\n"
+            f"⏰ Неотработанный запрос на получение ролей. Прошло более {hours} часов."
+        )
 
         try:
-            await message.reply(reminder_text, allowed_mentions=discord.AllowedMentions(everyone=True))
-            logger.info(f"Отправлено напоминание #{reminder_count + 1} для запроса {message_id}")
-        except Exception as e:
-            logger.error(f"Не удалось отправить напоминание для {message_id}: {e}")
-            return
-
-        # Обновляем БД
-        async with self.bot.db_pool.acquire() as conn:
-            await conn.execute(
-                """
-                UPDATE requests
-                SET last_reminder_at = $1, reminder_count = $2
-                WHERE message_id = $3
-                """,
-                now,
-                reminder_count + 1,
-                message_id
+            await channel.get_partial_message(message_id).reply(
+                reminder_text, allowed_mentions=discord.AllowedMentions(everyone=True)
             )
+            logger.info(f"Отправлено напоминание #{reminder_number} для запроса {message_id}")
+            return "sent"
+        except discord.Forbidden:
+            logger.error(f"Нет доступа к сообщению {message_id}")
+            return "failed"
+        except discord.HTTPException as e:
+            # Ответ на удаленное сообщение отклоняется - проверяем, существует ли оно
+            try:
+                await channel.fetch_message(message_id)
+            except discord.NotFound:
+                logger.warning(f"Сообщение {message_id} не найдено, помечаем как deleted")
+                return "deleted"
+            except discord.HTTPException:
+                pass
+            logger.error(f"Не удалось отправить напоминание для {message_id}: {e}")
+            return "failed"
 
 
 async def setup(bot):
@@ -0,0 +1,131 @@
+import asyncio
+import time
+import traceback
+
+from gspread.exceptions import APIError
+
+from bot import config
+from bot.config import GSHEET_DEBOUNCE_SECONDS, GSHEET_MAX_WAIT_SECONDS
+from events.update_gsheet import sync_member_changes
+
+# Коды ответа Sheets API, после которых запись повторяется с задержкой
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 300
+
+
+class GSheetWriter:
+    """
+    Фоновая запись изменений ролей в Google Sheets.
+
+    Обработчики событий только ставят участника в очередь (schedule) и сразу
+    возвращаются. Повторные изменения одного участника в пределах окна
+    debounce_seconds сдвигают срок записи, но не дальше max_wait_seconds от
+    первого изменения; все участники, чей срок наступил, записываются одним
+    batch_update. При ограничении частоты запросов (429) и ошибках сервера
+    запись всех участников приостанавливается с экспоненциальной задержкой.
+    """
+
+    def __init__(
+        self,
+        bot,
+        debounce_seconds: float = GSHEET_DEBOUNCE_SECONDS,
+        max_wait_seconds: float = GSHEET_MAX_WAIT_SECONDS
+    ):
+        self.bot = bot
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._deadlines = {}  # member_id -> время записи (time.monotonic)
+        self._first_scheduled = {}  # member_id -> время первого незаписанного изменения
+        self._retry_after = 0.0  # до этого времени Sheets API не вызывается
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._failures = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, member_id: int):
+        """Поставить участника в очередь на запись (сдвигает срок при повторных изменениях)"""
+        now = time.monotonic()
+        first = self._first_scheduled.setdefault(member_id, now)
+        deadline = min(now + self.debounce_seconds, first + self.max_wait_seconds)
+        if now < self._retry_after:
+            # Во время задержки после ошибки новые изменения не приближают повтор
+            deadline = max(self._deadlines.get(member_id, 0), deadline)
+        self._deadlines[member_id] = deadline
+        self._wakeup.set()
+        self.start()
+
+    def _pop_due(self) -> list[int]:
+        now = time.monotonic()
+        due = [member_id for member_id, deadline in self._deadlines.items() if deadline <= now]
+        for member_id in due:
+            del self._deadlines[member_id]
+            self._first_scheduled.pop(member_id, None)
+        return due
+
+    async def _run(self):
+        while True:
+            try:
+                if not self._deadlines:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                delay = max(min(self._deadlines.values()), self._retry_after) - time.monotonic()
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._flush(self._pop_due())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка в фоновой записи Google Sheets: {e}")
+                traceback.print_exc()
+
+    async def _flush(self, member_ids: list[int]):
+        guild = self.bot.get_guild(config.GUILD.id)
+        if guild is None or not member_ids:
+            return
+
+        # Берем актуальное состояние участника на момент записи
+        members = [m for m in (guild.get_member(member_id) for member_id in member_ids) if m is not None]
+        if not members:
+            return
+
+        try:
+            count = await sync_member_changes(self.bot, members)
+            self._failures = 0
+            if count:
+                print(f"Google Sheets: обновлено {count} строк ({len(members)} участников в пакете).")
+        except APIError as e:
+            if e.code not in RETRY_STATUS_CODES:
+                # Записи журнала остаются несинхронизированными и попадут в плановое обновление
+                print(f"Ошибка Sheets API при записи ролей: {e}")
+                return
+
+            self._failures += 1
+            backoff = min(BACKOFF_BASE_SECONDS * 2 ** (self._failures - 1), BACKOFF_MAX_SECONDS)
+            retry_at = time.monotonic() + backoff
+            self._retry_after = retry_at
+            for member in members:
+                # Новые изменения за время ожидания не должны сдвигать повтор раньше задержки
+                self._deadlines[member.id] = max(self._deadlines.get(member.id, 0), retry_at)
+                self._first_scheduled.setdefault(member.id, retry_at)
+            print(f"Sheets API ограничивает запросы ({e.code}), повтор через {backoff} с")
@@ -0,0 +1,33 @@
+from discord import Guild, Role
+from discord.ext import commands
+
+from bot.role_index import role_index
+from bot.role_versions import bump_guild
+from models.fto_request import queue_roles
+
+
+async def setup_on_guild_update(bot: commands.Bot):
+    # Названия, цвета и позиции ролей входят в ответ /api/roles -
+    # любое изменение ролей сервера делает недействительными все ETag сервера
+
+    @bot.event
+    async def on_guild_role_create(role: Role):
+        bump_guild(role.guild.id)
+        role_index.role_created(role)
+        queue_roles.refresh(role.guild)
+
+    @bot.event
+    async def on_guild_role_update(before: Role, after: Role):
+        bump_guild(after.guild.id)
+        role_index.role_updated(after)
+        queue_roles.refresh(after.guild)
+
+    @bot.event
+    async def on_guild_role_delete(role: Role):
+        bump_guild(role.guild.id)
+        role_index.role_deleted(role)
+        queue_roles.refresh(role.guild)
+
+    @bot.event
+    async def on_guild_update(before: Guild, after: Guild):
+        bump_guild(after.id)
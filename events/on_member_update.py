@@ -1,18 +1,58 @@
-from discord import Member
+from discord import Member, User
 from discord.ext import commands
 
 from bot.config import ENABLE_GSHEETS
+from bot.role_feed import role_feed
+from bot.role_index import role_index
+from bot.role_versions import bump_member
 
 if ENABLE_GSHEETS:
-    from events.update_gsheet import update_roles_comment
+    from events.gsheet_writer import GSheetWriter
+    from events.update_gsheet import record_role_change
 
 
 async def setup_on_member_update(bot: commands.Bot):
+    if ENABLE_GSHEETS:
+        bot.gsheet_writer = GSheetWriter(bot)
+
     @bot.event
     async def on_member_update(before: Member, after: Member):
+        # Ответ /api/roles включает ник и аватар, поэтому версия меняется при любом обновлении
+        bump_member(after.guild.id, after.id)
+
         if before.roles != after.roles:
+            role_index.member_updated(before, after)
+            before_ids = {role.id for role in before.roles}
+            after_ids = {role.id for role in after.roles}
+            role_feed.publish(
+                after.guild.id,
+                after.id,
+                added=[{'id': str(r.id), 'name': r.name} for r in after.roles if r.id not in before_ids],
+                removed=[{'id': str(r.id), 'name': r.name} for r in before.roles if r.id not in after_ids],
+                roles=[str(r.id) for r in after.roles if not r.is_default()]
+            )
+
             if ENABLE_GSHEETS:
-                print(f"Роли пользователя {after.name} изменены. Обновляем таблицу...")
-                await update_roles_comment(after)
+                print(f"Роли пользователя {after.name} изменены. Запись в таблицу поставлена в очередь.")
+                await record_role_change(bot, after)
+                bot.gsheet_writer.schedule(after.id)
             else:
                 print(f"Роли пользователя {after.name} изменены (Google Sheets отключен).")
+
+    @bot.event
+    async def on_member_join(member: Member):
+        # После выхода и повторного входа ответ /api/roles другой - ETag не должен совпасть
+        bump_member(member.guild.id, member.id)
+        role_index.member_joined(member)
+
+    @bot.event
+    async def on_member_remove(member: Member):
+        bump_member(member.guild.id, member.id)
+        role_index.member_removed(member)
+
+    @bot.event
+    async def on_user_update(before: User, after: User):
+        # Смена глобального имени или аватара не вызывает on_member_update
+        for guild in bot.guilds:
+            if guild.get_member(after.id) is not None:
+                bump_member(guild.id, after.id)
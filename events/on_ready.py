@@ -1,9 +1,15 @@
+import asyncio
 import json
+import time
 import traceback
 
 import discord
 
-from bot.config import ENABLE_GSHEETS
+from bot.config import ENABLE_GSHEETS, RESTORE_VIEWS_CONCURRENCY
+from bot.preset_cache import get_preset_tree
+from bot.role_index import role_index
+from bot.role_versions import bump_guild
+from models.fto_request import queue_roles
 from models.roles_request import PersistentView, ButtonView
 
 if ENABLE_GSHEETS:
@@ -14,6 +20,16 @@ async def setup_on_ready(bot, ADM_ROLES_CH, CL_REQUEST_CH):
     @bot.event
     async def on_ready():
         print("Бот запущен и готов к работе.")
+
+        # Обратный индекс ролей (дальше поддерживается событиями)
+        started = time.perf_counter()
+        for guild in bot.guilds:
+            role_index.rebuild(guild)
+            # После переподключения кеш участников заменен, а изменения за время
+            # разрыва не пришли событиями - закешированные ответы /api/roles устарели
+            bump_guild(guild.id)
+            queue_roles.refresh(guild)
+        print(f"Индекс ролей построен за {time.perf_counter() - started:.2f} с")
         await initialize_channels(bot, ADM_ROLES_CH, CL_REQUEST_CH)
 
         # Обновление Google Sheets (если включено)
@@ -50,13 +66,15 @@ async def initialize_channels(bot, adm_channel_id, client_channel_id):
 async def update_table(bot):
     """Обновление комментариев в таблице."""
     print("Обновляем роли в таблице.")
-    await update_roles(bot)
+    # Полная сверка: изменения ролей, пока бот был выключен, не попали в журнал
+    await update_roles(bot, full=True)
     print("Завершили обновление ролей.")
 
 
 async def restore_pending_views(bot, adm_channel_id):
     """Восстановление views для pending запросов (без редактирования сообщений)."""
     print("Восстановление views для pending запросов...")
+    started = time.perf_counter()
 
     try:
         async with bot.db_pool.acquire() as conn:
@@ -69,41 +87,52 @@ async def restore_pending_views(bot, adm_channel_id):
             return
 
         adm_channel = bot.get_channel(adm_channel_id)
+        # Один снимок дерева пресетов на все восстанавливаемые views
+        tree = await get_preset_tree(bot.db_pool)
+        semaphore = asyncio.Semaphore(max(1, RESTORE_VIEWS_CONCURRENCY))
         restored = 0
-        deleted = 0
+        deleted_ids = []
 
-        for row in rows:
-            try:
-                # Проверяем существование сообщения на сервере
+        async def restore_one(row):
+            nonlocal restored
+            async with semaphore:
                 try:
-                    await adm_channel.fetch_message(row["message_id"])
+                    # Проверяем существование сообщения на сервере
+                    try:
+                        await adm_channel.fetch_message(row["message_id"])
+                    except discord.NotFound:
+                        # Сообщение удалено, статус обновим одним запросом в конце
+                        deleted_ids.append(row["message_id"])
+                        return
+
+                    user = adm_channel.guild.get_member(row["user_id"]) or bot.get_user(row["user_id"])
+                    if user is None:
+                        user = await bot.fetch_user(row["user_id"])
+                    embed = discord.Embed.from_dict(json.loads(row["embed"]))
+                    view = PersistentView(embed, user, bot, adm_channel.guild)
+                    await view.load_presets(tree)
+
+                    # Регистрируем view без редактирования сообщения
+                    bot.add_view(view, message_id=row["message_id"])
+                    restored += 1
                 except discord.NotFound:
-                    # Сообщение удалено, обновляем статус в БД
-                    async with bot.db_pool.acquire() as conn:
-                        await conn.execute(
-                            "UPDATE requests SET status = 'deleted' WHERE message_id = $1",
-                            row["message_id"]
-                        )
-                    print(f"Сообщение {row['message_id']} удалено, статус обновлен в БД")
-                    deleted += 1
-                    continue
-
-                user = await bot.fetch_user(row["user_id"])
-                embed = discord.Embed.from_dict(json.loads(row["embed"]))
-                view = PersistentView(embed, user, bot, adm_channel.guild)
-                await view.load_presets()
-
-                # Регистрируем view без редактирования сообщения
-                bot.add_view(view, message_id=row["message_id"])
-                restored += 1
-            except discord.NotFound:
-                print(f"Пользователь {row['user_id']} не найден, пропускаем")
-            except Exception as e:
-                print(f"Ошибка восстановления view для сообщения {row['message_id']}: {e}")
-
-        print(f"✅ Восстановлено {restored} views для pending запросов")
-        if deleted > 0:
-            print(f"🗑️ Обнаружено и помечено удаленными: {deleted} запросов")
+                    print(f"Пользователь {row['user_id']} не найден, пропускаем")
+                except Exception as e:
+                    print(f"Ошибка восстановления view для сообщения {row['message_id']}: {e}")
+
+        await asyncio.gather(*(restore_one(row) for row in rows))
+
+        if deleted_ids:
+            async with bot.db_pool.acquire() as conn:
+                await conn.execute(
+                    "UPDATE requests SET status = 'deleted' WHERE message_id = ANY($1::bigint[])",
+                    deleted_ids
+                )
+
+        elapsed = time.perf_counter() - started
+        print(f"✅ Восстановлено {restored} из {len(rows)} views для pending запросов за {elapsed:.2f} с")
+        if deleted_ids:
+            print(f"🗑️ Обнаружено и помечено удаленными: {len(deleted_ids)} запросов")
 
     except Exception as e:
         print(f"Ошибка при восстановлении views: {e}")
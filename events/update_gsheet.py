@@ -1,5 +1,9 @@
 import asyncio
+import hashlib
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
 import gspread
 from discord import Member
@@ -8,10 +12,12 @@ from oauth2client.service_account import ServiceAccountCredentials
 from bot import config
 from bot.config import (
     GOOGLE_SHEET_NAME,
+    GOOGLE_SHEET_KEY,
     GOOGLE_CREDENTIALS_FILE,
     GSHEET_WORKSHEET_NAME,
     GSHEET_USERNAME_COLUMN,
-    GSHEET_UPDATE_COLUMN
+    GSHEET_UPDATE_COLUMN,
+    GSHEET_INDEX_TTL_MINUTES
 )
 
 scope = [
@@ -19,136 +25,278 @@ scope = [
     "https://www.googleapis.com/auth/drive",
 ]
 
+# Сколько хранить уже синхронизированные записи журнала
+JOURNAL_RETENTION_DAYS = 30
+
 
 def _get_gsheet_client():
     """Синхронная функция для получения клиента Google Sheets"""
     creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_CREDENTIALS_FILE, scope)
-    return gspread.authorize(creds)
+    return gspread.authorize(creds), creds
 
 
-def _sync_update_roles(members_data: list[tuple[str, list[str]]]):
+class SheetSession:
     """
-    Синхронная функция для обновления ролей в Google Sheets.
-    members_data: список кортежей (discord_username, roles_list)
+    Долгоживущие клиент, таблица и лист Google Sheets.
+
+    Авторизация выполняется один раз и повторяется только когда истек токен
+    или API вернул ошибку авторизации. Таблица открывается по ключу
+    (GOOGLE_SHEET_KEY); если ключ не задан, он один раз определяется по имени.
+    Используется только из потока _sheets_executor.
     """
-    client = _get_gsheet_client()
-    sheet = client.open(GOOGLE_SHEET_NAME).worksheet(GSHEET_WORKSHEET_NAME)
-    data = sheet.get_all_values()
-
-    requests = []
-    for member_str, roles in members_data:
-        for i, row in enumerate(data):
-            discord_username = row[GSHEET_USERNAME_COLUMN]
-            if discord_username == member_str:
-                if roles:
-                    comment = "Роли:\n" + "\n".join(roles)
-                    requests.append(
-                        {
-                            "updateCells": {
-                                "range": {
-                                    "sheetId": sheet.id,
-                                    "startRowIndex": i,
-                                    "endRowIndex": i + 1,
-                                    "startColumnIndex": GSHEET_UPDATE_COLUMN,
-                                    "endColumnIndex": GSHEET_UPDATE_COLUMN + 1,
-                                },
-                                "rows": [
-                                    {
-                                        "values": [
-                                            {
-                                                "userEnteredValue": {
-                                                    "stringValue": "+"
-                                                },
-                                                "note": comment,
-                                            }
-                                        ]
-                                    }
-                                ],
-                                "fields": "userEnteredValue,note",
-                            }
-                        }
-                    )
-                else:
-                    requests.append(
-                        {
-                            "updateCells": {
-                                "range": {
-                                    "sheetId": sheet.id,
-                                    "startRowIndex": i,
-                                    "endRowIndex": i + 1,
-                                    "startColumnIndex": GSHEET_UPDATE_COLUMN,
-                                    "endColumnIndex": GSHEET_UPDATE_COLUMN + 1,
-                                },
-                                "rows": [
-                                    {
-                                        "values": [
-                                            {
-                                                "userEnteredValue": {
-                                                    "stringValue": "-"
-                                                },
-                                                "note": "",
-                                            }
-                                        ]
-                                    }
-                                ],
-                                "fields": "userEnteredValue,note",
-                            }
-                        }
-                    )
-
-    if requests:
-        sheet.spreadsheet.batch_update({"requests": requests})
-        return len(requests)
-    return 0
-
-
-def _sync_update_roles_comment(member_str: str, roles: list[str]):
-    """Синхронная функция для обновления комментария одного пользователя"""
-    client = _get_gsheet_client()
-    main_sheet = client.open(GOOGLE_SHEET_NAME).worksheet(GSHEET_WORKSHEET_NAME)
-    main_data = main_sheet.get_all_values()
-
-    for i, row in enumerate(main_data):
-        discord_username = row[GSHEET_USERNAME_COLUMN]
-        if discord_username == member_str:
-            if roles:
-                comment = "Роли:\n" + "\n".join(roles)
-                cell_value = "+"
-            else:
-                comment = ""
-                cell_value = "-"
-
-            requests = {
-                "updateCells": {
-                    "range": {
-                        "sheetId": main_sheet.id,
-                        "startRowIndex": i,
-                        "endRowIndex": i + 1,
-                        "startColumnIndex": GSHEET_UPDATE_COLUMN,
-                        "endColumnIndex": GSHEET_UPDATE_COLUMN + 1,
-                    },
-                    "rows": [
+
+    def __init__(self):
+        self._client = None
+        self._creds = None
+        self._sheet_key = GOOGLE_SHEET_KEY or None
+        self._worksheet = None
+
+    def _token_expired(self) -> bool:
+        return bool(getattr(self._creds, "access_token_expired", False))
+
+    def invalidate(self):
+        """Сбросить клиент и лист (следующий вызов авторизуется заново)"""
+        self._client = None
+        self._creds = None
+        self._worksheet = None
+
+    def worksheet(self):
+        if self._client is None or self._token_expired():
+            self._client, self._creds = _get_gsheet_client()
+            self._worksheet = None
+
+        if self._worksheet is None:
+            if self._sheet_key is None:
+                # Поиск по имени через Drive выполняется только один раз
+                self._sheet_key = self._client.open(GOOGLE_SHEET_NAME).id
+                print(f"Таблица '{GOOGLE_SHEET_NAME}' найдена, ключ: {self._sheet_key}")
+            spreadsheet = self._client.open_by_key(self._sheet_key)
+            self._worksheet = spreadsheet.worksheet(GSHEET_WORKSHEET_NAME)
+        return self._worksheet
+
+
+# Все обращения к Sheets идут через один поток и одну сессию
+_sheets_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gsheets")
+_session = SheetSession()
+
+
+async def run_in_sheets_thread(func, *args):
+    """Выполнение блокирующего вызова gspread в выделенном потоке"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_sheets_executor, func, *args)
+
+
+def _render_roles(roles: list[str]) -> tuple[str, str]:
+    """Значение ячейки и примечание для списка ролей"""
+    if roles:
+        return "+", "Роли:\n" + "\n".join(roles)
+    return "-", ""
+
+
+def _value_hash(cell_value: str, note: str) -> str:
+    return hashlib.sha1(f"{cell_value}\n{note}".encode("utf-8")).hexdigest()
+
+
+def _member_roles(member: Member) -> list[str]:
+    return [role.name for role in member.roles if role.name != "@everyone"]
+
+
+def _cell_request(sheet_id: int, row_index: int, cell_value: str, note: str) -> dict:
+    return {
+        "updateCells": {
+            "range": {
+                "sheetId": sheet_id,
+                "startRowIndex": row_index,
+                "endRowIndex": row_index + 1,
+                "startColumnIndex": GSHEET_UPDATE_COLUMN,
+                "endColumnIndex": GSHEET_UPDATE_COLUMN + 1,
+            },
+            "rows": [
+                {
+                    "values": [
                         {
-                            "values": [
-                                {
-                                    "userEnteredValue": {
-                                        "stringValue": cell_value
-                                    },
-                                    "note": comment,
-                                }
-                            ]
+                            "userEnteredValue": {
+                                "stringValue": cell_value
+                            },
+                            "note": note,
                         }
-                    ],
-                    "fields": "userEnteredValue,note",
+                    ]
                 }
-            }
-            main_sheet.spreadsheet.batch_update({"requests": requests})
-            return True
-    return False
+            ],
+            "fields": "userEnteredValue,note",
+        }
+    }
+
+
+class RosterIndex:
+    """
+    Кеш соответствия Discord username -> индексы строк в листе (при
+    дубликатах никнейма записываются все строки, как и при прежнем поиске).
+
+    Загружается чтением только колонки с никнеймами и живет между
+    синхронизациями. Перечитывается, когда истек TTL, когда никнейм не найден
+    или когда проверка целевых строк показала, что строки в листе сдвинулись.
+    """
+
+    # Не перечитывать колонку из-за промахов чаще, чем раз в это время
+    MIN_REFRESH_SECONDS = 60
+    # При большем числе целевых строк дешевле перечитать колонку, чем проверять ячейки
+    MAX_VERIFY_ROWS = 100
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.rows = {}
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def _reload(self, sheet):
+        usernames = sheet.col_values(GSHEET_USERNAME_COLUMN + 1)
+        rows = {}
+        for i, username in enumerate(usernames):
+            if username:
+                rows.setdefault(username, []).append(i)
+        self.rows = rows
+        self.loaded_at = time.monotonic()
+
+    def _age(self) -> float:
+        return time.monotonic() - self.loaded_at if self.loaded_at is not None else float("inf")
+
+    def _verify(self, sheet, targets: dict[str, list[int]]) -> bool:
+        """Одним запросом проверяет, что в найденных строках все еще те же никнеймы"""
+        cells = [(username, row) for username, rows in targets.items() for row in rows]
+        ranges = [gspread.utils.rowcol_to_a1(row + 1, GSHEET_USERNAME_COLUMN + 1) for _, row in cells]
+        values = sheet.batch_get(ranges)
+        for (username, _), value in zip(cells, values):
+            cell = value[0][0] if value and value[0] else ""
+            if cell != username:
+                return False
+        return True
+
+    def resolve(self, sheet, usernames) -> dict[str, list[int]]:
+        """Индексы строк для указанных никнеймов (не найденные в листе пропускаются)"""
+        with self._lock:
+            if self._age() > self.ttl_seconds:
+                self._reload(sheet)
+                reloaded = True
+            else:
+                reloaded = False
+
+            targets = {u: self.rows[u] for u in usernames if u in self.rows}
+            missing = len(targets) < len(usernames)
+
+            if not reloaded and missing and self._age() > self.MIN_REFRESH_SECONDS:
+                self._reload(sheet)
+                reloaded = True
+                targets = {u: self.rows[u] for u in usernames if u in self.rows}
 
+            if not reloaded and targets:
+                if sum(map(len, targets.values())) > self.MAX_VERIFY_ROWS or not self._verify(sheet, targets):
+                    self._reload(sheet)
+                    targets = {u: self.rows[u] for u in usernames if u in self.rows}
 
-async def update_roles(bot):
-    """Асинхронная функция для обновления ролей в Google Sheets"""
+            return targets
+
+
+_roster_index = RosterIndex(GSHEET_INDEX_TTL_MINUTES * 60)
+
+
+def _sync_write_rows(rows: dict[str, tuple[str, str]]) -> list[str]:
+    """
+    Синхронная функция записи измененных строк одним batch_update.
+    rows: {discord_username: (значение ячейки, примечание)}
+    Возвращает список username, найденных в таблице и записанных.
+    """
+    try:
+        sheet = _session.worksheet()
+        targets = _roster_index.resolve(sheet, list(rows))
+
+        requests = [
+            _cell_request(sheet.id, row_index, *rows[username])
+            for username, row_indexes in targets.items()
+            for row_index in row_indexes
+        ]
+        if requests:
+            sheet.spreadsheet.batch_update({"requests": requests})
+        return list(targets)
+    except gspread.exceptions.APIError as e:
+        if e.code in (401, 403, 404):
+            # Токен отозван, доступ изменен или лист переименован - переоткроем при следующем вызове
+            _session.invalidate()
+        raise
+
+
+async def sync_members(bot, members: list[Member], force: bool = False) -> int:
+    """
+    Запись в таблицу только тех участников, чье значение отличается от
+    последнего записанного (по хешу из gsheet_row_state).
+    force=True - запись всех найденных строк без сравнения хешей: хеш отражает
+    то, что записал бот, а не содержимое таблицы, поэтому правки вручную и
+    пересозданные строки исправляются только так.
+    Возвращает число обновленных строк.
+    """
+    rendered = {}
+    for member in members:
+        cell_value, note = _render_roles(_member_roles(member))
+        rendered[str(member)] = (cell_value, note, _value_hash(cell_value, note))
+
+    if not rendered:
+        return 0
+
+    known_hashes = {}
+    if not force:
+        async with bot.db_pool.acquire() as conn:
+            known = await conn.fetch(
+                "SELECT username, value_hash FROM gsheet_row_state WHERE username = ANY($1::text[])",
+                list(rendered)
+            )
+        known_hashes = {row['username']: row['value_hash'] for row in known}
+
+    changed = {
+        username: (cell_value, note)
+        for username, (cell_value, note, value_hash) in rendered.items()
+        if known_hashes.get(username) != value_hash
+    }
+    if not changed:
+        return 0
+
+    # Выполнение блокирующих операций в потоке Google Sheets
+    written = await run_in_sheets_thread(_sync_write_rows, changed)
+
+    if written:
+        async with bot.db_pool.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO gsheet_row_state (username, value_hash, synced_at)
+                SELECT username, value_hash, NOW()
+                FROM unnest($1::text[], $2::text[]) AS t(username, value_hash)
+                ON CONFLICT (username) DO UPDATE
+                SET value_hash = EXCLUDED.value_hash, synced_at = EXCLUDED.synced_at
+                """,
+                written,
+                [rendered[username][2] for username in written]
+            )
+    return len(written)
+
+
+async def record_role_change(bot, member: Member):
+    """Запись изменения ролей участника в журнал"""
+    async with bot.db_pool.acquire() as conn:
+        await conn.execute(
+            "INSERT INTO role_change_journal (user_id, username) VALUES ($1, $2)",
+            member.id,
+            str(member)
+        )
+
+
+async def update_roles(bot, full: bool = False):
+    """
+    Асинхронная функция для обновления ролей в Google Sheets.
+
+    full=False - только участники из несинхронизированных записей журнала.
+    full=True - все участники сервера (нужно после простоя бота, когда
+    изменения ролей не попали в журнал); перезаписываются все найденные в
+    таблице строки одним batch_update, включая исправленные вручную.
+    """
     try:
         guild = bot.get_guild(config.GUILD.id)
         if guild is None:
@@ -159,17 +307,32 @@ async def update_roles(bot):
 
         print(f"Гильдия найдена: {guild.name} (ID: {guild.id})")
 
-        # Подготовка данных в основном потоке
-        members_data = []
-        for member in guild.members:
-            roles = [role.name for role in member.roles if role.name != "@everyone"]
-            members_data.append((str(member), roles))
+        async with bot.db_pool.acquire() as conn:
+            journal = await conn.fetch(
+                "SELECT journal_id, user_id FROM role_change_journal WHERE synced_at IS NULL ORDER BY journal_id"
+            )
+
+        if full:
+            members = list(guild.members)
+        else:
+            user_ids = {row['user_id'] for row in journal}
+            members = [m for m in (guild.get_member(user_id) for user_id in user_ids) if m is not None]
 
-        # Выполнение блокирующих операций в отдельном потоке
-        count = await asyncio.to_thread(_sync_update_roles, members_data)
+        count = await sync_members(bot, members, force=full)
+
+        async with bot.db_pool.acquire() as conn:
+            if journal:
+                await conn.execute(
+                    "UPDATE role_change_journal SET synced_at = NOW() WHERE synced_at IS NULL AND journal_id <= $1",
+                    journal[-1]['journal_id']
+                )
+            await conn.execute(
+                "DELETE FROM role_change_journal WHERE synced_at < NOW() - make_interval(days => $1)",
+                JOURNAL_RETENTION_DAYS
+            )
 
         if count:
-            print(f"Добавлено {count} комментариев.")
+            print(f"Обновлено {count} строк (проверено участников: {len(members)}).")
         else:
             print("Нет данных для обновления.")
 
@@ -178,18 +341,16 @@ async def update_roles(bot):
         traceback.print_exc()
 
 
-async def update_roles_comment(member: Member):
-    """Асинхронная функция для обновления комментария одного пользователя"""
-    try:
-        member_str = str(member)
-        roles = [role.name for role in member.roles if role.name != "@everyone"]
-
-        # Выполнение блокирующих операций в отдельном потоке
-        success = await asyncio.to_thread(_sync_update_roles_comment, member_str, roles)
-
-        if success:
-            print(f"Комментарий для {member.name} обновлен.")
+async def sync_member_changes(bot, members: list[Member]) -> int:
+    """
+    Синхронизация конкретных участников и отметка их записей журнала.
+    Ошибки Sheets API пробрасываются вызывающему (фоновый писатель делает повтор).
+    """
+    count = await sync_members(bot, members)
 
-    except Exception as e:
-        print(f"Ошибка при обновлении комментария для {member.name}: {e}")
-        traceback.print_exc()
+    async with bot.db_pool.acquire() as conn:
+        await conn.execute(
+            "UPDATE role_change_journal SET synced_at = NOW() WHERE user_id = ANY($1::bigint[]) AND synced_at IS NULL",
+            [member.id for member in members]
+        )
+    return count
@@ -0,0 +1,101 @@
+"""
+Пакетный подбор пар FTO - стажер по всей очереди.
+
+Совместимость: если у обоих указаны отделы (роли отделов из категорий
+пресетов), нужен хотя бы один общий отдел; без отдела участник совместим со
+всеми. Справедливость по времени ожидания: стажеры обрабатываются от самого
+давнего, каждому сначала предлагается самый давно ждущий совместимый FTO.
+
+Алгоритм - жадное начальное распределение и затем поиск увеличивающих
+путей (алгоритм Куна) только для оставшихся без пары стажеров. Результат -
+максимальное паросочетание: уже получившие пару стажеры при перестановках
+ее не теряют, поэтому более давние стажеры не вытесняются новыми.
+"""
+
+
+def _compatible(fto: dict, intern: dict) -> bool:
+    if not fto['divisions'] or not intern['divisions']:
+        return True
+    return bool(fto['divisions'] & intern['divisions'])
+
+
+def _adjacency(ftos: list, interns: list) -> list:
+    """Для каждого стажера - индексы совместимых FTO в порядке ожидания"""
+    anywhere = [i for i, fto in enumerate(ftos) if not fto['divisions']]
+    by_division = {}
+    for i, fto in enumerate(ftos):
+        for division in fto['divisions']:
+            by_division.setdefault(division, []).append(i)
+
+    everyone = list(range(len(ftos)))
+    adjacency = []
+    for intern in interns:
+        if not intern['divisions']:
+            adjacency.append(everyone)
+            continue
+        candidates = set(anywhere)
+        for division in intern['divisions']:
+            candidates.update(by_division.get(division, ()))
+        adjacency.append(sorted(candidates))
+    return adjacency
+
+
+def match_pairs(ftos: list, interns: list) -> list:
+    """
+    Подбор пар.
+
+    Args:
+        ftos, interns: записи очереди с ключами created_at и divisions (frozenset ID ролей отделов)
+
+    Returns:
+        list: пары (fto, intern), от самого давнего стажера
+    """
+    ftos = sorted(ftos, key=lambda e: e['created_at'])
+    interns = sorted(interns, key=lambda e: e['created_at'])
+    adjacency = _adjacency(ftos, interns)
+
+    fto_match = [None] * len(ftos)  # индекс FTO -> индекс стажера
+    intern_match = [None] * len(interns)
+
+    # Жадно: самый давний стажер получает самого давнего свободного совместимого FTO
+    for i, candidates in enumerate(adjacency):
+        for f in candidates:
+            if fto_match[f] is None:
+                fto_match[f] = i
+                intern_match[i] = f
+                break
+
+    def augment(root):
+        """Поиск увеличивающего пути от стажера root (итеративный DFS, без ограничения глубины рекурсии)"""
+        visited = set()
+        stack = [(root, iter(adjacency[root]))]
+        path = []  # FTO, который пробует стажер на каждом уровне stack
+        while stack:
+            i, candidates = stack[-1]
+            for f in candidates:
+                if f in visited:
+                    continue
+                visited.add(f)
+                path.append(f)
+                if fto_match[f] is None:
+                    for (intern_index, _), fto_index in zip(stack, path):
+                        fto_match[fto_index] = intern_index
+                        intern_match[intern_index] = fto_index
+                    return True
+                # FTO занят - пробуем переназначить его стажера
+                stack.append((fto_match[f], iter(adjacency[fto_match[f]])))
+                break
+            else:
+                stack.pop()
+                if path:
+                    path.pop()
+        return False
+
+    free_ftos = fto_match.count(None)
+    for i in range(len(interns)):
+        if free_ftos == 0:
+            break
+        if intern_match[i] is None and adjacency[i] and augment(i):
+            free_ftos -= 1
+
+    return [(ftos[f], interns[i]) for i, f in enumerate(intern_match) if f is not None]
@@ -0,0 +1,373 @@
+"""
+Состояние FTO очереди и планировщик истечения записей.
+
+Один экземпляр на бота (bot.fto_queue) вместо фоновой задачи в каждом FTOView.
+Сообщения FTO Search хранятся в таблице fto_boards и перерисовываются сразу
+после запуска, без ожидания нажатия кнопки.
+Активные записи таблицы queue держатся в памяти (загружаются при запуске и
+меняются только после успешной записи в БД), embed сообщений FTO Search
+генерируется из них целиком. Изменения за интервал FTO_BOARD_EDIT_INTERVAL
+объединяются в одно редактирование каждого сообщения.
+
+Сроки истечения хранятся в min-heap: задача спит до ближайшего срока (или до
+появления записи, если очередь пуста) и завершает все наступившие записи
+одним UPDATE.
+
+При FTO_MATCH_WINDOW_SECONDS > 0 пары не подбираются при входе в очередь:
+после появления новых записей и истечения окна подбор выполняется по всей
+очереди сразу (models/fto_matching.py).
+"""
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+
+import discord
+
+from bot.config import FTO_QUEUE_CLEANUP_HOURS, FTO_BOARD_EDIT_INTERVAL, FTO_MATCH_WINDOW_SECONDS, GUILD
+from bot.logger import get_logger
+from bot.preset_cache import get_preset_tree
+from bot.role_index import role_index
+from models.fto_matching import match_pairs
+from models.fto_request import build_queue_embed
+
+logger = get_logger('fto_queue')
+
+# Через сколько повторить истечение, если запрос к БД завершился ошибкой
+RETRY_SECONDS = 60
+# Сколько личных сообщений об истечении отправлять одновременно
+NOTIFY_CONCURRENCY = 5
+
+
+class FTOQueueScheduler:
+    def __init__(
+        self,
+        bot,
+        ttl: timedelta = timedelta(hours=FTO_QUEUE_CLEANUP_HOURS),
+        edit_interval: float = FTO_BOARD_EDIT_INTERVAL,
+        match_window: float = FTO_MATCH_WINDOW_SECONDS
+    ):
+        self.bot = bot
+        self.ttl = ttl
+        self.edit_interval = edit_interval
+        self.match_window = match_window
+        self.boards = {}  # message_id -> channel_id сообщений FTO Search
+        # queue_id -> запись (ключи как у строки queue), в порядке входа в очередь
+        self.entries = {}
+        self._heap = []  # (срок истечения, queue_id)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._render_task = None
+        self._dirty = False
+        self._match_task = None
+        self._match_pending = False
+
+    @property
+    def batch_matching(self) -> bool:
+        """Пары подбираются пакетно, а не при входе в очередь"""
+        return self.match_window > 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._render_task, self._match_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._render_task = None
+        self._match_task = None
+
+    async def register_board(self, channel_id: int, message_id: int):
+        """Запомнить сообщение FTO Search (в памяти и в fto_boards)"""
+        if self.boards.get(message_id) == channel_id:
+            return
+        self.boards[message_id] = channel_id
+        async with self.bot.db_pool.acquire() as conn:
+            await conn.execute(
+                "INSERT INTO fto_boards (message_id, channel_id) VALUES ($1, $2) ON CONFLICT (message_id) DO NOTHING",
+                message_id,
+                channel_id
+            )
+
+    async def _forget_board(self, message_id: int):
+        self.boards.pop(message_id, None)
+        try:
+            async with self.bot.db_pool.acquire() as conn:
+                await conn.execute("DELETE FROM fto_boards WHERE message_id = $1", message_id)
+        except Exception as e:
+            logger.error(f"Не удалось удалить сообщение {message_id} из fto_boards: {e}", exc_info=True)
+
+    # ---- Состояние очереди ----
+
+    def add(self, queue_id: int, officer_id: int | None, probationary_id: int | None, display_name: str, created_at: datetime):
+        """Запись добавлена в таблицу queue"""
+        self.entries[queue_id] = {
+            'queue_id': queue_id,
+            'officer_id': officer_id,
+            'probationary_id': probationary_id,
+            'display_name': display_name,
+            'created_at': created_at
+        }
+        self.schedule(queue_id, created_at)
+        self.request_render()
+        if self.batch_matching:
+            self.request_match()
+
+    def discard(self, queue_ids):
+        """Записи завершены (пара найдена, выход из очереди или истечение)"""
+        removed = [self.entries.pop(queue_id) for queue_id in queue_ids if queue_id in self.entries]
+        if removed:
+            self.request_render()
+        return removed
+
+    def render_embed(self) -> discord.Embed:
+        interns = [e['display_name'] for e in self.entries.values() if e['probationary_id']]
+        ftos = [e['display_name'] for e in self.entries.values() if e['officer_id']]
+        return build_queue_embed(interns, ftos)
+
+    def request_render(self):
+        """Запланировать перерисовку сообщений; изменения за интервал объединяются"""
+        self._dirty = True
+        if self._render_task is None or self._render_task.done():
+            self._render_task = asyncio.create_task(self._render_boards())
+
+    async def _render_boards(self):
+        while self._dirty:
+            await asyncio.sleep(self.edit_interval)
+            self._dirty = False
+            embed = self.render_embed()
+
+            for message_id, channel_id in list(self.boards.items()):
+                # Частичное сообщение: редактирование без fetch_message и без кеша каналов
+                message = self.bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+                try:
+                    await message.edit(embed=embed)
+                except discord.NotFound:
+                    logger.warning(f"Сообщение {message_id} не найдено, удаляем из fto_boards.")
+                    await self._forget_board(message_id)
+                except discord.Forbidden:
+                    logger.error(f"Нет прав для редактирования сообщения {message_id}.")
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении сообщения: {e}")
+
+    # ---- Пакетный подбор пар ----
+
+    def request_match(self):
+        """Запланировать подбор пар; все входы за окно обрабатываются одним подбором"""
+        self._match_pending = True
+        if self._match_task is None or self._match_task.done():
+            self._match_task = asyncio.create_task(self._match_loop())
+
+    async def _match_loop(self):
+        while self._match_pending:
+            await asyncio.sleep(self.match_window)
+            self._match_pending = False
+            try:
+                await self.run_matching()
+            except Exception as e:
+                logger.error(f"Ошибка при подборе пар FTO очереди: {e}", exc_info=True)
+
+    async def _division_resolver(self):
+        """Функция user_id -> frozenset ID ролей отделов (department_role_id категорий пресетов)"""
+        tree = await get_preset_tree(self.bot.db_pool)
+        department_roles = {
+            c['department_role_id'] for c in tree.categories.values() if c.get('department_role_id')
+        }
+        guild = self.bot.get_guild(GUILD.id)
+
+        def divisions(user_id: int) -> frozenset:
+            member = guild.get_member(user_id) if guild else None
+            if member is None or not department_roles:
+                return frozenset()
+            return frozenset(role_id for role_id in department_roles if role_index.has_role(member, role_id))
+
+        return divisions
+
+    async def run_matching(self) -> list:
+        """Подбор пар по всей очереди и их закрытие в БД одной транзакцией"""
+        ftos = [e for e in self.entries.values() if e['officer_id']]
+        interns = [e for e in self.entries.values() if e['probationary_id']]
+        if not ftos or not interns:
+            return []
+
+        divisions = await self._division_resolver()
+        pairs = match_pairs(
+            [{**e, 'divisions': divisions(e['officer_id'])} for e in ftos],
+            [{**e, 'divisions': divisions(e['probationary_id'])} for e in interns]
+        )
+        if not pairs:
+            return []
+
+        queue_ids = [entry['queue_id'] for pair in pairs for entry in pair]
+        async with self.bot.db_pool.acquire() as conn:
+            async with conn.transaction():
+                # Та же блокировка, что и в fto_enqueue
+                await conn.execute("SELECT pg_advisory_xact_lock(hashtext('fto_queue'))")
+                active = {
+                    row['queue_id'] for row in await conn.fetch(
+                        "SELECT queue_id FROM queue WHERE queue_id = ANY($1::int[]) AND finished_at IS NULL FOR UPDATE",
+                        queue_ids
+                    )
+                }
+                # Пара закрывается, только если оба участника все еще в очереди
+                pairs = [(f, i) for f, i in pairs if f['queue_id'] in active and i['queue_id'] in active]
+                if pairs:
+                    await conn.execute(
+                        "UPDATE queue SET finished_at = $2 WHERE queue_id = ANY($1::int[])",
+                        [entry['queue_id'] for pair in pairs for entry in pair],
+                        datetime.now()
+                    )
+
+        inactive = [queue_id for queue_id in queue_ids if queue_id not in active]
+        if inactive:
+            # Участник вышел между снимком и блокировкой: его запись убираем, а
+            # оставшийся без пары партнер участвует в повторном подборе, не дожидаясь
+            # следующего входа в очередь
+            self.discard(inactive)
+            self.request_match()
+
+        if not pairs:
+            return []
+
+        self.discard([entry['queue_id'] for pair in pairs for entry in pair])
+
+        semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+        async def notify(fto, intern):
+            async with semaphore:
+                await self.notify_pair(fto, intern)
+
+        await asyncio.gather(*(notify(fto, intern) for fto, intern in pairs))
+        logger.info(f"Подобрано {len(pairs)} пар FTO очереди (FTO: {len(ftos)}, стажеров: {len(interns)})")
+        return pairs
+
+    async def notify_pair(self, fto, intern):
+        messages = (
+            (fto['officer_id'], f"🎉 Вы нашли стажёра: <@{intern['probationary_id']}> ({intern['display_name']})!"),
+            (intern['probationary_id'], f"🎉 Вы нашли FTO: <@{fto['officer_id']}> ({fto['display_name']})!"),
+        )
+        for user_id, text in messages:
+            user = self.bot.get_user(user_id)
+            if not user:
+                continue
+            try:
+                await user.send(text)
+            except Exception as e:
+                logger.warning(f"Не удалось отправить уведомление о паре пользователю {user_id}: {e}")
+
+    # ---- Истечение записей ----
+
+    def schedule(self, queue_id: int, created_at: datetime):
+        """Добавить срок истечения записи; будит планировщик, если он ближайший"""
+        deadline = created_at + self.ttl
+        earliest = self._heap[0][0] if self._heap else None
+        heapq.heappush(self._heap, (deadline, queue_id))
+        if earliest is None or deadline < earliest:
+            self._wakeup.set()
+
+    async def load(self):
+        """Загрузка сообщений FTO Search и всех активных записей из БД"""
+        async with self.bot.db_pool.acquire() as conn:
+            boards = await conn.fetch("SELECT message_id, channel_id FROM fto_boards")
+            rows = await conn.fetch(
+                "SELECT queue_id, officer_id, probationary_id, display_name, created_at "
+                "FROM queue WHERE finished_at IS NULL ORDER BY created_at"
+            )
+        self.boards.update((row['message_id'], row['channel_id']) for row in boards)
+        self.entries = {row['queue_id']: dict(row) for row in rows}
+        self._heap = [(row['created_at'] + self.ttl, row['queue_id']) for row in rows]
+        heapq.heapify(self._heap)
+        logger.info(f"Загружено {len(self._heap)} активных записей FTO очереди, сообщений FTO Search: {len(self.boards)}")
+        # Сообщения приводятся к актуальному состоянию сразу после запуска
+        self.request_render()
+        if self.batch_matching:
+            self.request_match()
+
+    def _pop_due(self, now: datetime) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    async def _run(self):
+        await self.bot.wait_until_ready()
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Не удалось загрузить FTO очередь: {e}", exc_info=True)
+
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                # Очередь пуста - ждем новую запись без опроса БД
+                await self._wakeup.wait()
+                continue
+
+            delay = (self._heap[0][0] - datetime.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = datetime.now()
+            due = self._pop_due(now)
+            try:
+                await self.expire(due, now)
+            except Exception as e:
+                logger.error(f"Ошибка при очистке FTO очереди: {e}", exc_info=True)
+                retry_at = now + timedelta(seconds=RETRY_SECONDS)
+                for queue_id in due:
+                    heapq.heappush(self._heap, (retry_at, queue_id))
+
+    async def expire(self, queue_ids: list, now: datetime):
+        """
+        Завершение наступивших записей одним UPDATE.
+        Записи, уже завершенные парой или выходом из очереди, в RETURNING не попадают.
+        """
+        async with self.bot.db_pool.acquire() as conn:
+            expired = await conn.fetch(
+                """
+                UPDATE queue SET finished_at = NOW()
+                WHERE queue_id = ANY($1::int[]) AND finished_at IS NULL AND created_at <= $2
+                RETURNING queue_id, officer_id, probationary_id, display_name
+                """,
+                queue_ids,
+                now - self.ttl
+            )
+        if not expired:
+            return expired
+
+        # Одна перерисовка сообщений на все истекшие записи
+        self.discard([entry['queue_id'] for entry in expired])
+
+        semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+
+        async def notify(entry):
+            async with semaphore:
+                await self.notify_user_about_expiration(entry)
+
+        await asyncio.gather(*(notify(entry) for entry in expired))
+
+        logger.info(f"Очищено {len(expired)} устаревших записей из очереди FTO")
+        return expired
+
+    async def notify_user_about_expiration(self, entry):
+        """Уведомление пользователя об истечении времени в очереди."""
+        user_id = entry["officer_id"] if entry["officer_id"] else entry["probationary_id"]
+        user = self.bot.get_user(user_id)
+        if not user:
+            return
+
+        try:
+            await user.send(
+                "❌ Вы были удалены из очереди, так как никто не нашёлся за 3 часа."
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
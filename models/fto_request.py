@@ -2,150 +2,81 @@ import traceback
 from datetime import datetime
 
 import discord
-from discord.ext import tasks
 
-from bot.config import FTO_ROLE_NAME, INTERN_ROLE_NAME, FTO_QUEUE_CLEANUP_HOURS, FTO_QUEUE_CHECK_MINUTES
+from bot.config import FTO_ROLE_NAME, INTERN_ROLE_NAME
 from bot.logger import get_logger
+from bot.role_index import role_index
 
 logger = get_logger('fto')
 
 
 # ============== ОБЩИЕ УТИЛИТЫ ==============
 
-def remove_user_from_embed(embed: discord.Embed, user_name: str, field_name: str = None):
+class QueueRoles:
     """
-    Удаляет пользователя из указанного поля Embed (или из всех полей, если field_name=None).
+    ID ролей FTO и стажера по серверам.
 
-    Args:
-        embed: Discord Embed объект
-        user_name: Имя пользователя для удаления
-        field_name: Название поля (None = искать во всех полях)
+    Роли ищутся по названию один раз (при запуске или первом нажатии) и
+    перечитываются только при создании/изменении/удалении ролей сервера,
+    а не на каждое нажатие кнопки очереди.
     """
-    for field in embed.fields:
-        # Если указано конкретное поле - проверяем только его
-        if field_name is not None and field.name != field_name:
-            continue
-
-        # Если field_name=None, проверяем только поля очереди
-        if field_name is None and field.name not in ("Свободные FTO", "Стажеры в очереди"):
-            continue
-
-        if user_name not in field.value:
-            continue
-
-        names = [name.strip() for name in field.value.split("\n") if name.strip()]
-        if user_name in names:
-            names.remove(user_name)
-            new_value = (
-                "\n".join(names)
-                if names
-                else (
-                    "Нет FTO"
-                    if field.name == "Свободные FTO"
-                    else "Нет стажеров в очереди"
-                )
-            )
-            embed.set_field_at(
-                embed.fields.index(field),
-                name=field.name,
-                value=new_value,
-                inline=False,
+
+    def __init__(self):
+        self._ids = {}  # guild_id -> (fto_role_id, intern_role_id)
+
+    def refresh(self, guild: discord.Guild):
+        fto_role = role_index.role_by_name(guild, FTO_ROLE_NAME)
+        intern_role = role_index.role_by_name(guild, INTERN_ROLE_NAME)
+        self._ids[guild.id] = (
+            fto_role.id if fto_role else None,
+            intern_role.id if intern_role else None
+        )
+        if fto_role is None or intern_role is None:
+            logger.warning(
+                f"Роли очереди FTO на сервере {guild.id}: "
+                f"'{FTO_ROLE_NAME}' - {'найдена' if fto_role else 'не найдена'}, "
+                f"'{INTERN_ROLE_NAME}' - {'найдена' if intern_role else 'не найдена'}"
             )
 
+    def get(self, guild: discord.Guild) -> tuple:
+        """(ID роли FTO, ID роли стажера); None - роль не найдена"""
+        if guild.id not in self._ids:
+            self.refresh(guild)
+        return self._ids[guild.id]
+
+
+queue_roles = QueueRoles()
+
+
+def build_queue_embed(interns: list[str], ftos: list[str]) -> discord.Embed:
+    """Сообщение FTO Search с текущим составом очереди"""
+    embed = discord.Embed(title="FTO Search")
+    embed.set_thumbnail(url="https://i.imgur.com/89q0Cdj.png")
+    embed.set_image(url="https://i.imgur.com/rZvJhyw.png")
+    embed.add_field(
+        name="",
+        value="Этот модуль предназначен для поиска наставника или стажера. Выбрав соответствующий "
+        "пункт в меню - вы встанете в очередь или сразу переключитесь на свободного "
+        "наставника. Учтите, что очередь очищается каждые три часа.",
+        inline=False,
+    )
+    embed.add_field(
+        name="Стажеры в очереди", value="\n".join(interns) or "Нет стажеров в очереди", inline=False
+    )
+    embed.add_field(name="Свободные FTO", value="\n".join(ftos) or "Нет FTO", inline=False)
+    embed.set_footer(
+        text="Los Santos Police Department. Разработчик: Chlorine, специально для Moon."
+    )
+    return embed
+
 
 class FTOView(discord.ui.View):
-    def __init__(self, bot, channel_id=None, message_id=None):
+    def __init__(self, bot):
         super().__init__(timeout=None)
         self.bot = bot
-        self.channel_id = channel_id
-        self.message_id = message_id
-        self.cleanup_task.start()
         self.add_item(EnterQueue(self))
         self.add_item(LeaveButton(self))
 
-    @tasks.loop(minutes=FTO_QUEUE_CHECK_MINUTES)
-    async def cleanup_task(self):
-        """Очистка устаревших записей из очереди."""
-        try:
-            async with self.bot.db_pool.acquire() as conn:
-                expired_entries = await self.fetch_expired_entries(conn)
-                for entry in expired_entries:
-                    await self.process_expired_entry(conn, entry)
-                if expired_entries:
-                    logger.info(f"Очищено {len(expired_entries)} устаревших записей из очереди FTO")
-        except Exception as e:
-            logger.error(f"Ошибка в фоновой задаче cleanup: {e}", exc_info=True)
-
-    @staticmethod
-    async def fetch_expired_entries(conn):
-        """Получение устаревших записей из базы данных."""
-        return await conn.fetch(
-            "SELECT * FROM queue WHERE finished_at IS NULL AND created_at < NOW() - make_interval(hours => $1)",
-            FTO_QUEUE_CLEANUP_HOURS
-        )
-
-    async def process_expired_entry(self, conn, entry):
-        """Обработка одной устаревшей записи."""
-        await self.mark_entry_as_finished(conn, entry)
-        await self.update_embed_for_expired_entry(entry)
-        await self.notify_user_about_expiration(entry)
-
-    async def update_embed_for_expired_entry(self, entry):
-        """Обновление Embed для устаревшей записи."""
-        if not self.channel_id or not self.message_id:
-            logger.warning("channel_id или message_id не установлены, пропускаем обновление embed")
-            return
-
-        channel = self.bot.get_channel(self.channel_id)
-        if not channel:
-            logger.warning(f"Канал {self.channel_id} не найден")
-            return
-
-        try:
-            message = await channel.fetch_message(self.message_id)
-            embed = message.embeds[0] if message.embeds else None
-
-            if embed:
-                field_name = (
-                    "Свободные FTO" if entry["officer_id"] else "Стажеры в очереди"
-                )
-                remove_user_from_embed(embed, entry["display_name"], field_name)
-                await message.edit(embed=embed)
-        except discord.NotFound:
-            logger.warning(f"Сообщение {self.message_id} не найдено.")
-        except discord.Forbidden:
-            logger.error(f"Нет прав для редактирования сообщения {self.message_id}.")
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении сообщения: {e}")
-
-    async def notify_user_about_expiration(self, entry):
-        """Уведомление пользователя об истечении времени в очереди."""
-        user_id = (
-            entry["officer_id"] if entry["officer_id"] else entry["probationary_id"]
-        )
-        user = self.bot.get_user(user_id)
-        if not user:
-            return
-
-        try:
-            await user.send(
-                "❌ Вы были удалены из очереди, так как никто не нашёлся за 3 часа."
-            )
-        except Exception as e:
-            logger.warning(f"Не удалось отправить уведомление пользователю {user_id}: {e}")
-
-    @staticmethod
-    async def mark_entry_as_finished(conn, entry):
-        """Помечаем запись как завершённую в базе данных."""
-        await conn.execute(
-            "UPDATE queue SET finished_at = NOW() WHERE queue_id = $1",
-            entry["queue_id"],
-        )
-
-    @cleanup_task.before_loop
-    async def before_cleanup_task(self):
-        await self.bot.wait_until_ready()  # Ждём, пока бот будет готов
-
 
 # noinspection PyUnresolvedReferences
 class EnterQueue(discord.ui.Button):
@@ -159,94 +90,65 @@ class EnterQueue(discord.ui.Button):
 
     async def callback(self, interaction: discord.Interaction):
         try:
-            embed = (
-                interaction.message.embeds[0]
-                if interaction.message.embeds
-                else discord.Embed()
-            )
+            # Сообщения, отправленные до появления таблицы fto_boards, регистрируются при первом нажатии
+            await interaction.client.fto_queue.register_board(interaction.channel.id, interaction.message.id)
 
-            # Сохраняем channel_id и message_id в FTOView для cleanup_task
-            self.fto_view.channel_id = interaction.channel.id
-            self.fto_view.message_id = interaction.message.id
+            fto_role_id, intern_role_id = queue_roles.get(interaction.guild)
 
-            fto_role = discord.utils.find(
-                lambda r: r.name == FTO_ROLE_NAME,
-                interaction.guild.roles,
-            )
-            intern_role = discord.utils.find(
-                lambda r: r.name == INTERN_ROLE_NAME, interaction.guild.roles
-            )
+            # Определяем тип пользователя
+            is_fto = fto_role_id is not None and role_index.has_role(interaction.user, fto_role_id)
+            is_intern = intern_role_id is not None and role_index.has_role(interaction.user, intern_role_id)
 
-            if (
-                fto_role not in interaction.user.roles
-                and intern_role not in interaction.user.roles
-            ):
+            if not is_fto and not is_intern:
                 await interaction.response.send_message(
                     "❌ Вы не являетесь офицером полевой подготовки либо стажером.",
                     ephemeral=True,
                 )
                 return
 
-            # Определяем тип пользователя
-            is_fto = fto_role in interaction.user.roles
-
-            # Используем одну транзакцию для проверки и вставки (предотвращает race condition)
-            result = None
+            # Проверка, вставка и поиск пары - одна функция в БД (один запрос, одна транзакция).
+            # При пакетном подборе пар функция только ставит в очередь
+            created_at = datetime.now()
             async with interaction.client.db_pool.acquire() as conn:
-                async with conn.transaction():
-                    # Проверяем, есть ли уже в очереди (с блокировкой строк)
-                    existing_entry = await conn.fetchrow(
-                        "SELECT queue_id FROM queue WHERE (probationary_id = $1 OR officer_id = $1) AND finished_at IS NULL FOR UPDATE",
-                        interaction.user.id,
-                    )
-
-                    if existing_entry:
-                        await interaction.response.send_message(
-                            "❌ Вы уже в очереди.", ephemeral=True
-                        )
-                        return
-
-                    # Вставляем запись в той же транзакции
-                    if is_fto:
-                        result = await conn.fetchrow(
-                            "INSERT INTO queue (officer_id, created_at, display_name) VALUES ($1, $2, $3) RETURNING queue_id",
-                            interaction.user.id,
-                            datetime.now(),
-                            interaction.user.display_name,
-                        )
-                        logger.info(f"FTO {interaction.user.display_name} добавлен в очередь, queue_id={result['queue_id']}")
-                        field_name = "Свободные FTO"
-                    else:
-                        result = await conn.fetchrow(
-                            "INSERT INTO queue (probationary_id, created_at, display_name) VALUES ($1, $2, $3) RETURNING queue_id",
-                            interaction.user.id,
-                            datetime.now(),
-                            interaction.user.display_name,
-                        )
-                        logger.info(f"Стажёр {interaction.user.display_name} добавлен в очередь, queue_id={result['queue_id']}")
-                        field_name = "Стажеры в очереди"
-
-            # Проверяем наличие пары
-            if fto_role in interaction.user.roles:
-                paired = await self.check_and_pair_fto(interaction, result["queue_id"], embed)
-            else:
-                paired = await self.check_and_pair_intern(interaction, result["queue_id"], embed)
-
-            # Если пара не найдена, добавляем пользователя в список
-            if not paired:
-                await self.update_embed_field(
-                    embed, field_name, interaction.user.display_name
+                result = await conn.fetchrow(
+                    "SELECT * FROM fto_enqueue($1, $2, $3, $4, $5)",
+                    interaction.user.id,
+                    is_fto,
+                    interaction.user.display_name,
+                    created_at,
+                    not interaction.client.fto_queue.batch_matching,
                 )
 
-            await interaction.response.edit_message(embed=embed)
+            if result["status"] == "already_queued":
+                await interaction.response.send_message(
+                    "❌ Вы уже в очереди.", ephemeral=True
+                )
+                return
 
-            if paired:
-                await interaction.followup.send(
+            role_name = "FTO" if is_fto else "Стажёр"
+            if result["status"] == "paired":
+                logger.info(
+                    f"{role_name} {interaction.user.display_name} в паре с {result['partner_display_name']}, "
+                    f"queue_id={result['queue_id']}"
+                )
+                # Партнер больше не в очереди
+                interaction.client.fto_queue.discard([result["partner_queue_id"]])
+                await self.notify_pair(interaction, is_fto, result)
+                await interaction.response.send_message(
                     "✅ Пара найдена! Проверьте личные сообщения.",
                     ephemeral=True,
                 )
             else:
-                await interaction.followup.send(
+                logger.info(f"{role_name} {interaction.user.display_name} добавлен в очередь, queue_id={result['queue_id']}")
+                # Пара не найдена - пользователь остается в очереди (сообщение перерисуется из состояния)
+                interaction.client.fto_queue.add(
+                    result["queue_id"],
+                    interaction.user.id if is_fto else None,
+                    None if is_fto else interaction.user.id,
+                    interaction.user.display_name,
+                    created_at,
+                )
+                await interaction.response.send_message(
                     "✅ Вы вошли в очередь. Учтите, ваша позиция действительна 3 часа.",
                     ephemeral=True,
                 )
@@ -258,143 +160,27 @@ class EnterQueue(discord.ui.Button):
             logger.error(f"Ошибка в модуле FTO при входе в очередь: {e}", exc_info=True)
 
     @staticmethod
-    async def update_embed_field(embed: discord.Embed, field_name: str, value: str):
-        """
-        Обновляет поле в embed. Если поле существует, добавляет значение к текущему.
-        Если поле не существует, создаёт новое поле.
-        """
-        existing_field = next(
-            (field for field in embed.fields if field.name == field_name), None
-        )
-
-        if existing_field:
-            if (
-                existing_field.value == "Нет FTO"
-                or existing_field.value == "Нет стажеров в очереди"
-            ):
-                new_value = f"\n{value}"
-            else:
-                new_value = f"{existing_field.value}\n{value}"
-            return embed.set_field_at(
-                embed.fields.index(existing_field),
-                name=field_name,
-                value=new_value,
-                inline=False,
-            )
+    async def notify_pair(interaction, is_fto: bool, result):
+        """Уведомления обоим участникам найденной пары"""
+        partner_id = result["partner_user_id"]
+        if is_fto:
+            to_partner = f"🎉 Вы нашли FTO: <@{interaction.user.id}> ({interaction.user.display_name})!"
+            to_user = f"🎉 Вы нашли стажёра: <@{partner_id}> ({result['partner_display_name']})!"
         else:
-            embed.add_field(name=field_name, value=value, inline=False)
-
-    async def check_and_pair_fto(self, interaction, queue_id, embed) -> bool:
-        """Проверяет наличие стажёра для FTO. Возвращает True если пара найдена."""
-        try:
-            logger.info(f"Проверяем наличие стажёра для FTO {interaction.user.display_name}...")
-            async with interaction.client.db_pool.acquire() as conn:
-                # Используем транзакцию с SELECT FOR UPDATE для предотвращения race condition
-                async with conn.transaction():
-                    intern_entry = await conn.fetchrow(
-                        "SELECT * FROM queue WHERE probationary_id IS NOT NULL AND finished_at IS NULL "
-                        "ORDER BY created_at LIMIT 1 FOR UPDATE SKIP LOCKED"
-                    )
-
-                    if intern_entry:
-                        logger.info(f"Найден стажёр: {intern_entry['display_name']}")
-                        # Завершаем обе записи в рамках одной транзакции
-                        await conn.execute(
-                            "UPDATE queue SET finished_at = $1 WHERE queue_id = $2",
-                            datetime.now(),
-                            queue_id,
-                        )
-                        await conn.execute(
-                            "UPDATE queue SET finished_at = $1 WHERE queue_id = $2",
-                            datetime.now(),
-                            intern_entry["queue_id"],
-                        )
-                    else:
-                        logger.info("Свободных стажёров не найдено")
-                        return False
-
-            # Удаляем обоих из embed (если они там были)
-            remove_user_from_embed(embed, intern_entry["display_name"], "Стажеры в очереди")
-
-            # Отправляем уведомления
-            intern_user = interaction.guild.get_member(
-                intern_entry["probationary_id"]
-            )
-            if intern_user:
-                try:
-                    await intern_user.send(
-                        f"🎉 Вы нашли FTO: <@{interaction.user.id}> ({interaction.user.display_name})!"
-                    )
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить уведомление стажёру: {e}")
+            to_partner = f"🎉 Вы нашли стажёра: <@{interaction.user.id}> ({interaction.user.display_name})!"
+            to_user = f"🎉 Вы нашли FTO: <@{partner_id}> ({result['partner_display_name']})!"
 
+        partner = interaction.guild.get_member(partner_id)
+        if partner:
             try:
-                await interaction.user.send(
-                    f"🎉 Вы нашли стажёра: <@{intern_entry['probationary_id']}> ({intern_entry['display_name']})!"
-                )
+                await partner.send(to_partner)
             except Exception as e:
-                logger.warning(f"Не удалось отправить уведомление FTO: {e}")
-
-            return True
+                logger.warning(f"Не удалось отправить уведомление {'стажёру' if is_fto else 'FTO'}: {e}")
 
-        except Exception as e:
-            logger.error(f"Ошибка при проверке наличия стажёра для FTO: {e}", exc_info=True)
-            return False
-
-    async def check_and_pair_intern(self, interaction, queue_id, embed) -> bool:
-        """Проверяет наличие FTO для стажёра. Возвращает True если пара найдена."""
         try:
-            logger.info(f"Проверяем наличие FTO для стажёра {interaction.user.display_name}...")
-            async with interaction.client.db_pool.acquire() as conn:
-                # Используем транзакцию с SELECT FOR UPDATE для предотвращения race condition
-                async with conn.transaction():
-                    fto_entry = await conn.fetchrow(
-                        "SELECT * FROM queue WHERE officer_id IS NOT NULL AND finished_at IS NULL "
-                        "ORDER BY created_at LIMIT 1 FOR UPDATE SKIP LOCKED"
-                    )
-
-                    if fto_entry:
-                        logger.info(f"Найден FTO: {fto_entry['display_name']}")
-                        # Завершаем обе записи в рамках одной транзакции
-                        await conn.execute(
-                            "UPDATE queue SET finished_at = $1 WHERE queue_id = $2",
-                            datetime.now(),
-                            queue_id,
-                        )
-                        await conn.execute(
-                            "UPDATE queue SET finished_at = $1 WHERE queue_id = $2",
-                            datetime.now(),
-                            fto_entry["queue_id"],
-                        )
-                    else:
-                        logger.info("Свободных FTO не найдено")
-                        return False
-
-            # Удаляем FTO из embed
-            remove_user_from_embed(embed, fto_entry["display_name"], "Свободные FTO")
-
-            # Отправляем уведомления
-            fto_user = interaction.guild.get_member(fto_entry["officer_id"])
-            if fto_user:
-                try:
-                    await fto_user.send(
-                        f"🎉 Вы нашли стажёра: <@{interaction.user.id}> ({interaction.user.display_name})!"
-                    )
-                except Exception as e:
-                    logger.warning(f"Не удалось отправить уведомление FTO: {e}")
-
-            try:
-                await interaction.user.send(
-                    f"🎉 Вы нашли FTO: <@{fto_entry['officer_id']}> ({fto_entry['display_name']})!"
-                )
-            except Exception as e:
-                logger.warning(f"Не удалось отправить уведомление стажёру: {e}")
-
-            return True
-
+            await interaction.user.send(to_user)
         except Exception as e:
-            logger.error(f"Ошибка при проверке наличия FTO для стажёра: {e}", exc_info=True)
-            return False
+            logger.warning(f"Не удалось отправить уведомление {'FTO' if is_fto else 'стажёру'}: {e}")
 
 
 # noinspection PyUnresolvedReferences
@@ -409,12 +195,6 @@ class LeaveButton(discord.ui.Button):
 
     async def callback(self, interaction: discord.Interaction):
         try:
-            embed = (
-                interaction.message.embeds[0]
-                if interaction.message.embeds
-                else discord.Embed()
-            )
-
             # Используем одну транзакцию для всех операций
             async with interaction.client.db_pool.acquire() as conn:
                 async with conn.transaction():
@@ -438,11 +218,9 @@ class LeaveButton(discord.ui.Button):
                         queue_ids,
                     )
 
-            # Удаляем пользователя из embed (используем общую функцию)
-            remove_user_from_embed(embed, interaction.user.display_name)
+            interaction.client.fto_queue.discard(queue_ids)
 
-            await interaction.response.edit_message(embed=embed)
-            await interaction.followup.send("👌 Вы покинули очередь.", ephemeral=True)
+            await interaction.response.send_message("👌 Вы покинули очередь.", ephemeral=True)
 
         except Exception as e:
             logger.error(f"Ошибка при выходе из очереди: {e}", exc_info=True)
@@ -0,0 +1,175 @@
+"""
+Массовое создание пресетов рангов LSPD.
+
+Используется при создании подкатегории (CategoryCreateModal) и командой
+/bulk_create_ranks: все роли находятся за один проход по ролям сервера,
+а все пресеты записываются одним INSERT в одной транзакции.
+Удаление (/delete_all_ranks) также выполняется одним запросом.
+"""
+from datetime import datetime
+
+import discord
+
+from bot.logger import get_logger
+
+logger = get_logger('rank_provisioning')
+
+# Список всех рангов LSPD в порядке иерархии
+LSPD_RANKS = [
+    "Chief of Police",
+    "Assistant Chief of Police",
+    "Deputy Chief of Police",
+    "Police Commander",
+    "Police Captain III",
+    "Police Captain II",
+    "Police Captain I",
+    "Police Lieutenant II",
+    "Police Lieutenant I",
+    "Police Sergeant II",
+    "Police Sergeant I",
+    "Police Detective III",
+    "Police Detective II",
+    "Police Detective I",
+    "Police Officer III+1",
+    "Police Officer III",
+    "Police Officer II",
+    "Police Officer I",
+    "Recruit Officer"
+]
+
+# Маппинг рангов на групповые роли
+RANK_TO_GROUP_ROLE = {
+    "Chief of Police": "Staff Officers",
+    "Assistant Chief of Police": "Staff Officers",
+    "Deputy Chief of Police": "Staff Officers",
+    "Police Commander": "Command Officers",
+    "Police Captain III": "Command Officers",
+    "Police Captain II": "Command Officers",
+    "Police Captain I": "Command Officers",
+    "Police Lieutenant II": "Police Supervisors",
+    "Police Lieutenant I": "Police Supervisors",
+    "Police Sergeant II": "Police Supervisors",
+    "Police Sergeant I": "Police Supervisors",
+    "Police Detective III": "Police Detectives",
+    "Police Detective II": "Police Detectives",
+    "Police Detective I": "Police Detectives",
+    "Police Officer III+1": "Police Officers",
+    "Police Officer III": "Police Officers",
+    "Police Officer II": "Police Officers",
+    "Police Officer I": "Police Officers",
+    "Recruit Officer": None  # Нет групповой роли
+}
+
+
+def resolve_rank_roles(guild: discord.Guild, start_index: int = 0):
+    """
+    Сопоставление рангов с ролями сервера за один проход по guild.roles.
+
+    Returns:
+        tuple: (rows, missing) - rows: список (название, ID роли, ID групповой роли, порядок сортировки),
+        missing: названия рангов, для которых роль не найдена на сервере
+    """
+    roles_by_name = {}
+    for role in guild.roles:
+        # Как и discord.utils.get - при одинаковых названиях берется первая роль
+        roles_by_name.setdefault(role.name, role)
+
+    rows = []
+    missing = []
+    for sort_order in range(start_index, len(LSPD_RANKS)):
+        rank_name = LSPD_RANKS[sort_order]
+        role = roles_by_name.get(rank_name)
+        if not role:
+            missing.append(rank_name)
+            logger.warning(f"Роль '{rank_name}' не найдена на сервере")
+            continue
+
+        group_role_id = None
+        group_role_name = RANK_TO_GROUP_ROLE.get(rank_name)
+        if group_role_name:
+            group_role = roles_by_name.get(group_role_name)
+            if group_role:
+                group_role_id = group_role.id
+            else:
+                logger.warning(f"Групповая роль '{group_role_name}' для ранга '{rank_name}' не найдена на сервере")
+
+        rows.append((rank_name, role.id, group_role_id, sort_order))
+    return rows, missing
+
+
+async def provision_rank_presets(conn, guild: discord.Guild, category_id: int, created_by: int, start_index: int = 0) -> dict:
+    """
+    Создание пресетов рангов в категории одним запросом.
+
+    Уже существующие в категории пресеты пропускаются (ON CONFLICT DO NOTHING).
+
+    Returns:
+        dict: created - созданные ранги, existing - уже существовавшие,
+        missing_roles - ранги без роли на сервере
+    """
+    rows, missing = resolve_rank_roles(guild, start_index)
+    if not rows:
+        return {'created': [], 'existing': [], 'missing_roles': missing}
+
+    names, role_ids, group_role_ids, sort_orders = (list(column) for column in zip(*rows))
+
+    async with conn.transaction():
+        inserted = await conn.fetch(
+            """
+            INSERT INTO role_presets (name, role_ids, created_by, created_at, category_id, rank_group_role_id, sort_order)
+            SELECT t.name, ARRAY[t.role_id], $1, NOW(), $2, t.group_role_id, t.sort_order
+            FROM unnest($3::text[], $4::bigint[], $5::bigint[], $6::int[]) AS t(name, role_id, group_role_id, sort_order)
+            ON CONFLICT (name, category_id) DO NOTHING
+            RETURNING name
+            """,
+            created_by,
+            category_id,
+            names,
+            role_ids,
+            group_role_ids,
+            sort_orders
+        )
+
+    created_names = {row['name'] for row in inserted}
+    return {
+        'created': [name for name in names if name in created_names],
+        'existing': [name for name in names if name not in created_names],
+        'missing_roles': missing
+    }
+
+
+async def delete_rank_presets(conn, performed_by: int, category_id: int = None) -> list:
+    """
+    Удаление пресетов рангов LSPD одним запросом с записью в preset_audit.
+
+    Args:
+        category_id: Ограничить удаление одной категорией (None - во всех категориях)
+
+    Returns:
+        list: строки (category_id, category_name, deleted, names) по каждой затронутой категории
+    """
+    return await conn.fetch(
+        """
+        WITH deleted AS (
+            DELETE FROM role_presets
+            WHERE name = ANY($1::text[])
+              AND ($2::int IS NULL OR category_id = $2)
+            RETURNING preset_id, name, role_ids, description, category_id
+        ), audit AS (
+            INSERT INTO preset_audit (preset_id, preset_name, action, performed_by, timestamp, old_value, details)
+            SELECT preset_id, name, 'delete', $3, $4,
+                   jsonb_build_object('role_ids', role_ids, 'description', description),
+                   'Массовое удаление рангов LSPD'
+            FROM deleted
+        )
+        SELECT d.category_id, c.name AS category_name, COUNT(*) AS deleted, array_agg(d.name) AS names
+        FROM deleted d
+        LEFT JOIN preset_categories c ON c.category_id = d.category_id
+        GROUP BY d.category_id, c.name
+        ORDER BY c.name NULLS LAST
+        """,
+        LSPD_RANKS,
+        category_id,
+        performed_by,
+        datetime.now()
+    )
@@ -7,15 +7,12 @@ import discord
 
 from bot.config import ADM_ROLES_CH, PRESET_ADMIN_ROLE_ID
 from bot.logger import get_logger
+from bot.preset_cache import PresetTree, get_preset_tree, invalidate_preset_tree
 
 logger = get_logger('roles_request')
 
-# Импорт рангов LSPD для автоматического создания
-try:
-    from cogs.ranks import LSPD_RANKS, RANK_TO_GROUP_ROLE
-except ImportError:
-    LSPD_RANKS = []
-    RANK_TO_GROUP_ROLE = {}
+# Ранги LSPD для автоматического создания
+from models.rank_provisioning import LSPD_RANKS, provision_rank_presets
 
 
 # ============== РАБОТА С ЭМОДЗИ ==============
@@ -138,14 +135,14 @@ class PersistentView(discord.ui.View):
         self.add_item(ChangeNicknameButton(embed, user, bot))
         self.add_item(SettingsButton(embed, user, bot))
 
-    async def load_presets(self):
+    async def load_presets(self, tree: PresetTree = None):
         """Загрузка категорий и пресетов для каскадного выбора."""
         if self._presets_loaded:
             return
 
         try:
             select = PresetCategorySelect(self.embed, self.user, self.bot, self.guild)
-            await select.load_options()
+            await select.load_options(tree)
             self.add_item(select)
 
             # Добавляем кнопки пагинации если нужно
@@ -179,45 +176,25 @@ class PresetCategorySelect(discord.ui.Select):
             row=1
         )
 
-    async def load_options(self):
-        """Асинхронная загрузка опций"""
+    async def load_options(self, tree: PresetTree = None):
+        """Построение опций из кешированного дерева пресетов"""
+        if tree is None:
+            tree = await get_preset_tree(self.bot.db_pool)
+
         # Сохраняем информацию о текущей категории для placeholder
         self.current_category_name = None
         self.current_parent_name = None
 
-        async with self.bot.db_pool.acquire() as conn:
-            if self.parent_category_id is None:
-                # Корневой уровень: категории + пресеты без категории
-                categories = await conn.fetch(
-                    "SELECT category_id, name, emoji FROM preset_categories WHERE parent_id IS NULL ORDER BY name"
-                )
-                uncategorized = await conn.fetch(
-                    "SELECT preset_id, name, description, emoji FROM role_presets WHERE category_id IS NULL ORDER BY sort_order NULLS LAST, name"
-                )
-            else:
-                # Загружаем информацию о текущей категории для placeholder
-                current_cat = await conn.fetchrow(
-                    """
-                    SELECT c.name, p.name as parent_name
-                    FROM preset_categories c
-                    LEFT JOIN preset_categories p ON c.parent_id = p.category_id
-                    WHERE c.category_id = $1
-                    """,
-                    self.parent_category_id
-                )
-                if current_cat:
-                    self.current_category_name = current_cat['name']
-                    self.current_parent_name = current_cat['parent_name']
-
-                # Уровень подкатегорий: подкатегории + пресеты этой категории
-                categories = await conn.fetch(
-                    "SELECT category_id, name, emoji FROM preset_categories WHERE parent_id = $1 ORDER BY name",
-                    self.parent_category_id
-                )
-                uncategorized = await conn.fetch(
-                    "SELECT preset_id, name, description, emoji FROM role_presets WHERE category_id = $1 ORDER BY sort_order NULLS LAST, name",
-                    self.parent_category_id
-                )
+        if self.parent_category_id is not None:
+            current_cat = tree.categories.get(self.parent_category_id)
+            if current_cat:
+                self.current_category_name = current_cat['name']
+                parent = tree.categories.get(current_cat['parent_id'])
+                self.current_parent_name = parent['name'] if parent else None
+
+        # Категории текущего уровня + пресеты этой категории (на корне - пресеты без категории)
+        categories = tree.child_categories(self.parent_category_id)
+        uncategorized = tree.category_presets(self.parent_category_id)
 
         # Сохраняем полные списки для пагинации
         self.all_categories = list(categories)
@@ -327,15 +304,8 @@ class PresetCategorySelect(discord.ui.Select):
 
         if selected_value == "back":
             # Возврат на уровень выше
-            async with self.bot.db_pool.acquire() as conn:
-                if self.parent_category_id:
-                    parent = await conn.fetchrow(
-                        "SELECT parent_id FROM preset_categories WHERE category_id = $1",
-                        self.parent_category_id
-                    )
-                    new_parent_id = parent['parent_id'] if parent else None
-                else:
-                    new_parent_id = None
+            tree = await get_preset_tree(self.bot.db_pool)
+            new_parent_id = tree.parent_id(self.parent_category_id) if self.parent_category_id else None
 
             new_select = PresetCategorySelect(self.embed, self.user, self.bot, self.guild, new_parent_id)
             await new_select.load_options()
@@ -382,11 +352,8 @@ class PresetCategorySelect(discord.ui.Select):
             # Выбран пресет - показываем подтверждение
             preset_id = int(selected_value.replace("preset_", ""))
 
-            async with self.bot.db_pool.acquire() as conn:
-                preset = await conn.fetchrow(
-                    "SELECT preset_id, name, role_ids, description, emoji, category_id, rank_group_role_id FROM role_presets WHERE preset_id = $1",
-                    preset_id
-                )
+            tree = await get_preset_tree(self.bot.db_pool)
+            preset = tree.presets.get(preset_id)
 
             if not preset:
                 await interaction.response.send_message("Пресет не найден.", ephemeral=True)
@@ -402,57 +369,8 @@ class PresetCategorySelect(discord.ui.Select):
                 )
                 return
 
-            # Импортируем базовую роль LSPD
-            from bot.config import BASE_LSPD_ROLE_ID
-
-            # Собираем все роли, которые будут выданы (в порядке иерархии)
-            all_role_ids = list(preset['role_ids'])  # Роли из пресета
-
-            # Добавляем групповую роль ранга
-            if preset.get('rank_group_role_id'):
-                all_role_ids.append(preset['rank_group_role_id'])
-
-            # Получаем роль отдела из категории
-            department_role_id = None
-            if preset.get('category_id'):
-                async with self.bot.db_pool.acquire() as conn:
-                    category = await conn.fetchrow(
-                        "SELECT parent_id, department_role_id FROM preset_categories WHERE category_id = $1",
-                        preset['category_id']
-                    )
-
-                    if category:
-                        if category['parent_id'] is not None:
-                            # Это подкатегория, получаем department_role_id родителя
-                            parent = await conn.fetchrow(
-                                "SELECT department_role_id FROM preset_categories WHERE category_id = $1",
-                                category['parent_id']
-                            )
-                            if parent and parent['department_role_id']:
-                                department_role_id = parent['department_role_id']
-                        else:
-                            # Это корневая категория
-                            department_role_id = category['department_role_id']
-
-            # Добавляем роль отдела
-            if department_role_id:
-                all_role_ids.append(department_role_id)
-
-            # Добавляем основную роль LSPD в самый конец (она самая низкая в иерархии)
-            if BASE_LSPD_ROLE_ID:
-                try:
-                    base_role_id = int(BASE_LSPD_ROLE_ID)
-                    all_role_ids.append(base_role_id)
-                except (ValueError, TypeError):
-                    pass
-
-            # Удаляем дубликаты, сохраняя порядок
-            seen = set()
-            unique_role_ids = []
-            for role_id in all_role_ids:
-                if role_id not in seen:
-                    seen.add(role_id)
-                    unique_role_ids.append(role_id)
+            # Итоговый список ролей (в порядке иерархии) уже рассчитан в дереве пресетов
+            unique_role_ids = tree.effective_role_ids(preset_id)
 
             # Получаем названия всех ролей
             role_names = []
@@ -465,6 +383,7 @@ class PresetCategorySelect(discord.ui.Select):
 
             confirm_view = ConfirmPresetView(
                 preset=dict(preset),
+                role_ids=unique_role_ids,
                 embed=self.embed,
                 user=self.user,
                 bot=self.bot,
@@ -572,9 +491,10 @@ class PresetNextPageButton(discord.ui.Button):
 class ConfirmPresetView(discord.ui.View):
     """View для подтверждения применения пресета"""
 
-    def __init__(self, preset: dict, embed: discord.Embed, user: discord.User, bot, original_message, original_view):
+    def __init__(self, preset: dict, role_ids: list, embed: discord.Embed, user: discord.User, bot, original_message, original_view):
         super().__init__(timeout=60)
         self.preset = preset
+        self.role_ids = role_ids  # Итоговый список ролей, показанный в подтверждении
         self.embed = embed
         self.user = user
         self.bot = bot
@@ -587,13 +507,11 @@ class ConfirmPresetView(discord.ui.View):
         # Немедленно подтверждаем получение взаимодействия
         await interaction.response.defer()
 
-        from bot.config import BASE_LSPD_ROLE_ID
-
         guild = interaction.guild
         member = guild.get_member(self.user.id)
 
         preset_name = self.preset['name']
-        role_ids = list(self.preset['role_ids'])  # Копируем список ролей из пресета
+        all_role_ids = self.role_ids
 
         logger.info(f"Пресет '{preset_name}' применяется к {self.user.display_name} ({self.user.id}) администратором {interaction.user.display_name}")
 
@@ -602,50 +520,10 @@ class ConfirmPresetView(discord.ui.View):
             await interaction.edit_original_response(content="Пользователь больше не на сервере.", view=None)
             return
 
-        # Получаем корневую категорию (отдел) для получения department_role_id
-        department_role_id = None
-        if self.preset.get('category_id'):
-            async with self.bot.db_pool.acquire() as conn:
-                # Получаем корневую категорию (отдел)
-                # Если это подкатегория, получаем её родителя
-                category = await conn.fetchrow(
-                    "SELECT category_id, parent_id, department_role_id FROM preset_categories WHERE category_id = $1",
-                    self.preset['category_id']
-                )
-
-                if category:
-                    if category['parent_id'] is not None:
-                        # Это подкатегория, получаем родительскую категорию (отдел)
-                        parent_category = await conn.fetchrow(
-                            "SELECT department_role_id FROM preset_categories WHERE category_id = $1",
-                            category['parent_id']
-                        )
-                        if parent_category:
-                            department_role_id = parent_category['department_role_id']
-                    else:
-                        # Это корневая категория (отдел)
-                        department_role_id = category['department_role_id']
-
-        # Формируем итоговый список ролей: Базовая роль LSPD + Роль отдела + Групповая роль + Роли из пресета
-        all_role_ids = []
-
-        # 1. Добавляем базовую роль LSPD
-        all_role_ids.append(BASE_LSPD_ROLE_ID)
-
-        # 2. Добавляем роль отдела (если есть)
-        if department_role_id:
-            all_role_ids.append(department_role_id)
-
-        # 3. Добавляем групповую роль ранга (если есть)
-        if self.preset.get('rank_group_role_id'):
-            all_role_ids.append(self.preset['rank_group_role_id'])
-
-        # 4. Добавляем роли из пресета (ранг)
-        all_role_ids.extend(role_ids)
-
         # Выдача ролей
         success_roles = []
         failed_roles = []
+        roles_to_add = []
 
         for role_id in all_role_ids:
             role = guild.get_role(role_id)
@@ -653,17 +531,30 @@ class ConfirmPresetView(discord.ui.View):
                 failed_roles.append(f"ID {role_id} (роль не найдена)")
                 logger.warning(f"Роль с ID {role_id} не найдена на сервере")
                 continue
+            roles_to_add.append(role)
+
+        reason = f"Пресет '{preset_name}' применен {interaction.user.display_name}"
 
+        if roles_to_add:
             try:
-                await member.add_roles(role, reason=f"Пресет '{preset_name}' применен {interaction.user.display_name}")
-                success_roles.append(role.name)
-                logger.info(f"Роль '{role.name}' выдана пользователю {member.display_name}")
-            except discord.Forbidden:
-                failed_roles.append(f"{role.name} (нет прав)")
-                logger.error(f"Нет прав для выдачи роли '{role.name}' пользователю {member.display_name}")
+                # Одно редактирование участника вместо отдельного запроса на каждую роль
+                await member.add_roles(*roles_to_add, reason=reason, atomic=False)
+                success_roles.extend(role.name for role in roles_to_add)
+                logger.info(f"Роли {', '.join(success_roles)} выданы пользователю {member.display_name}")
             except discord.HTTPException as e:
-                failed_roles.append(f"{role.name} (ошибка: {e})")
-                logger.error(f"HTTP ошибка при выдаче роли '{role.name}': {e}")
+                # Выясняем по одной, какая именно роль не выдается
+                logger.warning(f"Не удалось выдать роли одним запросом пользователю {member.display_name}: {e}")
+                for role in roles_to_add:
+                    try:
+                        await member.add_roles(role, reason=reason)
+                        success_roles.append(role.name)
+                        logger.info(f"Роль '{role.name}' выдана пользователю {member.display_name}")
+                    except discord.Forbidden:
+                        failed_roles.append(f"{role.name} (нет прав)")
+                        logger.error(f"Нет прав для выдачи роли '{role.name}' пользователю {member.display_name}")
+                    except discord.HTTPException as e:
+                        failed_roles.append(f"{role.name} (ошибка: {e})")
+                        logger.error(f"HTTP ошибка при выдаче роли '{role.name}': {e}")
 
         # Обновление embed
         self.embed.color = discord.Color.green()
@@ -1484,50 +1375,25 @@ class CategoryCreateModal(discord.ui.Modal, title="Создать категор
             ranks_created_count = 0  # Счетчик созданных рангов
 
             async with self.bot.db_pool.acquire() as conn:
-                # Создаем категорию и получаем её ID
-                new_category_id = await conn.fetchval(
-                    "INSERT INTO preset_categories (name, parent_id, created_by, created_at, emoji, department_role_id) "
-                    "VALUES ($1, $2, $3, NOW(), $4, $5) RETURNING category_id",
-                    self.category_name.value,
-                    self.parent_id,
-                    interaction.user.id,
-                    emoji_value,
-                    department_role_id
-                )
-
-                # Если это подкатегория (parent_id не None), автоматически создаём ранги
-                if self.parent_id is not None and LSPD_RANKS:
-                    for i, rank_name in enumerate(LSPD_RANKS):
-                        # Ищем роль Discord по названию ранга
-                        role = discord.utils.get(interaction.guild.roles, name=rank_name)
-                        if not role:
-                            logger.warning(f"Роль '{rank_name}' не найдена при создании подкатегории '{self.category_name.value}'")
-                            continue
-
-                        # Определяем групповую роль
-                        group_role_name = RANK_TO_GROUP_ROLE.get(rank_name)
-                        group_role_id = None
-                        if group_role_name:
-                            group_role = discord.utils.get(interaction.guild.roles, name=group_role_name)
-                            if group_role:
-                                group_role_id = group_role.id
-
-                        # Создаём пресет ранга
-                        await conn.execute(
-                            "INSERT INTO role_presets (name, role_ids, created_by, created_at, description, category_id, rank_group_role_id, sort_order) "
-                            "VALUES ($1, $2, $3, NOW(), $4, $5, $6, $7)",
-                            rank_name,
-                            [role.id],
-                            interaction.user.id,
-                            f"Ранг LSPD: {rank_name}",
-                            new_category_id,
-                            group_role_id,
-                            i  # Порядок сортировки
-                        )
-                        ranks_created_count += 1
+                async with conn.transaction():
+                    # Создаем категорию и получаем её ID
+                    new_category_id = await conn.fetchval(
+                        "INSERT INTO preset_categories (name, parent_id, created_by, created_at, emoji, department_role_id) "
+                        "VALUES ($1, $2, $3, NOW(), $4, $5) RETURNING category_id",
+                        self.category_name.value,
+                        self.parent_id,
+                        interaction.user.id,
+                        emoji_value,
+                        department_role_id
+                    )
 
-                    logger.info(f"Создано {ranks_created_count} рангов для подкатегории '{self.category_name.value}'")
+                    # Если это подкатегория (parent_id не None), автоматически создаём ранги
+                    if self.parent_id is not None:
+                        result = await provision_rank_presets(conn, interaction.guild, new_category_id, interaction.user.id)
+                        ranks_created_count = len(result['created'])
+                        logger.info(f"Создано {ranks_created_count} рангов для подкатегории '{self.category_name.value}'")
 
+            invalidate_preset_tree()
             logger.info(f"Категория '{self.category_name.value}' создана пользователем {interaction.user.display_name}")
 
             # Парсим эмодзи для отображения
@@ -1698,6 +1564,7 @@ class CategoryRenameModal(discord.ui.Modal, title="Редактировать к
                     department_role_id,
                     self.category['category_id']
                 )
+            invalidate_preset_tree()
 
             # Парсим эмодзи для отображения
             emoji_str = ""
@@ -1751,6 +1618,7 @@ class ConfirmDeleteCategoryView(discord.ui.View):
                 "DELETE FROM preset_categories WHERE category_id = $1",
                 self.category['category_id']
             )
+        invalidate_preset_tree()
 
         logger.info(f"Категория '{self.category['name']}' удалена пользователем {interaction.user.display_name}")
 
@@ -2608,6 +2476,7 @@ class ChangePresetCategorySelect(discord.ui.Select):
                 "SELECT name FROM preset_categories WHERE category_id = $1",
                 category_id
             )
+        invalidate_preset_tree()
 
         logger.info(f"Категория пресета '{self.preset['name']}' изменена на '{cat_name}' пользователем {interaction.user.display_name}")
 
@@ -2643,6 +2512,7 @@ class RemoveFromCategoryButton(discord.ui.Button):
                 "UPDATE role_presets SET category_id = NULL WHERE preset_id = $1",
                 self.preset['preset_id']
             )
+        invalidate_preset_tree()
 
         logger.info(f"Пресет '{self.preset['name']}' убран из категории пользователем {interaction.user.display_name}")
 
@@ -2829,6 +2699,7 @@ class SaveRolesButton(discord.ui.Button):
                 self.parent_view.selected_roles,
                 self.parent_view.preset['preset_id']
             )
+        invalidate_preset_tree()
 
         logger.info(f"Роли пресета '{self.parent_view.preset['name']}' обновлены пользователем {interaction.user.display_name}")
 
@@ -2888,6 +2759,7 @@ class ConfirmDeleteView(discord.ui.View):
                 "DELETE FROM role_presets WHERE preset_id = $1",
                 self.preset['preset_id']
             )
+        invalidate_preset_tree()
 
         logger.info(f"Пресет '{self.preset['name']}' удален пользователем {interaction.user.display_name}")
 
@@ -3036,6 +2908,7 @@ class PresetCreateModal(discord.ui.Modal, title="Создать пресет"):
                     self.category_id,
                     rank_group_role_id
                 )
+            invalidate_preset_tree()
 
             logger.info(
                 f"Пресет '{self.preset_name.value}' создан пользователем {interaction.user.display_name} "
@@ -3174,6 +3047,7 @@ class PresetEditInfoModal(discord.ui.Modal, title="Редактировать п
                     rank_group_role_id,
                     self.preset['preset_id']
                 )
+            invalidate_preset_tree()
 
             logger.info(f"Пресет '{self.preset['name']}' обновлен пользователем {interaction.user.display_name}")
 
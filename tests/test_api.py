@@ -0,0 +1,217 @@
+import json
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import discord
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.api import APIServer
+from bot.role_versions import bump_member
+from events import on_ready
+from events.on_member_update import setup_on_member_update
+
+
+def make_role(role_id, name, position, default=False):
+    role = MagicMock()
+    role.id = role_id
+    role.name = name
+    role.position = position
+    role.color = discord.Color.default()
+    role.permissions.value = 0
+    role.mentionable = False
+    role.hoist = False
+    role.is_default.return_value = default
+    return role
+
+
+def make_member(user_id, roles):
+    member = MagicMock()
+    member.id = user_id
+    member.name = f"user{user_id}"
+    member.discriminator = "0"
+    member.nick = None
+    member.display_name = f"User {user_id}"
+    member.display_avatar = None
+    member.roles = roles
+    return member
+
+
+def make_bot(cached, fetched=None):
+    fetched = fetched or {}
+    guild = MagicMock()
+    guild.id = 1
+    guild.name = "LSPD"
+    guild.get_member = MagicMock(side_effect=cached.get)
+
+    async def fetch_member(user_id):
+        if user_id in fetched:
+            return fetched[user_id]
+        raise discord.NotFound(MagicMock(status=404, reason="Not Found"), "Unknown Member")
+
+    guild.fetch_member = AsyncMock(side_effect=fetch_member)
+
+    bot = MagicMock()
+    bot.get_guild = MagicMock(return_value=guild)
+    return bot, guild
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_roles_batch_uses_cache_and_reports_per_user_errors():
+    everyone = make_role(1, "@everyone", 0, default=True)
+    officer = make_role(2, "Officer", 5)
+    cached = {10: make_member(10, [everyone, officer])}
+    fetched = {20: make_member(20, [everyone])}
+    bot, guild = make_bot(cached, fetched)
+
+    async with TestClient(TestServer(APIServer(bot).app)) as client:
+        response = await client.post("/api/roles/batch", json={
+            "guild_id": "1",
+            "user_ids": ["10", 20, "30", "abc"]
+        })
+        data = await response.json()
+
+    assert response.status == 200
+    assert data["success"] is True
+    assert [r["name"] for r in data["results"]["10"]["roles"]] == ["Officer"]
+    assert data["results"]["20"]["roles"] == []
+    assert data["errors"] == {"30": "Member not found", "abc": "Invalid user id"}
+    # fetch_member только для промахов кеша
+    assert sorted(call.args[0] for call in guild.fetch_member.await_args_list) == [20, 30]
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_roles_batch_validates_body():
+    bot, _ = make_bot({})
+
+    async with TestClient(TestServer(APIServer(bot).app)) as client:
+        response = await client.post("/api/roles/batch", json={"guild_id": "1", "user_ids": []})
+
+    assert response.status == 400
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_roles_etag_not_modified_until_member_changes():
+    everyone = make_role(1, "@everyone", 0, default=True)
+    officer = make_role(2, "Officer", 5)
+    bot, _ = make_bot({10: make_member(10, [everyone, officer])})
+    server = APIServer(bot)
+    body = {"guild_id": "1", "user_id": "10"}
+
+    async with TestClient(TestServer(server.app)) as client:
+        first = await client.post("/api/roles", json=body)
+        etag = first.headers["ETag"]
+        assert (await first.json())["roles"][0]["name"] == "Officer"
+
+        not_modified = await client.post("/api/roles", json=body, headers={"If-None-Match": etag})
+        assert not_modified.status == 304
+
+        bump_member(1, 10)
+        changed = await client.post("/api/roles", json=body, headers={"If-None-Match": etag})
+        assert changed.status == 200
+        assert changed.headers["ETag"] != etag
+
+    assert server.roles_cache.misses == 2
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_roles_etag_changes_after_rejoin_and_user_update():
+    everyone = make_role(1, "@everyone", 0, default=True)
+    member = make_member(11, [everyone])
+    member.guild.id = 1
+    bot, guild = make_bot({11: member})
+    bot.guilds = [guild]
+
+    handlers = {}
+    bot.event = lambda handler: handlers.setdefault(handler.__name__, handler)
+    await setup_on_member_update(bot)
+
+    body = {"guild_id": "1", "user_id": "11"}
+    async with TestClient(TestServer(APIServer(bot).app)) as client:
+        etag = (await client.post("/api/roles", json=body)).headers["ETag"]
+
+        # Выход и повторный вход участника
+        await handlers["on_member_remove"](member)
+        await handlers["on_member_join"](member)
+        rejoined = await client.post("/api/roles", json=body, headers={"If-None-Match": etag})
+        assert rejoined.status == 200
+        assert rejoined.headers["ETag"] != etag
+
+        etag = rejoined.headers["ETag"]
+        await handlers["on_user_update"](MagicMock(), member)
+        renamed = await client.post("/api/roles", json=body, headers={"If-None-Match": etag})
+        assert renamed.status == 200
+        assert renamed.headers["ETag"] != etag
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_roles_etag_changes_after_reconnect():
+    everyone = make_role(1, "@everyone", 0, default=True)
+    bot, guild = make_bot({12: make_member(12, [everyone])})
+    bot.guilds = [guild]
+    bot.tree.sync = AsyncMock(return_value=[])
+
+    handlers = {}
+    bot.event = lambda handler: handlers.setdefault(handler.__name__, handler)
+    await on_ready.setup_on_ready(bot, 2, 3)
+
+    body = {"guild_id": "1", "user_id": "12"}
+    with patch.object(on_ready, "role_index"), patch.object(on_ready, "queue_roles"), \
+            patch.object(on_ready, "initialize_channels", AsyncMock()), \
+            patch.object(on_ready, "restore_pending_views", AsyncMock()), \
+            patch.object(on_ready, "restore_button_view", AsyncMock()):
+        async with TestClient(TestServer(APIServer(bot).app)) as client:
+            await handlers["on_ready"]()
+            etag = (await client.post("/api/roles", json=body)).headers["ETag"]
+
+            # Повторный on_ready после переподключения к шлюзу
+            await handlers["on_ready"]()
+            reconnected = await client.post("/api/roles", json=body, headers={"If-None-Match": etag})
+            assert reconnected.status == 200
+            assert reconnected.headers["ETag"] != etag
+
+
+def make_roster_bot(count):
+    everyone = make_role(1, "@everyone", 0, default=True)
+    officer = make_role(2, "Officer", 5)
+    members = []
+    for user_id in range(100, 100 + count):
+        roles = [everyone, officer] if user_id % 2 == 0 else [everyone]
+        member = make_member(user_id, roles)
+        member.get_role = MagicMock(side_effect=lambda rid, roles=roles: next((r for r in roles if r.id == rid), None))
+        members.append(member)
+
+    bot, guild = make_bot({})
+    guild.members = list(reversed(members))
+    guild.get_role = MagicMock(side_effect=lambda rid: officer if rid == 2 else None)
+    return bot
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_roster_ndjson_filtered_by_role():
+    bot = make_roster_bot(6)
+
+    async with TestClient(TestServer(APIServer(bot).app)) as client:
+        response = await client.get("/api/roster", params={"guild_id": "1", "role_id": "2"})
+        lines = (await response.text()).splitlines()
+
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert sorted(json.loads(line)["id"] for line in lines) == ["100", "102", "104"]
+    assert json.loads(lines[0])["role_ids"] == ["2"]
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_roster_json_cursor_pagination():
+    bot = make_roster_bot(5)
+    ids = []
+
+    async with TestClient(TestServer(APIServer(bot).app)) as client:
+        params = {"guild_id": "1", "format": "json", "limit": "2"}
+        while True:
+            data = await (await client.get("/api/roster", params=params)).json()
+            ids += [m["id"] for m in data["members"]]
+            if data["next_cursor"] is None:
+                break
+            params["cursor"] = data["next_cursor"]
+
+    assert ids == ["100", "101", "102", "103", "104"]
@@ -3,7 +3,7 @@ from datetime import datetime
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 import discord
-from models.roles_request import DoneButton, PersistentView, DropButton, DropModal
+from models.roles_request import DoneButton, PersistentView, DropButton, DropModal, ConfirmPresetView
 
 
 @pytest.mark.asyncio(loop_scope="function")
@@ -133,3 +133,76 @@ async def test_drop_button_callback(mock_datetime):
     interaction.response.send_message.assert_awaited_once_with(
         f"Запрос от {user.display_name} отклонён!", ephemeral=True
     )
+
+
+def make_confirm_interaction(roles, member):
+    guild = MagicMock()
+    guild.get_role = MagicMock(side_effect=lambda role_id: roles.get(role_id))
+    guild.get_member = MagicMock(return_value=member)
+
+    conn = AsyncMock()
+    acquire_mock = MagicMock()
+    acquire_mock.__aenter__ = AsyncMock(return_value=conn)
+    acquire_mock.__aexit__ = AsyncMock(return_value=None)
+
+    interaction = AsyncMock(spec=discord.Interaction)
+    interaction.response = AsyncMock()
+    interaction.guild = guild
+    interaction.user = MagicMock()
+    interaction.user.display_name = "Admin"
+    interaction.client = MagicMock()
+    interaction.client.db_pool.acquire = MagicMock(return_value=acquire_mock)
+    return interaction
+
+
+def make_role(role_id, name):
+    role = MagicMock(spec=discord.Role)
+    role.id = role_id
+    role.name = name
+    return role
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_confirm_preset_grants_roles_in_one_call():
+    roles = {1: make_role(1, "Officer"), 2: make_role(2, "LSPD")}
+    member = AsyncMock()
+    member.display_name = "TestUser"
+    user = AsyncMock()
+    user.id = 12345
+    user.display_name = "TestUser"
+
+    interaction = make_confirm_interaction(roles, member)
+    embed = discord.Embed(title="Test Embed")
+    view = ConfirmPresetView({"name": "Officer"}, [1, 2, 3], embed, user, MagicMock(), AsyncMock(), MagicMock())
+
+    await view.confirm.callback(interaction)
+
+    member.add_roles.assert_awaited_once()
+    assert member.add_roles.call_args.args == (roles[1], roles[2])
+    assert embed.footer.text == "Officer, LSPD выданы пользователем Admin\n⚠ Не удалось выдать: ID 3 (роль не найдена)"
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_confirm_preset_falls_back_to_per_role_grant():
+    roles = {1: make_role(1, "Officer"), 2: make_role(2, "LSPD")}
+    forbidden = discord.Forbidden(MagicMock(status=403, reason="Forbidden"), "Missing Permissions")
+
+    async def add_roles(*args, **kwargs):
+        if len(args) > 1 or args[0] is roles[2]:
+            raise forbidden
+
+    member = AsyncMock()
+    member.display_name = "TestUser"
+    member.add_roles = AsyncMock(side_effect=add_roles)
+    user = AsyncMock()
+    user.id = 12345
+    user.display_name = "TestUser"
+
+    interaction = make_confirm_interaction(roles, member)
+    embed = discord.Embed(title="Test Embed")
+    view = ConfirmPresetView({"name": "Officer"}, [1, 2], embed, user, MagicMock(), AsyncMock(), MagicMock())
+
+    await view.confirm.callback(interaction)
+
+    assert member.add_roles.await_count == 3
+    assert embed.footer.text == "Officer выданы пользователем Admin\n⚠ Не удалось выдать: LSPD (нет прав)"
@@ -0,0 +1,48 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from bot.database import MIGRATIONS, run_migrations
+
+
+def make_conn(applied_versions):
+    conn = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[{"version": v} for v in applied_versions])
+
+    transaction = MagicMock()
+    transaction.__aenter__ = AsyncMock(return_value=None)
+    transaction.__aexit__ = AsyncMock(return_value=None)
+    conn.transaction = MagicMock(return_value=transaction)
+    return conn
+
+
+def test_migration_versions_are_unique_and_ordered():
+    versions = [m[0] for m in MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_run_migrations_applies_only_pending():
+    applied = [m[0] for m in MIGRATIONS[:-1]]
+    conn = make_conn(applied)
+
+    await run_migrations(conn)
+
+    last_version, last_description, last_sql = MIGRATIONS[-1]
+    assert conn.transaction.call_count == 1
+    conn.execute.assert_any_await(last_sql)
+    conn.execute.assert_any_await(
+        "INSERT INTO schema_version (version, description) VALUES ($1, $2)",
+        last_version,
+        last_description
+    )
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_run_migrations_noop_when_up_to_date():
+    conn = make_conn([m[0] for m in MIGRATIONS])
+
+    await run_migrations(conn)
+
+    conn.transaction.assert_not_called()
+    # Только CREATE TABLE IF NOT EXISTS schema_version
+    assert conn.execute.await_count == 1
@@ -0,0 +1,58 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+from models.fto_matching import match_pairs
+
+
+def entry(queue_id, minutes_ago, divisions=()):
+    return {
+        "queue_id": queue_id,
+        "created_at": datetime(2024, 1, 1, 12) - timedelta(minutes=minutes_ago),
+        "divisions": frozenset(divisions),
+    }
+
+
+def test_oldest_intern_gets_oldest_compatible_fto():
+    ftos = [entry(1, 5), entry(2, 30)]
+    interns = [entry(10, 1), entry(11, 20)]
+
+    pairs = {i["queue_id"]: f["queue_id"] for f, i in match_pairs(ftos, interns)}
+
+    assert pairs == {11: 2, 10: 1}
+
+
+def test_divisions_respected_and_matching_is_maximum():
+    # Жадно самый давний стажер (без отдела) занял бы единственного FTO отдела 7
+    ftos = [entry(1, 30, {7}), entry(2, 10, {8})]
+    interns = [entry(10, 40), entry(11, 20, {7})]
+
+    pairs = {i["queue_id"]: f["queue_id"] for f, i in match_pairs(ftos, interns)}
+
+    assert pairs == {10: 2, 11: 1}
+
+
+def test_unmatched_when_no_compatible_fto():
+    pairs = match_pairs([entry(1, 5, {7})], [entry(10, 5, {8})])
+    assert pairs == []
+
+
+def test_benchmark_hundreds_of_queued_people():
+    rng = random.Random(42)
+    divisions = list(range(6))
+
+    def random_divisions():
+        return set(rng.sample(divisions, rng.randint(0, 2)))
+
+    ftos = [entry(i, rng.randint(0, 180), random_divisions()) for i in range(400)]
+    interns = [entry(1000 + i, rng.randint(0, 180), random_divisions()) for i in range(400)]
+
+    started = time.perf_counter()
+    pairs = match_pairs(ftos, interns)
+    elapsed = time.perf_counter() - started
+
+    assert len({f["queue_id"] for f, _ in pairs}) == len(pairs)
+    assert len({i["queue_id"] for _, i in pairs}) == len(pairs)
+    for fto, intern in pairs:
+        assert not fto["divisions"] or not intern["divisions"] or fto["divisions"] & intern["divisions"]
+    assert elapsed < 1.0, f"800 записей очереди: {len(pairs)} пар за {elapsed * 1000:.1f} мс"
@@ -0,0 +1,227 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from models.fto_queue import FTOQueueScheduler
+
+
+def make_bot(active_rows=(), boards=()):
+    def fetch(query, *args):
+        if "FROM fto_boards" in query:
+            return list(boards)
+        if query.startswith("SELECT"):
+            return list(active_rows)
+        return []
+
+    conn = AsyncMock()
+    conn.fetch = AsyncMock(side_effect=fetch)
+
+    transaction = MagicMock()
+    transaction.__aenter__ = AsyncMock(return_value=None)
+    transaction.__aexit__ = AsyncMock(return_value=None)
+    conn.transaction = MagicMock(return_value=transaction)
+
+    acquire_mock = MagicMock()
+    acquire_mock.__aenter__ = AsyncMock(return_value=conn)
+    acquire_mock.__aexit__ = AsyncMock(return_value=None)
+
+    bot = MagicMock()
+    bot.wait_until_ready = AsyncMock()
+    bot.db_pool.acquire = MagicMock(return_value=acquire_mock)
+    return bot, conn
+
+
+def update_calls(conn):
+    return [call for call in conn.fetch.await_args_list if call.args[0].strip().startswith("UPDATE")]
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_scheduler_sleeps_when_empty_and_expires_due_entries_in_one_update():
+    ttl = timedelta(hours=3)
+    now = datetime.now()
+    bot, conn = make_bot([
+        {"queue_id": 1, "created_at": now - ttl - timedelta(minutes=5)},
+        {"queue_id": 2, "created_at": now - ttl - timedelta(minutes=1)},
+        {"queue_id": 3, "created_at": now},
+    ])
+    scheduler = FTOQueueScheduler(bot, ttl)
+    scheduler.start()
+    await asyncio.sleep(0.05)
+
+    # Обе наступившие записи - одним UPDATE, запись 3 ждет своего срока
+    updates = update_calls(conn)
+    assert len(updates) == 1
+    assert updates[0].args[1] == [1, 2]
+
+    # Новая уже просроченная запись будит планировщик без опроса БД
+    scheduler.schedule(4, now - ttl)
+    await asyncio.sleep(0.05)
+    updates = update_calls(conn)
+    assert len(updates) == 2
+    assert updates[1].args[1] == [4]
+
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_expiry_and_clicks_coalesce_into_one_edit_per_board():
+    bot, conn = make_bot()
+    conn.fetch = AsyncMock(return_value=[
+        {"queue_id": 1, "officer_id": 10, "probationary_id": None, "display_name": "Officer A"},
+        {"queue_id": 2, "officer_id": None, "probationary_id": 20, "display_name": "Intern B"},
+    ])
+    message = MagicMock()
+    message.edit = AsyncMock()
+    bot.get_partial_messageable.return_value.get_partial_message.return_value = message
+    user = MagicMock()
+    user.send = AsyncMock()
+    bot.get_user = MagicMock(return_value=user)
+
+    now = datetime.now()
+    scheduler = FTOQueueScheduler(bot, edit_interval=0.01)
+    await scheduler.register_board(100, 200)
+    scheduler.add(1, 10, None, "Officer A", now)
+    scheduler.add(2, None, 20, "Intern B", now)
+    scheduler.add(3, None, 30, "Intern C", now)
+    expired = await scheduler.expire([1, 2], now)
+    await asyncio.sleep(0.05)
+
+    assert len(expired) == 2
+    assert user.send.await_count == 2
+    message.edit.assert_awaited_once()
+    fields = {f.name: f.value for f in message.edit.await_args.kwargs["embed"].fields}
+    assert fields["Стажеры в очереди"] == "Intern C"
+    assert fields["Свободные FTO"] == "Нет FTO"
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_boards_from_table_are_rendered_right_after_start():
+    bot, conn = make_bot(
+        active_rows=[{"queue_id": 1, "officer_id": None, "probationary_id": 20,
+                      "display_name": "Intern B", "created_at": datetime.now()}],
+        boards=[{"message_id": 200, "channel_id": 100}]
+    )
+    message = MagicMock()
+    message.edit = AsyncMock()
+    bot.get_partial_messageable.return_value.get_partial_message.return_value = message
+
+    scheduler = FTOQueueScheduler(bot, edit_interval=0.01)
+    scheduler.start()
+    await asyncio.sleep(0.05)
+    await scheduler.stop()
+
+    bot.get_partial_messageable.assert_called_with(100)
+    bot.get_partial_messageable.return_value.get_partial_message.assert_called_with(200)
+    fields = {f.name: f.value for f in message.edit.await_args.kwargs["embed"].fields}
+    assert fields["Стажеры в очереди"] == "Intern B"
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_enter_queue_pairs_with_one_db_call():
+    from models.fto_request import EnterQueue, queue_roles
+
+    bot, conn = make_bot()
+    conn.fetchrow = AsyncMock(return_value={
+        "status": "paired", "queue_id": 7, "partner_queue_id": 3,
+        "partner_user_id": 20, "partner_display_name": "Intern B",
+    })
+    bot.fto_queue = MagicMock()
+    bot.fto_queue.register_board = AsyncMock()
+    bot.fto_queue.batch_matching = False
+
+    interaction = MagicMock()
+    interaction.client = bot
+    interaction.guild.id = 999
+    interaction.user.id = 10
+    interaction.user.display_name = "Officer A"
+    interaction.user.send = AsyncMock()
+    interaction.response = AsyncMock()
+    partner = MagicMock()
+    partner.send = AsyncMock()
+    interaction.guild.get_member = MagicMock(return_value=partner)
+
+    queue_roles._ids[999] = (1, 2)
+    interaction.user.get_role = MagicMock(side_effect=lambda rid: MagicMock() if rid == 1 else None)
+    try:
+        await EnterQueue(MagicMock()).callback(interaction)
+    finally:
+        queue_roles._ids.pop(999)
+
+    conn.fetchrow.assert_awaited_once()
+    assert conn.fetchrow.await_args.args[1:4] == (10, True, "Officer A")
+    bot.fto_queue.discard.assert_called_once_with([3])
+    bot.fto_queue.add.assert_not_called()
+    partner.send.assert_awaited_once()
+    interaction.user.send.assert_awaited_once()
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_run_matching_closes_only_pairs_still_active():
+    # Стажер 4 вышел из очереди между снимком и блокировкой
+    bot, conn = make_bot(active_rows=[{"queue_id": 1}, {"queue_id": 2}, {"queue_id": 3}])
+    users = {}
+
+    def get_user(user_id):
+        users[user_id] = MagicMock(send=AsyncMock())
+        return users[user_id]
+
+    bot.get_user = MagicMock(side_effect=get_user)
+
+    now = datetime.now()
+    scheduler = FTOQueueScheduler(bot, edit_interval=0.01)
+    scheduler._division_resolver = AsyncMock(return_value=lambda user_id: frozenset())
+    scheduler.request_match = MagicMock()
+    scheduler.add(1, 10, None, "Officer A", now - timedelta(minutes=4))
+    scheduler.add(2, 11, None, "Officer B", now - timedelta(minutes=3))
+    scheduler.add(3, None, 20, "Intern C", now - timedelta(minutes=2))
+    scheduler.add(4, None, 21, "Intern D", now - timedelta(minutes=1))
+
+    pairs = await scheduler.run_matching()
+
+    assert [(f["queue_id"], i["queue_id"]) for f, i in pairs] == [(1, 3)]
+    lock, update = conn.execute.await_args_list
+    assert "pg_advisory_xact_lock" in lock.args[0]
+    assert update.args[1] == [1, 3]
+    assert conn.fetch.await_args.args[1] == [1, 3, 2, 4]
+    # Закрытая пара и ушедший стажер убраны, FTO B ждет повторного подбора
+    assert list(scheduler.entries) == [2]
+    scheduler.request_match.assert_called_once()
+    assert sorted(users) == [10, 20]
+    for user in users.values():
+        user.send.assert_awaited_once()
+    await scheduler.stop()
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_enter_queue_with_batch_matching_only_enqueues():
+    from models.fto_request import EnterQueue, queue_roles
+
+    bot, conn = make_bot()
+    conn.fetchrow = AsyncMock(return_value={"status": "queued", "queue_id": 7})
+    bot.fto_queue = MagicMock()
+    bot.fto_queue.register_board = AsyncMock()
+    bot.fto_queue.batch_matching = True
+
+    interaction = MagicMock()
+    interaction.client = bot
+    interaction.guild.id = 999
+    interaction.user.id = 20
+    interaction.user.display_name = "Intern B"
+    interaction.response = AsyncMock()
+
+    queue_roles._ids[999] = (1, 2)
+    interaction.user.get_role = MagicMock(side_effect=lambda rid: MagicMock() if rid == 2 else None)
+    try:
+        await EnterQueue(MagicMock()).callback(interaction)
+    finally:
+        queue_roles._ids.pop(999)
+
+    # p_match=false: подбор пар откладывается до пакетного прохода
+    args = conn.fetchrow.await_args.args
+    assert args[1:4] == (20, False, "Intern B")
+    assert args[5] is False
+    bot.fto_queue.add.assert_called_once()
+    assert bot.fto_queue.add.call_args.args[:4] == (7, None, 20, "Intern B")
+    bot.fto_queue.discard.assert_not_called()
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from gspread.exceptions import APIError
+
+from events import gsheet_writer
+from events.gsheet_writer import GSheetWriter
+
+
+def make_bot(member_ids):
+    members = {}
+    for member_id in member_ids:
+        member = MagicMock()
+        member.id = member_id
+        members[member_id] = member
+
+    guild = MagicMock()
+    guild.get_member = MagicMock(side_effect=members.get)
+    bot = MagicMock()
+    bot.get_guild = MagicMock(return_value=guild)
+    return bot
+
+
+def make_api_error(code):
+    response = MagicMock()
+    response.json.return_value = {"error": {"code": code, "message": "Quota exceeded", "status": ""}}
+    return APIError(response)
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_writer_debounces_and_batches_members():
+    bot = make_bot([1, 2])
+    sync = AsyncMock(return_value=2)
+
+    with patch.object(gsheet_writer, "sync_member_changes", sync):
+        writer = GSheetWriter(bot, debounce_seconds=0.05)
+        writer.schedule(1)
+        writer.schedule(2)
+        writer.schedule(1)
+        await asyncio.sleep(0.15)
+        await writer.stop()
+
+    sync.assert_awaited_once()
+    assert sorted(m.id for m in sync.await_args.args[1]) == [1, 2]
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_writer_backs_off_on_rate_limit():
+    bot = make_bot([1])
+    sync = AsyncMock(side_effect=make_api_error(429))
+
+    with patch.object(gsheet_writer, "sync_member_changes", sync):
+        writer = GSheetWriter(bot, debounce_seconds=0.01)
+        writer.schedule(1)
+        await asyncio.sleep(0.1)
+        await writer.stop()
+
+    # После 429 участник возвращается в очередь с задержкой, а не повторяется сразу
+    sync.assert_awaited_once()
+    assert 1 in writer._deadlines
+    assert writer._failures == 1
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_writer_schedule_during_backoff_does_not_retry_early():
+    bot = make_bot([1, 2])
+    sync = AsyncMock(side_effect=make_api_error(429))
+
+    with patch.object(gsheet_writer, "sync_member_changes", sync), \
+            patch.object(gsheet_writer, "BACKOFF_BASE_SECONDS", 0.3):
+        writer = GSheetWriter(bot, debounce_seconds=0.01)
+        writer.schedule(1)
+        await asyncio.sleep(0.05)
+        sync.assert_awaited_once()
+
+        # Новое изменение того же участника и участник вне неудачного пакета
+        writer.schedule(1)
+        writer.schedule(2)
+        await asyncio.sleep(0.1)
+        sync.assert_awaited_once()
+
+        await asyncio.sleep(0.3)
+        await writer.stop()
+
+    assert sync.await_count == 2
+    assert sorted(m.id for m in sync.await_args.args[1]) == [1, 2]
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_writer_max_wait_caps_sliding_debounce():
+    bot = make_bot([1])
+    sync = AsyncMock(return_value=1)
+
+    with patch.object(gsheet_writer, "sync_member_changes", sync):
+        writer = GSheetWriter(bot, debounce_seconds=0.1, max_wait_seconds=0.15)
+        # Роли меняются чаще окна debounce
+        for _ in range(6):
+            writer.schedule(1)
+            await asyncio.sleep(0.04)
+        await writer.stop()
+
+    sync.assert_awaited_once()
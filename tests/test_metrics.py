@@ -0,0 +1,50 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from bot.metrics import LatencyHistogram, MeteredPool, PoolMetrics
+
+
+def test_histogram_buckets():
+    histogram = LatencyHistogram()
+    histogram.observe(0.0005)
+    histogram.observe(0.3)
+    histogram.observe(10, error=True)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 3
+    assert snapshot['errors'] == 1
+    assert snapshot['buckets']['le_1ms'] == 1
+    assert snapshot['buckets']['le_500ms'] == 1
+    assert snapshot['buckets']['inf'] == 1
+
+
+def test_query_logger_groups_by_statement():
+    metrics = PoolMetrics()
+    metrics.query_logged(SimpleNamespace(query="SELECT 1\n   FROM t", elapsed=0.002, exception=None))
+    metrics.query_logged(SimpleNamespace(query="SELECT 1 FROM t", elapsed=0.004, exception=None))
+
+    statements = metrics.snapshot()['statements']
+    assert len(statements) == 1
+    assert statements[0]['query'] == "SELECT 1 FROM t"
+    assert statements[0]['count'] == 2
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_metered_pool_tracks_in_use():
+    conn = object()
+    raw_pool = MagicMock()
+    raw_pool.acquire = AsyncMock(return_value=conn)
+    raw_pool.release = AsyncMock()
+
+    metrics = PoolMetrics()
+    pool = MeteredPool(raw_pool, metrics)
+
+    async with pool.acquire() as acquired:
+        assert acquired is conn
+        assert metrics.in_use == 1
+
+    assert metrics.in_use == 0
+    assert metrics.peak_in_use == 1
+    assert metrics.acquire_wait.count == 1
+    raw_pool.release.assert_awaited_once_with(conn)
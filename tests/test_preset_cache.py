@@ -0,0 +1,78 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from bot import preset_cache
+from bot.preset_cache import PresetTree, get_preset_tree, invalidate_preset_tree
+
+
+CATEGORIES = [
+    {"category_id": 1, "name": "Patrol", "emoji": None, "parent_id": None, "department_role_id": 100},
+    {"category_id": 2, "name": "Ranks", "emoji": None, "parent_id": 1, "department_role_id": None},
+]
+PRESETS = [
+    {"preset_id": 10, "name": "Officer", "role_ids": [1], "description": None, "emoji": None,
+     "category_id": 2, "rank_group_role_id": None, "sort_order": 0},
+    {"preset_id": 11, "name": "Cadet", "role_ids": [2], "description": None, "emoji": None,
+     "category_id": None, "rank_group_role_id": None, "sort_order": None},
+]
+
+
+def make_pool():
+    conn = AsyncMock()
+    conn.fetch = AsyncMock(side_effect=lambda query, *args: CATEGORIES if "preset_categories" in query else PRESETS)
+
+    acquire_mock = MagicMock()
+    acquire_mock.__aenter__ = AsyncMock(return_value=conn)
+    acquire_mock.__aexit__ = AsyncMock(return_value=None)
+
+    pool = MagicMock()
+    pool.acquire = MagicMock(return_value=acquire_mock)
+    return pool, conn
+
+
+def test_preset_tree_navigation():
+    tree = PresetTree(0, CATEGORIES, PRESETS)
+
+    assert [c["name"] for c in tree.child_categories()] == ["Patrol"]
+    assert [c["name"] for c in tree.child_categories(1)] == ["Ranks"]
+    assert [p["name"] for p in tree.category_presets()] == ["Cadet"]
+    assert [p["name"] for p in tree.category_presets(2)] == ["Officer"]
+    assert tree.parent_id(2) == 1
+    assert tree.parent_id(1) is None
+    assert tree.parent_id(999) is None
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_get_preset_tree_reloads_only_after_invalidation():
+    preset_cache._tree = None
+    pool, conn = make_pool()
+
+    first = await get_preset_tree(pool)
+    second = await get_preset_tree(pool)
+    assert first is second
+    assert conn.fetch.await_count == 2
+
+    invalidate_preset_tree()
+    third = await get_preset_tree(pool)
+    assert third is not first
+    assert conn.fetch.await_count == 4
+
+
+def test_effective_role_ids_order_and_dedup():
+    categories = CATEGORIES + [
+        {"category_id": 3, "name": "Detectives", "emoji": None, "parent_id": None, "department_role_id": 300},
+    ]
+    presets = PRESETS + [
+        {"preset_id": 12, "name": "Detective", "role_ids": [5, 300], "description": None, "emoji": None,
+         "category_id": 3, "rank_group_role_id": 50, "sort_order": None},
+    ]
+    tree = PresetTree(0, categories, presets)
+    base = preset_cache.BASE_LSPD_ROLE_ID
+
+    # Подкатегория берет роль отдела у родителя
+    assert tree.effective_role_ids(10) == [1, 100, base]
+    # Пресет без категории получает только базовую роль
+    assert tree.effective_role_ids(11) == [2, base]
+    # Дубликаты удаляются с сохранением порядка
+    assert tree.effective_role_ids(12) == [5, 300, 50, base]
+    assert tree.effective_role_ids(999) == []
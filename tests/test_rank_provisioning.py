@@ -0,0 +1,72 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from models.rank_provisioning import LSPD_RANKS, delete_rank_presets, provision_rank_presets, resolve_rank_roles
+
+
+def make_guild(role_names):
+    roles = []
+    for i, name in enumerate(role_names, start=1):
+        role = MagicMock()
+        role.id = i
+        role.name = name
+        roles.append(role)
+    guild = MagicMock()
+    guild.roles = roles
+    return guild
+
+
+def test_resolve_rank_roles_single_pass():
+    guild = make_guild(["@everyone", "Chief of Police", "Staff Officers", "Recruit Officer"])
+
+    rows, missing = resolve_rank_roles(guild)
+
+    assert rows == [
+        ("Chief of Police", 2, 3, 0),
+        ("Recruit Officer", 4, None, len(LSPD_RANKS) - 1),
+    ]
+    assert len(missing) == len(LSPD_RANKS) - 2
+    assert "Assistant Chief of Police" in missing
+
+
+def test_resolve_rank_roles_respects_start_index():
+    guild = make_guild(["Chief of Police", "Recruit Officer"])
+
+    rows, missing = resolve_rank_roles(guild, start_index=len(LSPD_RANKS) - 1)
+
+    assert rows == [("Recruit Officer", 2, None, len(LSPD_RANKS) - 1)]
+    assert missing == []
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_provision_rank_presets_single_insert():
+    guild = make_guild(["Chief of Police", "Recruit Officer"])
+
+    transaction = MagicMock()
+    transaction.__aenter__ = AsyncMock(return_value=None)
+    transaction.__aexit__ = AsyncMock(return_value=None)
+    conn = AsyncMock()
+    conn.transaction = MagicMock(return_value=transaction)
+    conn.fetch = AsyncMock(return_value=[{"name": "Recruit Officer"}])
+
+    result = await provision_rank_presets(conn, guild, category_id=7, created_by=42)
+
+    conn.fetch.assert_awaited_once()
+    args = conn.fetch.await_args.args
+    assert args[1:] == (42, 7, ["Chief of Police", "Recruit Officer"], [1, 2], [None, None], [0, len(LSPD_RANKS) - 1])
+    assert result["created"] == ["Recruit Officer"]
+    assert result["existing"] == ["Chief of Police"]
+    assert len(result["missing_roles"]) == len(LSPD_RANKS) - 2
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_delete_rank_presets_single_statement():
+    conn = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[])
+
+    await delete_rank_presets(conn, performed_by=42, category_id=7)
+
+    conn.fetch.assert_awaited_once()
+    args = conn.fetch.await_args.args
+    assert "INSERT INTO preset_audit" in args[0]
+    assert args[1:4] == (LSPD_RANKS, 7, 42)
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import discord
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from cogs.reminders import FAILED_RETRY_SECONDS, RETRY_SECONDS, RemindersCog
+
+
+def make_bot(due_rows):
+    conn = AsyncMock()
+
+    async def fetch(query, *args):
+        if not query.strip().startswith("SELECT"):
+            return []
+        # Третий аргумент - ID запросов, отложенных после неудачной отправки
+        return [row for row in due_rows if row["message_id"] not in args[2]]
+
+    conn.fetch = AsyncMock(side_effect=fetch)
+
+    transaction = MagicMock()
+    transaction.__aenter__ = AsyncMock(return_value=None)
+    transaction.__aexit__ = AsyncMock(return_value=None)
+    conn.transaction = MagicMock(return_value=transaction)
+
+    acquire_mock = MagicMock()
+    acquire_mock.__aenter__ = AsyncMock(return_value=conn)
+    acquire_mock.__aexit__ = AsyncMock(return_value=None)
+
+    bot = MagicMock()
+    bot.db_pool.acquire = MagicMock(return_value=acquire_mock)
+    return bot, conn
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_due_reminders_sent_without_fetch_and_updated_in_bulk():
+    bot, conn = make_bot([
+        {"message_id": 1, "reminder_number": 1},
+        {"message_id": 2, "reminder_number": 2},
+        {"message_id": 3, "reminder_number": 1},
+    ])
+    messages = {message_id: MagicMock() for message_id in (1, 2, 3)}
+    for message in messages.values():
+        message.reply = AsyncMock()
+    messages[3].reply.side_effect = discord.HTTPException(MagicMock(status=400, reason="Bad Request"), "Unknown message")
+
+    channel = MagicMock()
+    channel.get_partial_message = MagicMock(side_effect=messages.get)
+    channel.fetch_message = AsyncMock(side_effect=discord.NotFound(MagicMock(status=404, reason="Not Found"), "Unknown Message"))
+    bot.get_channel = MagicMock(return_value=channel)
+
+    with patch("cogs.reminders.ADM_ROLES_CH", 42):
+        reminded = await RemindersCog(bot).send_due_reminders(datetime.utcnow())
+
+    assert reminded == [1, 2]
+    assert "6 часов" in messages[2].reply.await_args.args[0]
+    # fetch_message только для проверки сообщения, ответ на которое не удался
+    channel.fetch_message.assert_awaited_once_with(3)
+
+    bulk_update = [c for c in conn.fetch.await_args_list if c.args[0].strip().startswith("UPDATE")]
+    assert len(bulk_update) == 1
+    assert bulk_update[0].args[2] == [1, 2]
+    assert bulk_update[0].args[3] == [1, 2]
+    conn.execute.assert_awaited_once()
+    assert conn.execute.await_args.args[1] == [3]
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_failed_reminder_backed_off_and_loop_never_spins():
+    bot, conn = make_bot([{"message_id": 1, "reminder_number": 1}])
+    message = MagicMock()
+    message.reply = AsyncMock(side_effect=discord.Forbidden(MagicMock(status=403, reason="Forbidden"), "Missing Access"))
+    channel = MagicMock()
+    channel.get_partial_message = MagicMock(return_value=message)
+    bot.get_channel = MagicMock(return_value=channel)
+    # Срок напоминания уже прошел, но запрос так и не был напомнен
+    conn.fetchval = AsyncMock(return_value=datetime.utcnow() - timedelta(hours=1))
+
+    cog = RemindersCog(bot)
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        if len(delays) == 2:
+            raise asyncio.CancelledError
+
+    with patch("cogs.reminders.ADM_ROLES_CH", 42), patch("cogs.reminders.asyncio.sleep", fake_sleep):
+        with pytest.raises(asyncio.CancelledError):
+            await cog.reminder_loop()
+
+    assert all(delay >= RETRY_SECONDS for delay in delays)
+    # Неудачный ответ не повторяется на следующем проходе
+    message.reply.assert_awaited_once()
+    assert 1 in cog._failed
+    due_calls = [c for c in conn.fetch.await_args_list if c.args[0].strip().startswith("SELECT")]
+    assert due_calls[-1].args[3] == [1]
+    assert cog._failed[1] - datetime.utcnow() <= timedelta(seconds=FAILED_RETRY_SECONDS)
@@ -0,0 +1,84 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from aiohttp import ClientPayloadError
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.api import APIServer
+from bot.role_feed import RoleFeed
+
+
+def publish(feed, user_id):
+    return feed.publish(1, user_id, added=[{'id': '5', 'name': 'Officer'}], removed=[], roles=['5'])
+
+
+def test_resume_from_cursor_and_gap_after_overflow():
+    feed = RoleFeed(maxlen=3)
+    for user_id in range(5):
+        publish(feed, user_id)
+
+    seq, reset = feed.parse_cursor(feed.event_id(3))
+    events, gap = feed.read_after(seq)
+    assert not reset and not gap
+    assert [e['seq'] for e in events] == [4, 5]
+
+    # События 2 уже нет в буфере - клиент должен пересинхронизироваться
+    events, gap = feed.read_after(1)
+    assert gap
+    assert [e['seq'] for e in events] == [3, 4, 5]
+
+    # Курсор от предыдущего запуска
+    assert feed.parse_cursor("deadbeef:2") == (5, True)
+    # Один reset и продолжение с текущего события, без повторного reset из-за разрыва
+    assert feed.read_after(5) == ([], False)
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_stream_delivers_published_events():
+    server = APIServer(MagicMock())
+    server.role_feed = feed = RoleFeed()
+    publish(feed, 10)
+
+    async with TestClient(TestServer(server.app)) as client:
+        response = await client.get("/api/roles/stream", headers={"Last-Event-ID": feed.event_id(0)})
+        assert response.headers["Content-Type"] == "text/event-stream"
+
+        async def next_event():
+            lines = []
+            while True:
+                line = (await response.content.readline()).decode().strip()
+                if not line:
+                    if any(l.startswith("event:") for l in lines):
+                        return lines
+                    lines = []
+                    continue
+                lines.append(line)
+
+        first = await asyncio.wait_for(next_event(), 2)
+        assert first[0] == f"id: {feed.event_id(1)}"
+        assert '"user_id": "10"' in first[2]
+
+        publish(feed, 20)
+        second = await asyncio.wait_for(next_event(), 2)
+        assert second[0] == f"id: {feed.event_id(2)}"
+        response.close()
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_stop_closes_open_streams():
+    server = APIServer(MagicMock())
+    server.role_feed = RoleFeed()
+
+    async with TestClient(TestServer(server.app)) as client:
+        response = await client.get("/api/roles/stream")
+        await asyncio.wait_for(response.content.readline(), 2)
+        assert len(server._streams) == 1
+
+        await server.stop()
+        # Поток обрывается сразу, а не держит остановку сервера до таймаута
+        try:
+            await asyncio.wait_for(response.content.read(), 2)
+        except ClientPayloadError:
+            pass
+        assert not server._streams
@@ -0,0 +1,88 @@
+from unittest.mock import MagicMock, patch
+
+from bot.role_index import RoleIndex
+
+
+def make_role(role_id, name, guild, default=False):
+    role = MagicMock()
+    role.id = role_id
+    role.name = name
+    role.guild = guild
+    role.is_default.return_value = default
+    return role
+
+
+def make_member(member_id, guild, roles):
+    member = MagicMock()
+    member.id = member_id
+    member.guild = guild
+    member.roles = roles
+    return member
+
+
+def make_guild():
+    guild = MagicMock()
+    guild.id = 1
+    everyone = make_role(1, "@everyone", guild, default=True)
+    fto = make_role(2, "FTO", guild)
+    intern = make_role(3, "Intern", guild)
+    guild.roles = [everyone, fto, intern]
+    guild.get_role = MagicMock(side_effect=lambda rid: next((r for r in guild.roles if r.id == rid), None))
+    guild.members = [
+        make_member(10, guild, [everyone, fto]),
+        make_member(11, guild, [everyone, intern]),
+    ]
+    return guild, everyone, fto, intern
+
+
+def test_index_follows_member_and_role_events():
+    guild, everyone, fto, intern = make_guild()
+    index = RoleIndex()
+    index.rebuild(guild)
+
+    assert index.member_ids(1, fto.id) == {10}
+    assert index.member_ids(1, everyone.id) == set()
+    assert index.role_by_name(guild, "Intern") is intern
+
+    # Стажер получил роль FTO и потерял роль стажера
+    before = guild.members[1]
+    after = make_member(11, guild, [everyone, fto])
+    index.member_updated(before, after)
+    assert index.member_ids(1, fto.id) == {10, 11}
+    assert index.member_ids(1, intern.id) == set()
+    assert index.has_role(after, fto.id)
+
+    index.member_removed(guild.members[0])
+    assert index.member_ids(1, fto.id) == {11}
+
+    guild.roles.remove(intern)
+    index.role_deleted(intern)
+    assert index.role_by_name(guild, "Intern") is None
+
+
+def test_has_role_falls_back_to_member_before_rebuild():
+    guild, _, fto, _ = make_guild()
+    member = guild.members[0]
+    member.get_role = MagicMock(return_value=fto)
+
+    assert RoleIndex().has_role(member, fto.id)
+    member.get_role.assert_called_once_with(fto.id)
+
+
+def test_queue_roles_resolved_once_until_refresh():
+    from models.fto_request import QueueRoles
+
+    guild, _, fto, intern = make_guild()
+    guild.roles[1].name = "Field Training Officer"
+    roles = QueueRoles()
+
+    with patch("models.fto_request.FTO_ROLE_NAME", "Field Training Officer"), \
+            patch("models.fto_request.INTERN_ROLE_NAME", "Intern"):
+        assert roles.get(guild) == (fto.id, intern.id)
+
+        # Без события изменения ролей список ролей больше не просматривается
+        guild.roles = []
+        assert roles.get(guild) == (fto.id, intern.id)
+
+        roles.refresh(guild)
+        assert roles.get(guild) == (None, None)
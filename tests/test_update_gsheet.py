@@ -0,0 +1,139 @@
+import pytest
+from gspread.utils import a1_to_rowcol
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from events import update_gsheet
+from events.update_gsheet import _render_roles, _value_hash, sync_members
+
+
+def make_member(name, roles):
+    member = MagicMock()
+    member.__str__.return_value = name
+    member.roles = [MagicMock() for _ in roles]
+    for role, role_name in zip(member.roles, roles):
+        role.name = role_name
+    return member
+
+
+def make_bot(known_hashes):
+    conn = AsyncMock()
+    conn.fetch = AsyncMock(return_value=[{"username": u, "value_hash": h} for u, h in known_hashes.items()])
+
+    acquire_mock = MagicMock()
+    acquire_mock.__aenter__ = AsyncMock(return_value=conn)
+    acquire_mock.__aexit__ = AsyncMock(return_value=None)
+
+    bot = MagicMock()
+    bot.db_pool.acquire = MagicMock(return_value=acquire_mock)
+    return bot, conn
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_sync_members_writes_only_changed_rows():
+    unchanged = make_member("alice", ["@everyone", "LSPD"])
+    changed = make_member("bob", ["@everyone", "LSPD", "FTO"])
+    bot, conn = make_bot({"alice": _value_hash(*_render_roles(["LSPD"])), "bob": "stale"})
+
+    with patch.object(update_gsheet, "_sync_write_rows", return_value=["bob"]) as write_rows:
+        count = await sync_members(bot, [unchanged, changed])
+
+    assert count == 1
+    write_rows.assert_called_once_with({"bob": ("+", "Роли:\nLSPD\nFTO")})
+    # Хеш сохраняется только для записанной строки
+    args = conn.execute.await_args.args
+    assert args[1] == ["bob"]
+    assert args[2] == [_value_hash("+", "Роли:\nLSPD\nFTO")]
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_sync_members_skips_sheet_when_nothing_changed():
+    member = make_member("alice", ["@everyone"])
+    bot, conn = make_bot({"alice": _value_hash(*_render_roles([]))})
+
+    with patch.object(update_gsheet, "_sync_write_rows") as write_rows:
+        count = await sync_members(bot, [member])
+
+    assert count == 0
+    write_rows.assert_not_called()
+    conn.execute.assert_not_awaited()
+
+
+@pytest.mark.asyncio(loop_scope="function")
+async def test_sync_members_force_rewrites_unchanged_rows():
+    member = make_member("alice", ["@everyone", "LSPD"])
+    bot, conn = make_bot({"alice": _value_hash(*_render_roles(["LSPD"]))})
+
+    with patch.object(update_gsheet, "_sync_write_rows", return_value=["alice"]) as write_rows:
+        count = await sync_members(bot, [member], force=True)
+
+    assert count == 1
+    write_rows.assert_called_once_with({"alice": ("+", "Роли:\nLSPD")})
+    conn.fetch.assert_not_awaited()
+
+
+def make_sheet(usernames):
+    sheet = MagicMock()
+    sheet.col_values = MagicMock(side_effect=lambda col: list(usernames))
+    sheet.batch_get = MagicMock(
+        side_effect=lambda ranges: [[[usernames[a1_to_rowcol(r)[0] - 1]]] for r in ranges]
+    )
+    return sheet
+
+
+def test_roster_index_reads_column_once_and_verifies_targets():
+    sheet = make_sheet(["header", "alice", "bob"])
+    index = update_gsheet.RosterIndex(ttl_seconds=3600)
+
+    assert index.resolve(sheet, ["bob"]) == {"bob": [2]}
+    assert index.resolve(sheet, ["alice"]) == {"alice": [1]}
+    assert sheet.col_values.call_count == 1
+    # Второй вызов проверил только ячейку целевой строки
+    sheet.batch_get.assert_called_once()
+
+
+def test_roster_index_reloads_when_rows_shift():
+    usernames = ["header", "alice", "bob"]
+    sheet = make_sheet(usernames)
+    index = update_gsheet.RosterIndex(ttl_seconds=3600)
+    index.resolve(sheet, ["bob"])
+
+    usernames.insert(1, "carol")
+
+    assert index.resolve(sheet, ["bob"]) == {"bob": [3]}
+    assert sheet.col_values.call_count == 2
+
+
+def test_duplicate_usernames_write_every_row():
+    sheet = make_sheet(["header", "alice", "bob", "alice"])
+    sheet.id = 0
+    with patch.object(update_gsheet, "_roster_index", update_gsheet.RosterIndex(ttl_seconds=3600)), \
+            patch.object(update_gsheet, "_session") as session:
+        session.worksheet.return_value = sheet
+        written = update_gsheet._sync_write_rows({"alice": ("+", "Роли:\nLSPD")})
+
+    assert written == ["alice"]
+    requests = sheet.spreadsheet.batch_update.call_args.args[0]["requests"]
+    assert [r["updateCells"]["range"]["startRowIndex"] for r in requests] == [1, 3]
+
+
+def test_sheet_session_authorizes_once_and_opens_by_key():
+    client = MagicMock()
+    client.open.return_value.id = "sheet-key"
+    creds = MagicMock(access_token_expired=False)
+
+    with patch.object(update_gsheet, "_get_gsheet_client", return_value=(client, creds)) as get_client, \
+            patch.object(update_gsheet, "GOOGLE_SHEET_KEY", ""):
+        session = update_gsheet.SheetSession()
+        first = session.worksheet()
+        second = session.worksheet()
+
+        assert first is second
+        get_client.assert_called_once()
+        client.open.assert_called_once()
+        client.open_by_key.assert_called_once_with("sheet-key")
+
+        # Истекший токен - повторная авторизация, но без поиска по имени
+        creds.access_token_expired = True
+        session.worksheet()
+        assert get_client.call_count == 2
+        client.open.assert_called_once()